@@ -0,0 +1,56 @@
+"""Scaling of distributed.py's data-parallel training with the number of processes.
+
+Trains on a synthetic feature stream with 1, 2, 4 and 8 local processes and reports the
+mean epoch time (the first epoch, which warms up, excluded), the speed-up over one process
+and the training windows processed per second. Validation and checkpointing are off, so
+only the sharded training is timed. Each process gets cores / processes torch threads.
+Run from the repository root:
+
+    python -m benchmarks.bench_ddp
+    python -m benchmarks.bench_ddp --nprocs 1 2 4 8 --regions 52 --days 600 --shard regions
+"""
+
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import torch.multiprocessing as mp
+
+from benchmarks.synthetic import dataset as synthetic_dataset
+from distributed import build_parser, launch, prepare_run
+from incremental import FeatureStream
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nprocs', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--regions', type=int, default=52)
+    parser.add_argument('--days', type=int, default=600)
+    parser.add_argument('--epochs', type=int, default=4)
+    parser.add_argument('--shard', choices=['windows', 'regions'], default='windows')
+    parser.add_argument('--seq-len', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f'{os.cpu_count()} cores, {args.regions} regions, {args.days} days, shard by {args.shard}')
+    with tempfile.TemporaryDirectory() as tmp:
+        stream_path = os.path.join(tmp, 'stream')
+        FeatureStream.create(stream_path, synthetic_dataset(args.regions, args.days))
+        run_args = build_parser().parse_args([
+            '--stream', stream_path, '--cache-dir', os.path.join(tmp, 'cache'), '--shard', args.shard,
+            '--epochs', str(args.epochs), '--seq-len', str(args.seq_len), '--no-validation'])
+        prepare_run(run_args)
+        n_windows = np.load(os.path.join(tmp, 'cache', 'train_x.npy'), mmap_mode='r').shape[1]
+
+        base = None
+        for nprocs in args.nprocs:
+            results = mp.get_context('spawn').SimpleQueue()
+            launch(run_args, nprocs, results)
+            seconds = float(np.mean(results.get()[1:]))
+            base = base or seconds
+            print(f'{nprocs} processes: {seconds * 1e3:.0f}ms per epoch, speed-up {base / seconds:.2f}x, '
+                  f'{n_windows * args.regions / seconds:.0f} region-windows/s')
+
+
+if __name__ == '__main__':
+    main()
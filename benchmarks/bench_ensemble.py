@@ -0,0 +1,81 @@
+"""Training K ensemble members in one vectorised pass against K separate runs.
+
+Both train the same K seeded models full-batch on the same windows (node readout, all
+regions) for --epochs epochs; the ensemble's members match the separate models up to
+float rounding. The ensemble saves the per-op overhead of the separate runs, so compare
+a few sizes. Run from the repository root:
+
+    python -m benchmarks.bench_ensemble
+    python -m benchmarks.bench_ensemble --members 16 --nodes 52 --windows 20 --epochs 20
+"""
+
+import argparse
+import time
+
+import torch
+import torch.nn as nn
+
+from benchmarks.bench_tbptt import make_data
+from benchmarks.synthetic import node_table
+from ensemble import GNNEnsemble, ensemble_loss, summarise
+from graph_builder import build_graph
+from models import GNN, initialise_weights
+from training import forecast_loss
+from windows import WindowDataset
+
+
+def train(model, loss_fn, whole, N, dInf_mean, dInf_std, regions, epochs):
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    criterion = nn.MSELoss()
+    start = time.perf_counter()
+    for epoch in range(epochs):
+        optimizer.zero_grad()
+        loss, active_pred, _, _ = loss_fn(model, whole['x'], whole['cI'], N, whole['I'], whole['yI'],
+                                          dInf_mean, dInf_std, regions, criterion)
+        loss.backward()
+        optimizer.step()
+    return time.perf_counter() - start, active_pred.detach()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, nargs='+', default=[4, 16])
+    parser.add_argument('--nodes', type=int, default=52)
+    parser.add_argument('--windows', type=int, default=150)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--heads', type=int, default=1)
+    parser.add_argument('--history-window', type=int, default=5)
+    parser.add_argument('--pred-window', type=int, default=10)
+    args = parser.parse_args()
+
+    g = build_graph(node_table(args.nodes))
+    data, sum_I = make_data(args.nodes, args.windows, args.history_window, args.pred_window)
+    whole = WindowDataset(data, sum_I, args.history_window, args.pred_window, 1)[0]
+    regions = torch.arange(args.nodes)
+    N = torch.full((args.nodes,), 1e6)
+    dInf_mean, dInf_std = torch.zeros(args.nodes, 1, 1), torch.ones(args.nodes, 1, 1)
+    device = torch.device('cpu')
+    dims = (args.history_window, 32, 32, 32, args.heads, args.pred_window, device)
+    print(f'{args.nodes} nodes, {args.windows} windows, {args.epochs} epochs')
+
+    for num_members in args.members:
+        separate, preds = 0.0, []
+        for k in range(num_members):
+            torch.manual_seed(42 + k)
+            model = GNN(g, *dims, readout='node')
+            model.apply(initialise_weights)
+            seconds, pred = train(model, forecast_loss, whole, N, dInf_mean, dInf_std, regions, args.epochs)
+            separate += seconds
+            preds.append(pred)
+
+        ensemble = GNNEnsemble(g, *dims, num_members=num_members, seed=42)
+        together, pred = train(ensemble, ensemble_loss, whole, N, dInf_mean, dInf_std, regions, args.epochs)
+        # the random initial GRU state differs between the two, compare the spread instead
+        spread = summarise(pred)['quantiles'][[0, -1]].diff(dim=0).mean().item()
+        separate_spread = summarise(torch.stack(preds))['quantiles'][[0, -1]].diff(dim=0).mean().item()
+        print(f'K={num_members}: separate {separate:.2f}s, ensemble {together:.2f}s '
+              f'({separate / together:.1f}x faster), mean 5-95% band {spread:.3f} vs {separate_spread:.3f}')
+
+
+if __name__ == '__main__':
+    main()
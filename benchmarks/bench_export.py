@@ -0,0 +1,139 @@
+"""Cold start and memory of serving an exported model against the current import path.
+
+Each way of serving runs in a fresh interpreter, --repeats times, from process start to
+its first forecast of all regions:
+
+    current      import serve.py's stack (torch, DGL, pandas, the model code), read the node
+                 table, build the graph, load the checkpoint, forecast
+    torchscript  import runtime.py with torch, load the export.py .pt, forecast
+    onnx         import runtime.py with onnxruntime (no torch), load the .onnx, forecast
+
+and reports the median wall time to the first forecast (interpreter start included), its
+import / load / first-call split, the steady-state latency (median of 20 more forecasts),
+the peak RSS of the process (Linux VmHWM) and whether DGL / pandas were imported. The model
+is randomly initialised on a synthetic node table. Run from the repository root:
+
+    python -m benchmarks.bench_export
+    python -m benchmarks.bench_export --nodes 52 --windows 1 --repeats 5
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import torch
+
+from benchmarks.synthetic import node_table
+from export import export
+from graph_builder import build_graph
+from models import GNN, initialise_weights
+from training import save_checkpoint
+
+CHILD = r'''
+import json, statistics, sys, time
+start = time.perf_counter()
+import numpy as np
+{imports}
+imported = time.perf_counter()
+{load}
+loaded = time.perf_counter()
+rng = np.random.default_rng(0)
+dynamic = rng.standard_normal(({nodes}, {windows}, {in_dim})).astype(np.float32)
+cI, I = (rng.random(({nodes}, {windows})).astype(np.float32) * 1e3 for _ in range(2))
+N = np.full(({nodes}, 1), 1e6, dtype=np.float32)
+h = np.zeros(({nodes}, {gru_dim}), dtype=np.float32)
+{call}
+first = time.perf_counter()
+steady = []
+for _ in range(20):
+    call_start = time.perf_counter()
+    {call}
+    steady.append(time.perf_counter() - call_start)
+# VmHWM starts over at exec, unlike ru_maxrss which a forked child inherits from its parent
+with open('/proc/self/status') as f:
+    peak = next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))
+print(json.dumps({{'import': imported - start, 'load': loaded - imported, 'first': first - loaded,
+                  'steady': statistics.median(steady), 'peak_rss_mb': peak / 1024,
+                  'dgl': 'dgl' in sys.modules, 'pandas': 'pandas' in sys.modules}}))
+'''
+
+CURRENT = dict(
+    imports='import pandas as pd\nimport torch\nfrom graph_builder import build_graph\n'
+            'from serve import model_from_checkpoint\nfrom training import forecast',
+    load="g = build_graph(pd.read_csv({nodes_csv!r}), threshold={threshold})\n"
+         "model = model_from_checkpoint({checkpoint!r}, g, torch.device('cpu'))",
+    call="with torch.no_grad(): forecast(model, *(torch.from_numpy(x) for x in (dynamic, cI, N, I)), "
+         "torch.arange({nodes}), h=torch.from_numpy(h))",
+)
+RUNTIME = dict(
+    imports='from runtime import ExportedForecaster',
+    load='forecaster = ExportedForecaster({meta!r})',
+    call='forecaster(dynamic, cI, N, I, h)',
+)
+
+
+def run_child(code, repeats):
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        result['total'] = time.perf_counter() - start
+        runs.append(result)
+    return {key: statistics.median(run[key] for run in runs) if isinstance(runs[0][key], float) else runs[0][key]
+            for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=52)
+    parser.add_argument('--windows', type=int, default=1)
+    parser.add_argument('--history-window', type=int, default=5)
+    parser.add_argument('--pred-window', type=int, default=10)
+    parser.add_argument('--threshold', type=float, default=17)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    table = node_table(args.nodes)
+    g = build_graph(table, threshold=args.threshold)
+    torch.manual_seed(42)
+    model = GNN(g, args.history_window, 32, 32, 32, 1, args.pred_window, torch.device('cpu'), readout='node')
+    model.apply(initialise_weights)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {'nodes_csv': os.path.join(tmp, 'nodes.csv'), 'checkpoint': os.path.join(tmp, 'model.pth')}
+        table.to_csv(paths['nodes_csv'], index=False)
+        save_checkpoint(paths['checkpoint'], model, torch.optim.Adam(model.parameters()))
+        sizes = dict(nodes=args.nodes, windows=args.windows, in_dim=args.history_window, gru_dim=32,
+                     threshold=args.threshold)
+
+        ways = {'current': {key: part.format(**paths, **sizes) for key, part in CURRENT.items()}}
+        formats = ['torchscript'] + (['onnx'] if importlib.util.find_spec('onnxruntime') else [])
+        for format in formats:
+            output = os.path.join(tmp, f'forecaster_{format}')
+            model_path = export(model, output, format)
+            ways[format] = {key: part.format(meta=output + '.json', **sizes) for key, part in RUNTIME.items()}
+            ways[format]['size'] = os.path.getsize(model_path)
+
+        print(f'{args.nodes} nodes, {g.num_edges()} edges, {args.windows} windows, median of {args.repeats} '
+              f'cold starts')
+        for name, way in ways.items():
+            result = run_child(CHILD.format(**way, **sizes), args.repeats)
+            size = f", {way['size'] / 1024:.0f}KB model" if 'size' in way else ''
+            print(f"{name:<12} first forecast {result['total'] * 1e3:6.0f}ms (import {result['import'] * 1e3:.0f}, "
+                  f"load {result['load'] * 1e3:.0f}, call {result['first'] * 1e3:.1f}), "
+                  f"then {result['steady'] * 1e3:.2f}ms, peak RSS {result['peak_rss_mb']:.0f}MB, "
+                  f"dgl {result['dgl']}, pandas {result['pandas']}{size}")
+        if 'onnx' not in formats:
+            print('onnx skipped: onnxruntime is not installed')
+
+
+if __name__ == '__main__':
+    main()
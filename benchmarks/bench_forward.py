@@ -0,0 +1,92 @@
+"""Per-epoch GNN forward + backward time on CPU for the different execution modes.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_forward
+    python -m benchmarks.bench_forward --nodes 52 --windows 250 --pred-window 10 --epochs 5
+    python -m benchmarks.bench_forward --execution    # also compiled / bfloat16 modes vs eager float32
+"""
+
+import argparse
+import time
+
+import torch
+import torch.nn as nn
+
+from benchmarks.synthetic import node_table
+from graph_builder import build_graph
+from models import GNN, initialise_weights
+
+
+def make_inputs(n_nodes, n_windows, history_window, seed=42):
+    gen = torch.Generator().manual_seed(seed)
+    x = torch.randn(n_nodes, n_windows, history_window, generator=gen)
+    cI = torch.randn(n_windows, generator=gen)
+    N = torch.tensor([1e6])
+    I = torch.rand(n_windows, generator=gen) * 1e4
+    return x, cI, N, I
+
+
+def time_epochs(model, inputs, target, epochs):
+    criterion = nn.MSELoss()
+    h0 = torch.zeros(1, model.gru_dim)
+    times = []
+    for epoch in range(epochs + 1):
+        start = time.perf_counter()
+        model.zero_grad()
+        new_I, phy_I, _ = model(*inputs, h=h0)
+        loss = criterion(new_I.squeeze(), target) + 0.1 * criterion(phy_I.squeeze() / 1e4, target)
+        loss.backward()
+        if epoch:
+            times.append(time.perf_counter() - start)
+    return sum(times) / len(times), new_I.detach(), phy_I.detach()
+
+
+def build_model(g, history_window, pred_window, num_heads, seed=42, **modes):
+    torch.manual_seed(seed)
+    model = GNN(g, history_window, 32, 32, 32, num_heads, pred_window, torch.device('cpu'), **modes)
+    model.apply(initialise_weights)
+    return model
+
+
+def compare(g, inputs, target, args, name, baseline_modes, modes):
+    base = build_model(g, args.history_window, args.pred_window, args.heads, **baseline_modes)
+    other = build_model(g, args.history_window, args.pred_window, args.heads, **modes)
+    t_base, base_I, base_phy = time_epochs(base, inputs, target, args.epochs)
+    t_other, other_I, other_phy = time_epochs(other, inputs, target, args.epochs)
+    diff = max((base_I - other_I).abs().max().item(), ((base_phy - other_phy) / base_phy.abs().clamp_min(1)).abs().max().item())
+    print(f'{name}: {t_base * 1e3:.1f}ms -> {t_other * 1e3:.1f}ms per epoch  '
+          f'speedup {t_base / t_other:.1f}x  max diff {diff:.2e}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=52)
+    parser.add_argument('--threshold', type=float, default=17)
+    parser.add_argument('--windows', type=int, default=250)
+    parser.add_argument('--history-window', type=int, default=5)
+    parser.add_argument('--pred-window', type=int, default=10)
+    parser.add_argument('--heads', type=int, default=1)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--execution', action='store_true',
+                        help='compare debug checks, TorchScript, torch.compile and bfloat16 autocast against eager float32')
+    args = parser.parse_args()
+
+    g = build_graph(node_table(args.nodes), threshold=args.threshold)
+    inputs = make_inputs(args.nodes, args.windows, args.history_window)
+    target = torch.randn(args.windows, args.pred_window)
+    print(f'{args.nodes} nodes, {g.num_edges()} edges, {args.windows} windows, pred_window {args.pred_window}')
+
+    compare(g, inputs, target, args, 'batch_time', {'batch_time': False}, {'batch_time': True})
+
+    if args.execution:
+        # max diff is the tolerance check against eager float32
+        compare(g, inputs, target, args, 'no NaN checks', {'debug': True}, {})
+        compare(g, inputs, target, args, 'script', {}, {'compile_mode': 'script'})
+        compare(g, inputs, target, args, 'compile', {}, {'compile_mode': 'compile'})
+        compare(g, inputs, target, args, 'bfloat16 autocast', {}, {'autocast_dtype': torch.bfloat16})
+        compare(g, inputs, target, args, 'script + bfloat16', {}, {'compile_mode': 'script', 'autocast_dtype': torch.bfloat16})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""CPU microbenchmark: built-in kernel MHGAT against the Python UDF version.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_gat
+    python -m benchmarks.bench_gat --nodes 52 3000 --heads 1 4
+"""
+
+import argparse
+import time
+
+import dgl
+import torch
+
+from benchmarks.synthetic import node_table
+from graph_builder import build_graph
+from models import MHGAT, MHGATUDF
+
+
+def time_layer(layer, x, repeats):
+    # forward + backward, after one warm-up call
+    for i in range(repeats + 1):
+        if i == 1:
+            start = time.perf_counter()
+        layer.zero_grad()
+        out = layer(x)
+        out.sum().backward()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, nargs='+', default=[52, 3000])
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[17, 200])
+    parser.add_argument('--heads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--in-dim', type=int, default=5)
+    parser.add_argument('--out-dim', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    torch.manual_seed(42)
+    for n_nodes, threshold in zip(args.nodes, args.thresholds):
+        g = build_graph(node_table(n_nodes), threshold=threshold)
+        x = torch.randn(n_nodes, args.in_dim)
+        for num_heads in args.heads:
+            udf = MHGATUDF(g, args.in_dim, args.out_dim, num_heads)
+            fused = MHGAT(g, args.in_dim, args.out_dim, num_heads)
+            fused.load_state_dict(udf.state_dict())
+
+            max_diff = (udf(x) - fused(x)).abs().max().item()
+            t_udf = time_layer(udf, x, args.repeats)
+            t_fused = time_layer(fused, x, args.repeats)
+            print(f'{n_nodes} nodes, {g.num_edges()} edges, {num_heads} heads: '
+                  f'udf {t_udf * 1e3:.2f}ms  built-in {t_fused * 1e3:.2f}ms  '
+                  f'speedup {t_udf / t_fused:.1f}x  max |diff| {max_diff:.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Time the gravity-law graph build at state, county and zip-code scale.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_graph
+    python -m benchmarks.bench_graph --nodes 50 3000 40000 --thresholds 17 200 2000
+
+threshold 17 is calibrated for the 52 state graph; on thousands of nodes it connects
+a large fraction of all pairs, so the larger sizes default to higher thresholds that
+keep the average degree in the tens.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import node_table
+from graph_builder import build_edges_from_table, edges_from_similarity
+from similarity import similarity_from_table
+
+
+def original_edges(similarity, state_list, threshold, min_connections):
+    """the dictionary based edge construction from gnn_final.py, for reference"""
+    similarity_dictionary = {state1: dict(zip(state_list, similarity[i])) for i, state1 in enumerate(state_list)}
+    for each_state1 in similarity_dictionary:
+        similarity_dictionary[each_state1] = {key: value for key, value in sorted(similarity_dictionary[each_state1].items(), key=lambda item: item[1], reverse=True)}
+
+    edge_rows = []
+    edge_cols = []
+    for state1 in similarity_dictionary:
+        connections = 0
+        extra_edges = []
+        for state2 in similarity_dictionary[state1]:
+            if state1 != state2 and similarity_dictionary[state1][state2] > threshold:
+                edge_rows.append(state_list.index(state1))
+                edge_cols.append(state_list.index(state2))
+                connections += 1
+            elif state1 != state2:
+                extra_edges.append((state1, state2, similarity_dictionary[state1][state2]))
+        if connections < min_connections:
+            extra_edges = sorted(extra_edges, key=lambda x: (x[2], x[1]), reverse=True)
+            for extra_edge in extra_edges:
+                if connections >= min_connections:
+                    break
+                edge_rows.append(state_list.index(state1))
+                edge_cols.append(state_list.index(extra_edge[1]))
+                connections += 1
+    return np.array(edge_rows), np.array(edge_cols)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, nargs='+', default=[50, 3000, 40000])
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[17, 200, 2000])
+    parser.add_argument('--min-connections', type=int, default=5)
+    parser.add_argument('--original-max', type=int, default=500, help='largest size to also run the dictionary version on')
+    parser.add_argument('--dense-max', type=int, default=5000, help='largest size to also run the dense strategy on')
+    parser.add_argument('--fast', action='store_true', help='numpy arcsin instead of the bit-exact math.asin')
+    args = parser.parse_args()
+
+    for n_nodes, threshold in zip(args.nodes, args.thresholds):
+        table = node_table(n_nodes)
+        exact = not args.fast
+        print(f'--- {n_nodes} nodes, threshold {threshold:g}')
+
+        (src, dst), t_index = timed(build_edges_from_table, table, threshold=threshold,
+                                    min_connections=args.min_connections, exact=exact, method='index')
+        print(f'index:    {t_index:8.3f}s  {len(src)} edges')
+
+        if n_nodes <= args.dense_max:
+            (d_src, d_dst), t_dense = timed(build_edges_from_table, table, threshold=threshold,
+                                            min_connections=args.min_connections, exact=exact, method='dense')
+            same = np.array_equal(src, d_src) and np.array_equal(dst, d_dst)
+            print(f'dense:    {t_dense:8.3f}s  same edges as index: {same}')
+
+        if n_nodes <= args.original_max:
+            similarity, t_sim = timed(similarity_from_table, table, exact=exact)
+            (o_src, o_dst), t_orig = timed(original_edges, similarity, list(table['State']), threshold, args.min_connections)
+            same = np.array_equal(src, o_src) and np.array_equal(dst, o_dst)
+            print(f'original: {t_sim + t_orig:8.3f}s  same edges as index: {same}')
+
+
+if __name__ == '__main__':
+    main()
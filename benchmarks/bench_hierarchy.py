@@ -0,0 +1,110 @@
+"""Time and memory of the hierarchical county -> state model against the plain state graph.
+
+Synthetic counties are scattered over the US and split into contiguous state segments; the
+county graph is built with the index strategy and the GAT layers run on its sparse edges.
+Memory is the peak size of the tensors autograd saves for one training step, next to what a
+dense num_nodes x num_nodes attention matrix over the same windows would take on its own.
+Run from the repository root:
+
+    python -m benchmarks.bench_hierarchy
+    python -m benchmarks.bench_hierarchy --counties 3100 --states 52 --windows 50 200 --threshold 100
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from benchmarks.bench_tbptt import SavedBytes, make_data
+from benchmarks.synthetic import node_table
+from graph_builder import build_graph
+from hierarchy import HierarchicalGNN, county_graph
+from models import GNN, initialise_weights
+from training import forecast_loss
+from windows import WindowDataset
+
+
+def assign_states(n_counties, n_states, seed=42):
+    """every state gets at least one county, the rest at random; sorted, as county_table orders them"""
+    rng = np.random.default_rng(seed)
+    assignment = np.concatenate([np.arange(n_states), rng.integers(0, n_states, n_counties - n_states)])
+    return np.sort(assignment)
+
+
+def step(model, data, sum_I, args, repeats):
+    """mean seconds and peak saved bytes of a full-batch forward + backward over all windows"""
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    criterion = nn.MSELoss()
+    n_states = data.shape[0]
+    regions = torch.arange(n_states)
+    N = torch.full((n_states,), 1e6)
+    dInf_mean, dInf_std = torch.zeros(n_states, 1, 1), torch.ones(n_states, 1, 1)
+
+    whole = WindowDataset(data, sum_I, args.history_window, args.pred_window, 1)[0]
+    saved = SavedBytes()
+    times = []
+    for k in range(repeats + 1):
+        start = time.perf_counter()
+        with torch.autograd.graph.saved_tensors_hooks(saved.pack, saved.unpack):
+            optimizer.zero_grad()
+            loss, _, _, _ = forecast_loss(model, whole['x'], whole['cI'], N, whole['I'], whole['yI'],
+                                          dInf_mean, dInf_std, regions, criterion)
+            loss.backward()
+            optimizer.step()
+        saved.reset()
+        if k:
+            # the first step warms up the kernels
+            times.append(time.perf_counter() - start)
+    return float(np.mean(times)), saved.peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--counties', type=int, default=3100)
+    parser.add_argument('--states', type=int, default=52)
+    parser.add_argument('--windows', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--threshold', type=float, default=100)
+    parser.add_argument('--min-connections', type=int, default=5)
+    parser.add_argument('--heads', type=int, default=1)
+    parser.add_argument('--pool', default='mean')
+    parser.add_argument('--history-window', type=int, default=5)
+    parser.add_argument('--pred-window', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    mb = 1024 ** 2
+    device = torch.device('cpu')
+    counties = node_table(args.counties)
+    start = time.perf_counter()
+    g_county = county_graph(counties, threshold=args.threshold, min_connections=args.min_connections)
+    build = time.perf_counter() - start
+    assignment = assign_states(args.counties, args.states)
+    g_state = build_graph(node_table(args.states))
+    print(f'county graph: {args.counties} nodes, {g_county.num_edges()} edges '
+          f'({g_county.num_edges() / args.counties:.1f} per node), built in {build:.2f}s')
+    print(f'state graph: {args.states} nodes, {g_state.num_edges()} edges')
+
+    for n_windows in args.windows:
+        data, sum_I = make_data(args.states, n_windows, args.history_window, args.pred_window)
+        dims = (args.history_window, 32, 32, 32, args.heads, args.pred_window, device)
+
+        torch.manual_seed(42)
+        model = GNN(g_state, *dims, readout='node')
+        model.apply(initialise_weights)
+        t_state, m_state = step(model, data, sum_I, args, args.repeats)
+
+        torch.manual_seed(42)
+        model = HierarchicalGNN(g_county, assignment, *dims, readout='node', pool=args.pool)
+        model.apply(initialise_weights)
+        t_county, m_county = step(model, data, sum_I, args, args.repeats)
+
+        dense = args.counties ** 2 * n_windows * args.heads * 4
+        print(f'{n_windows} windows: state graph {t_state * 1e3:.0f}ms {m_state / mb:.1f}MB   '
+              f'county graph {t_county * 1e3:.0f}ms {m_county / mb:.1f}MB   '
+              f'(one dense attention matrix: {dense / mb:.0f}MB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Neighbor-sampled training against full-graph training.
+
+Accuracy: both train the same model on the state graph for the same number of epochs and
+are scored on the validation windows with a full-graph pass (the loss gnn_final.py keeps
+the best model on, physics branch only, and the MAE of the data branch). The data is a
+feature stream written by gnn_final.py, or a synthetic one.
+
+Throughput: seconds per epoch and seed regions per second on a synthetic gravity graph of
+--nodes nodes, sampled with 0 and more DataLoader workers, next to one full-graph step, with
+the process's peak RSS after each (sampled first, as the peak never goes down).
+Run from the repository root:
+
+    python -m benchmarks.bench_sampling
+    python -m benchmarks.bench_sampling --stream /content/feature_stream --epochs 30 --nodes 50000
+"""
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from benchmarks.bench_tbptt import make_data
+from benchmarks.synthetic import dataset as synthetic_dataset, node_table
+from graph_builder import build_graph
+from incremental import FeatureStream
+from models import GNN, initialise_weights
+from sampling import neighbor_loader, sampled_epoch
+from training import forecast, forecast_loss, mae, normalise_phy
+from tune import load_shared, prepare
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_model(g, in_dim, pred_window, seed=42):
+    torch.manual_seed(seed)
+    model = GNN(g, in_dim, 32, 32, 32, 1, pred_window, torch.device('cpu'), readout='node')
+    model.apply(initialise_weights)
+    return model
+
+
+def validate(model, data, regions, criterion):
+    model.eval()
+    with torch.no_grad():
+        active, phy, _ = forecast(model, data['val_x'], data['val_cI'], data['N'], data['val_I'], regions)
+        phy = normalise_phy(phy, regions, data['dInf_mean'], data['dInf_std'])
+        return criterion(phy, data['val_yI']).item(), mae(active, data['val_yI']).item()
+
+
+def accuracy(data, g, args):
+    criterion = nn.MSELoss()
+    regions = torch.arange(g.num_nodes())
+    in_dim, pred_window = data['train_x'].shape[-1], data['train_yI'].shape[-1]
+    results = {}
+
+    model = make_model(g, in_dim, pred_window)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    start = time.perf_counter()
+    for epoch in range(args.epochs):
+        model.train()
+        optimizer.zero_grad()
+        loss, _, _, _ = forecast_loss(model, data['train_x'], data['train_cI'], data['N'], data['train_I'],
+                                      data['train_yI'], data['dInf_mean'], data['dInf_std'], regions, criterion)
+        loss.backward()
+        optimizer.step()
+    results['full graph'] = (time.perf_counter() - start, *validate(model, data, regions, criterion))
+
+    model = make_model(g, in_dim, pred_window)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    loader = neighbor_loader(g, fanouts=args.fanouts, batch_size=args.state_batch, seed=42)
+    start = time.perf_counter()
+    for epoch in range(args.epochs):
+        sampled_epoch(model, optimizer, loader, data['train_x'], data['train_cI'], data['N'], data['train_I'],
+                      data['train_yI'], data['dInf_mean'], data['dInf_std'], criterion)
+    results[f'sampled {tuple(args.fanouts)}, batch {args.state_batch}'] = (
+        time.perf_counter() - start, *validate(model, data, regions, criterion))
+
+    for name, (seconds, val_loss, val_mae) in results.items():
+        print(f'  {name}: {seconds:.1f}s, val loss {val_loss:.4f}, val MAE {val_mae:.4f}')
+
+
+def throughput(args):
+    table = node_table(args.nodes)
+    start = time.perf_counter()
+    g = build_graph(table, threshold=args.threshold, method='index')
+    print(f'{args.nodes} nodes, {g.num_edges()} edges, built in {time.perf_counter() - start:.1f}s, '
+          f'{args.windows} windows')
+
+    data, sum_I = make_data(args.nodes, args.windows, args.history_window, args.pred_window)
+    x = torch.from_numpy(np.ascontiguousarray(data[:, :args.windows + args.history_window - 1]))
+    # windows as prep_data lays them out, (n_loc, windows, history_window)
+    x = x[..., 0].unfold(1, args.history_window, 1)
+    yI = torch.from_numpy(data[..., 0]).unfold(1, args.pred_window, 1)[:, args.history_window:][:, :args.windows]
+    cI = x[..., -1].contiguous()
+    I = torch.from_numpy(sum_I[:, args.history_window - 1:][:, :args.windows])
+    N = torch.full((args.nodes, 1), 1e6)
+    dInf_mean, dInf_std = torch.zeros(args.nodes, 1, 1), torch.ones(args.nodes, 1, 1)
+    criterion = nn.MSELoss()
+
+    model = make_model(g, args.history_window, args.pred_window)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    for num_workers in args.workers:
+        loader = neighbor_loader(g, fanouts=args.fanouts, batch_size=args.batch_size, num_workers=num_workers,
+                                 seed=42)
+        start = time.perf_counter()
+        sampled_epoch(model, optimizer, loader, x, cI, N, I, yI, dInf_mean, dInf_std, criterion)
+        seconds = time.perf_counter() - start
+        print(f'  sampled {tuple(args.fanouts)}, batch {args.batch_size}, {num_workers} workers: '
+              f'{seconds:.2f}s per epoch of {len(loader)} steps, {args.nodes / seconds:.0f} regions/s, '
+              f'peak RSS {peak_rss_mb():.0f}MB')
+
+    # last, the peak RSS only ever grows
+    regions = torch.arange(args.nodes)
+    start = time.perf_counter()
+    optimizer.zero_grad()
+    loss, _, _, _ = forecast_loss(model, x, cI, N, I, yI, dInf_mean, dInf_std, regions, criterion)
+    loss.backward()
+    optimizer.step()
+    seconds = time.perf_counter() - start
+    print(f'  full graph: {seconds:.2f}s per step, {args.nodes / seconds:.0f} regions/s, peak RSS {peak_rss_mb():.0f}MB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stream', help='feature stream directory; synthetic state data if not given')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--state-batch', type=int, default=16)
+    parser.add_argument('--nodes', type=int, default=50000)
+    parser.add_argument('--threshold', type=float, default=5000)
+    parser.add_argument('--windows', type=int, default=20)
+    parser.add_argument('--fanouts', type=int, nargs=2, default=[10, 10])
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2])
+    parser.add_argument('--history-window', type=int, default=5)
+    parser.add_argument('--pred-window', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stream_path = args.stream
+        if stream_path is None:
+            stream_path = os.path.join(tmp, 'stream')
+            FeatureStream.create(stream_path, synthetic_dataset(52, 200))
+        prepare(stream_path, os.path.join(tmp, 'arrays'), args.history_window, args.pred_window)
+        data, table = load_shared(os.path.join(tmp, 'arrays'))
+        data = {name: value.clone() for name, value in data.items()}
+    g = build_graph(table)
+    print(f'accuracy on the state graph ({g.num_nodes()} nodes, {g.num_edges()} edges), {args.epochs} epochs')
+    accuracy(data, g, args)
+
+    print('throughput')
+    throughput(args)
+
+
+if __name__ == '__main__':
+    main()
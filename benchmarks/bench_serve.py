@@ -0,0 +1,131 @@
+"""Forecast latency of serve.py on CPU: full history replay per request against the resident
+GRU state, and p50 / p99 under concurrent callers with micro-batching.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_serve
+    python -m benchmarks.bench_serve --nodes 52 --days 300 --clients 16 --requests 50 --http
+"""
+
+import argparse
+import json
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import torch
+
+from benchmarks.synthetic import dataset
+from incremental import FeatureStream
+from models import GNN, initialise_weights
+from serve import Forecaster, MicroBatcher, make_server
+from training import forecast, save_checkpoint
+
+
+def replay_latency(forecaster, stream, names, repeats):
+    """the whole history through the model for every request, what the training script would do"""
+    x, I, cI, _ = stream.forecast_windows(forecaster.history_window, forecaster.slide_step, start=0)
+    x, I, cI = (torch.from_numpy(each) for each in (x, I, cI))
+    times = []
+    for each in range(repeats):
+        regions = torch.tensor(forecaster.regions(names[each % len(names)]))
+        start = time.perf_counter()
+        with torch.no_grad():
+            forecast(forecaster.model, x, cI, forecaster.N, I, regions)
+        times.append(time.perf_counter() - start)
+    return np.array(times)
+
+
+def resident_latency(forecaster, names, repeats):
+    times = []
+    for each in range(repeats):
+        start = time.perf_counter()
+        forecaster.predict(forecaster.regions(names[each % len(names)]))
+        times.append(time.perf_counter() - start)
+    return np.array(times)
+
+
+def concurrent_latency(call, names, clients, requests):
+    times = [[] for _ in range(clients)]
+
+    def client(k):
+        for each in range(requests):
+            start = time.perf_counter()
+            call(names[(k * requests + each) % len(names)])
+            times[k].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.concatenate(times), time.perf_counter() - start
+
+
+def http_call(url):
+    def call(names):
+        request = urllib.request.Request(url, data=json.dumps({'regions': names}).encode())
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+    return call
+
+
+def report(name, times, wall=None):
+    ms = times * 1e3
+    line = f'{name}: p50 {np.percentile(ms, 50):.2f}ms  p99 {np.percentile(ms, 99):.2f}ms'
+    if wall is not None:
+        line += f'  {len(times) / wall:.0f} req/s'
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=52)
+    parser.add_argument('--days', type=int, default=300)
+    parser.add_argument('--threshold', type=float, default=17)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--regions-per-request', type=int, default=5)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--http', action='store_true', help='also time requests through the HTTP server')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stream = FeatureStream.create(f'{tmp}/stream', dataset(args.nodes, args.days))
+        torch.manual_seed(42)
+        model = GNN(None, 5, 32, 32, 32, 1, 10, torch.device('cpu'), readout='node')
+        model.apply(initialise_weights)
+        save_checkpoint(f'{tmp}/model.pth', model, torch.optim.Adam(model.parameters()))
+
+        start = time.perf_counter()
+        forecaster = Forecaster(f'{tmp}/model.pth', f'{tmp}/stream', threshold=args.threshold)
+        print(f'{args.nodes} nodes, {forecaster.g.num_edges()} edges, {args.days} days, '
+              f'loaded in {time.perf_counter() - start:.2f}s')
+
+        rng = np.random.default_rng(0)
+        names = [list(rng.choice(forecaster.states, args.regions_per_request, replace=False)) for _ in range(256)]
+
+        report('replay history per request', replay_latency(forecaster, stream, names, 20))
+        report('resident state, one caller', resident_latency(forecaster, names, 200))
+
+        batcher = MicroBatcher(forecaster, max_wait=args.max_wait_ms / 1e3)
+        times, wall = concurrent_latency(batcher.forecast, names, args.clients, args.requests)
+        report(f'{args.clients} concurrent callers', times, wall)
+        print(f'  mean batch {np.mean(batcher.batch_sizes):.1f} requests, {len(batcher.batch_sizes)} forward passes')
+
+        if args.http:
+            server = make_server(batcher, port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f'http://127.0.0.1:{server.server_address[1]}/forecast'
+            times, wall = concurrent_latency(http_call(url), names, args.clients, args.requests)
+            report(f'{args.clients} concurrent HTTP callers', times, wall)
+            server.shutdown()
+            server.server_close()
+        batcher.close()
+
+
+if __name__ == '__main__':
+    main()
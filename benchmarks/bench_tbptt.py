@@ -0,0 +1,108 @@
+"""Activation memory and epoch time of full backprop through time against truncated BPTT
+as the history grows.
+
+Memory is the peak size of the tensors autograd saves for backward (distinct storages),
+which is what grows with the unrolled sequence. Run from the repository root:
+
+    python -m benchmarks.bench_tbptt
+    python -m benchmarks.bench_tbptt --nodes 52 --windows 250 1000 4000 --chunk 50
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from benchmarks.synthetic import node_table
+from graph_builder import build_graph
+from models import GNN, initialise_weights
+from training import RingBuffer, forecast_loss, tbptt_epoch
+from windows import WindowDataset
+
+
+class SavedBytes:
+    """peak bytes of distinct storages held by autograd between a forward and its backward"""
+
+    def __init__(self):
+        self.live = {}
+        self.peak = 0
+
+    def pack(self, tensor):
+        storage = tensor.untyped_storage()
+        self.live[storage.data_ptr()] = storage.nbytes()
+        self.peak = max(self.peak, sum(self.live.values()))
+        return tensor
+
+    def unpack(self, tensor):
+        return tensor
+
+    def reset(self):
+        self.live = {}
+
+
+def make_data(n_nodes, n_windows, history_window, pred_window, seed=42):
+    rng = np.random.default_rng(seed)
+    days = n_windows + history_window + pred_window - 1
+    data = rng.standard_normal((n_nodes, days, 1)).astype(np.float32)
+    sum_I = (rng.random((n_nodes, days)) * 1e4).astype(np.float32)
+    return data, sum_I
+
+
+def run(g, data, sum_I, args, chunk):
+    torch.manual_seed(42)
+    model = GNN(g, args.history_window, 32, 32, 32, 1, args.pred_window, torch.device('cpu'), readout='node')
+    model.apply(initialise_weights)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    criterion = nn.MSELoss()
+    n_nodes = data.shape[0]
+    regions = torch.arange(n_nodes)
+    N = torch.full((n_nodes,), 1e6)
+    dInf_mean, dInf_std = torch.zeros(n_nodes, 1, 1), torch.ones(n_nodes, 1, 1)
+
+    dataset = WindowDataset(data, sum_I, args.history_window, args.pred_window, 1, chunk, drop_last=False)
+    saved = SavedBytes()
+    start = time.perf_counter()
+    with torch.autograd.graph.saved_tensors_hooks(saved.pack, saved.unpack):
+        if chunk is None:
+            whole = dataset[0]
+            optimizer.zero_grad()
+            loss, _, _, _ = forecast_loss(model, whole['x'], whole['cI'], N, whole['I'], whole['yI'],
+                                          dInf_mean, dInf_std, regions, criterion)
+            loss.backward()
+            optimizer.step()
+        else:
+            alpha = RingBuffer(100)
+
+            def chunks():
+                for each in dataset:
+                    yield each
+                    # the previous chunk's graph is gone once the next one is requested
+                    saved.reset()
+            tbptt_epoch(model, optimizer, chunks(), N, dInf_mean, dInf_std, regions, criterion, alpha_buffer=alpha)
+    return time.perf_counter() - start, saved.peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=52)
+    parser.add_argument('--windows', type=int, nargs='+', default=[250, 1000, 4000])
+    parser.add_argument('--chunk', type=int, default=50)
+    parser.add_argument('--history-window', type=int, default=5)
+    parser.add_argument('--pred-window', type=int, default=10)
+    args = parser.parse_args()
+
+    g = build_graph(node_table(args.nodes))
+    mb = 1024 ** 2
+    print(f'{args.nodes} nodes, {g.num_edges()} edges, chunks of {args.chunk} windows')
+    for n_windows in args.windows:
+        data, sum_I = make_data(args.nodes, n_windows, args.history_window, args.pred_window)
+        t_full, m_full = run(g, data, sum_I, args, None)
+        t_tbptt, m_tbptt = run(g, data, sum_I, args, args.chunk)
+        print(f'{n_windows} windows: full {t_full * 1e3:.0f}ms {m_full / mb:.1f}MB   '
+              f'tbptt {t_tbptt * 1e3:.0f}ms {m_tbptt / mb:.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
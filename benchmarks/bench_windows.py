@@ -0,0 +1,93 @@
+"""Time and peak memory of prep_data at county scale, list-based against strided views.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_windows
+    python -m benchmarks.bench_windows --nodes 3100 --days 300 --features 3
+"""
+
+import argparse
+import contextlib
+import io
+import time
+import tracemalloc
+
+import numpy as np
+
+from windows import prep_data
+
+
+def list_prep_data(data, sum_I, history_window=5, pred_window=15, slide_step=5):
+    """the list-append prep_data gnn_final.py used to define, for reference"""
+    n_loc = data.shape[0]
+    timestep = data.shape[1]
+    n_feat = data.shape[2]
+
+    x = []
+    y_I = []
+    last_I = []
+    concat_I = []
+
+    for i in range(0, timestep, slide_step):
+        if i + history_window + pred_window - 1 >= timestep or i + history_window >= timestep:
+            break
+        x.append(data[:, i:i + history_window, :].reshape((n_loc, history_window * n_feat)))
+
+        concat_I.append(data[:, i + history_window - 1, 0])
+        last_I.append(sum_I[:, i + history_window - 1])
+
+        y_I.append(data[:, i + history_window:i + history_window + pred_window, 0])
+
+    print("x shape before transpose:", np.array(x).shape)
+    print("y_I shape before transpose:", np.array(y_I).shape)
+    print("concat_I shape before transpose:", np.array(concat_I).shape)
+    print("last_I shape before transpose:", np.array(last_I).shape)
+
+    x = np.array(x, dtype=np.float32).transpose((1, 0, 2))
+    last_I = np.array(last_I, dtype=np.float32).transpose((1, 0))
+    concat_I = np.array(concat_I, dtype=np.float32).transpose((1, 0))
+    y_I = np.array(y_I, dtype=np.float32).transpose((1, 0, 2))
+
+    return x, last_I, concat_I, y_I
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        out = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=3100)
+    parser.add_argument('--days', type=int, default=300)
+    parser.add_argument('--features', type=int, default=1)
+    parser.add_argument('--history-window', type=int, default=5)
+    parser.add_argument('--pred-window', type=int, default=10)
+    parser.add_argument('--slide-step', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    data = rng.standard_normal((args.nodes, args.days, args.features))
+    sum_I = rng.random((args.nodes, args.days)) * 1e4
+    windows = (args.history_window, args.pred_window, args.slide_step)
+
+    old, t_old, peak_old = measure(list_prep_data, data, sum_I, *windows)
+    new, t_new, peak_new = measure(prep_data, data, sum_I, *windows)
+    output = sum(each.nbytes for each in new)
+    same = all(np.array_equal(a, b) for a, b in zip(old, new))
+
+    mb = 1024 ** 2
+    print(f'{args.nodes} nodes x {args.days} days x {args.features} features, {new[0].shape[1]} windows, '
+          f'outputs {output / mb:.0f}MB')
+    print(f'lists:   {t_old:.3f}s  peak {peak_old / mb:.0f}MB')
+    print(f'strided: {t_new:.3f}s  peak {peak_new / mb:.0f}MB  speedup {t_old / t_new:.1f}x  identical: {same}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""End-to-end stage timings of the forecasting pipeline on synthetic data, as a baseline.
+
+For every NODESxDAYSxFEATURES configuration the pipeline of gnn_final.py runs on synthetic
+data (benchmarks/synthetic.py) and each stage is timed --repeats times:
+
+    ingestion    load_dataset (uncached) of CSVs written by write_sources for NODES states
+    similarity   the dense similarity matrix (skipped above graph_builder.DENSE_MAX_NODES)
+    graph        build_graph of the gravity-law edges
+    prep_data    normalisation and the train / validation / test windows
+    forward      full-batch forecast_loss over the training windows, all regions
+    backward     its loss.backward()
+    validation   validation_loss over the validation windows (physics branch only, no autograd),
+                 as gnn_final.py validates
+
+The model stages run one extra warm-up repeat first. FEATURES is the number of dynamic
+input channels: dInf plus FEATURES - 1 synthetic covariates. The medians go to --output as
+JSON together with the commit, versions and core count, so a later run (after an
+optimisation, or on another machine) can be compared stage by stage with --compare.
+Run from the repository root:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --configs 52x300x1 500x300x4 --output baseline.json
+    python -m benchmarks.suite --compare baseline.json --output after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+
+from benchmarks.synthetic import START_DATE, dataset, node_table, write_sources
+from features import normalize_feature
+from graph_builder import DENSE_MAX_NODES, build_graph
+from ingest import load_dataset
+from instrument import git_commit, peak_rss_mb
+from models import GNN, initialise_weights
+from similarity import similarity_from_table
+from training import forecast_loss, validation_loss
+from windows import prep_data
+
+# bump when a stage changes what it measures, so baselines of different versions are not compared
+SUITE_VERSION = 2
+STAGES = ['ingestion', 'similarity', 'graph', 'prep_data', 'forward', 'backward', 'validation']
+HISTORY_WINDOW, PRED_WINDOW, SLIDE_STEP = 5, 10, 1
+VALID_WINDOW, TEST_WINDOW = 25, 25
+# merge_sources keeps one calendar year, so longer runs skip ingestion
+INGEST_MAX_DAYS = (pd.Timestamp('2020-12-31') - pd.Timestamp(START_DATE)).days + 1
+
+
+def parse_config(config):
+    try:
+        nodes, days, features = (int(part) for part in config.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected NODESxDAYSxFEATURES, got {config!r}')
+    if days < HISTORY_WINDOW + PRED_WINDOW + VALID_WINDOW + TEST_WINDOW or features < 1:
+        raise argparse.ArgumentTypeError(f'{config}: too few days for the windows, or no features')
+    return nodes, days, features
+
+
+def timed(fn, repeats, warmup=0):
+    """median seconds of repeats calls of fn (after warmup calls) and fn's last result"""
+    times = []
+    for k in range(warmup + repeats):
+        start = time.perf_counter()
+        out = fn()
+        if k >= warmup:
+            times.append(time.perf_counter() - start)
+    return statistics.median(times), out
+
+
+def windows(data, features):
+    """gnn_final.py's normalised inputs and train / validation windows"""
+    channel = {name: i for i, name in enumerate(data['channels'])}
+    active_cases = data['features'][..., channel['Active_Cases']]
+    inputs = ['dInf'] + [name for name in data['channels'] if name.startswith('covariate_')][:features - 1]
+    dynamic_feat = np.stack([normalize_feature(data['features'][..., channel[name]])[0] for name in inputs], axis=-1)
+    _, dInf_mean, dInf_std = normalize_feature(data['features'][..., channel['dInf']])
+
+    splits = [slice(None, -VALID_WINDOW - TEST_WINDOW), slice(-VALID_WINDOW - TEST_WINDOW, -TEST_WINDOW),
+              slice(-TEST_WINDOW, None)]
+    train, val, _ = [prep_data(dynamic_feat[:, split], active_cases[:, split], HISTORY_WINDOW, PRED_WINDOW, SLIDE_STEP)
+                     for split in splits]
+    return train, val, dInf_mean, dInf_std
+
+
+def run_config(nodes, days, features, args):
+    stages = dict.fromkeys(STAGES)
+    repeats = args.repeats
+
+    if days <= INGEST_MAX_DAYS:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = write_sources(tmp, nodes, days, seed=args.seed)
+            stages['ingestion'], _ = timed(lambda: load_dataset(*paths, cache_dir=None), repeats)
+
+    data = dataset(nodes, days, seed=args.seed, extra_channels=features - 1)
+    table = node_table(nodes, args.seed)
+    if nodes <= DENSE_MAX_NODES:
+        stages['similarity'], _ = timed(lambda: similarity_from_table(table), repeats)
+    stages['graph'], g = timed(lambda: build_graph(table, threshold=args.threshold), repeats)
+    stages['prep_data'], (train, val, dInf_mean, dInf_std) = timed(lambda: windows(data, features), repeats)
+
+    train_x, train_I, train_cI, train_yI = (torch.from_numpy(array) for array in train)
+    val_x, val_I, val_cI, val_yI = (torch.from_numpy(array) for array in val)
+    dInf_mean = torch.tensor(dInf_mean, dtype=torch.float32).reshape(-1, 1, 1)
+    dInf_std = torch.tensor(dInf_std, dtype=torch.float32).reshape(-1, 1, 1)
+    N = torch.tensor(data['static'][:, 0], dtype=torch.float32).unsqueeze(-1)
+    regions = torch.arange(nodes)
+
+    torch.manual_seed(args.seed)
+    device = torch.device('cpu')
+    model = GNN(g, HISTORY_WINDOW * features, 32, 32, 32, 1, PRED_WINDOW, device, readout='node')
+    model.apply(initialise_weights)
+    criterion = nn.MSELoss()
+
+    forward, backward = [], []
+    for k in range(1 + repeats):
+        model.zero_grad()
+        start = time.perf_counter()
+        loss, _, _, _ = forecast_loss(model, train_x, train_cI, N, train_I, train_yI, dInf_mean, dInf_std, regions,
+                                      criterion)
+        middle = time.perf_counter()
+        loss.backward()
+        end = time.perf_counter()
+        if k:
+            forward.append(middle - start)
+            backward.append(end - middle)
+    stages['forward'] = statistics.median(forward)
+    stages['backward'] = statistics.median(backward)
+
+    def validate():
+        return validation_loss(model, val_x, val_cI, N, val_I, val_yI, dInf_mean, dInf_std, regions, criterion)
+
+    stages['validation'], _ = timed(validate, repeats, warmup=1)
+
+    return {
+        'nodes': nodes,
+        'days': days,
+        'features': features,
+        'edges': g.num_edges(),
+        'train_windows': train_x.shape[1],
+        'stages': stages,
+        # of the whole process so far: run configurations smallest first
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def environment():
+    return {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'torch': torch.__version__,
+        'threads': torch.get_num_threads(),
+        'cpu_count': os.cpu_count(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+
+def compare(baseline, results):
+    """speed-up of every stage over the same configuration in an earlier baseline"""
+    old = baseline['results']
+    for name, result in results.items():
+        if name not in old:
+            continue
+        print(f'{name} against {(baseline["environment"].get("commit") or "unknown")[:10]}:')
+        for stage in STAGES:
+            before, after = old[name]['stages'].get(stage), result['stages'][stage]
+            if before and after:
+                print(f'  {stage:<11} {before * 1e3:9.1f}ms -> {after * 1e3:9.1f}ms  {before / after:5.2f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', type=parse_config, nargs='+', default=['52x300x1', '52x300x4', '500x300x1'])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=17, help='graph edge weight threshold')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='baseline.json')
+    parser.add_argument('--compare', help='earlier --output to report speed-ups against')
+    args = parser.parse_args()
+    configs = [parse_config(config) if isinstance(config, str) else config for config in args.configs]
+
+    env = environment()
+    print(f"{env['cpu_count']} cores, {env['threads']} torch threads, torch {env['torch']}")
+    results = {}
+    for nodes, days, features in configs:
+        name = f'{nodes}x{days}x{features}'
+        result = run_config(nodes, days, features, args)
+        results[name] = result
+        print(f"{name}: {result['edges']} edges, {result['train_windows']} training windows, "
+              f"peak RSS {result['peak_rss_mb']:.0f}MB")
+        for stage, seconds in result['stages'].items():
+            print(f'  {stage:<11} ' + ('skipped' if seconds is None else f'{seconds * 1e3:9.1f}ms'))
+
+    baseline = {'suite': SUITE_VERSION, 'environment': env, 'args': {'repeats': args.repeats,
+                'threshold': args.threshold, 'seed': args.seed}, 'results': results}
+    # write then rename, an interrupted run leaves the previous baseline intact
+    tmp_path = args.output + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+    os.replace(tmp_path, args.output)
+    print(f'wrote {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if previous.get('suite') != SUITE_VERSION:
+            print(f"{args.compare} is suite version {previous.get('suite')}, this is {SUITE_VERSION}: not compared")
+        else:
+            compare(previous, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Synthetic stand-ins for the state / county data, for benchmarks.
+
+node_table scatters gravity-law nodes over the US; sir_cases drives their case curves with a
+stochastic SIR model, each node also infected by its nearest neighbours; dataset packs both
+the way ingest.load_dataset returns them and write_sources writes the three CSVs
+merge_sources reads, so the whole pipeline runs without the real data.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+START_DATE = '2020-01-22'
+
+
+def node_table(n_nodes, seed=42):
+    """
+    Static node table (State, Latitude, Longitude, Population) with points scattered over
+    the continental US and a county-like log-normal population.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'State': [f'node_{i}' for i in range(n_nodes)],
+        'Latitude': rng.uniform(25.0, 49.0, n_nodes),
+        'Longitude': rng.uniform(-124.0, -67.0, n_nodes),
+        'Population': np.maximum(rng.lognormal(10.3, 1.4, n_nodes), 100).astype(np.int64),
+    })
+
+
+def nearest_neighbours(table, k=5):
+    """(n_nodes, k) indices of each node's k nearest other nodes by great-circle distance"""
+    from sklearn.neighbors import BallTree
+
+    points = np.radians(table[['Latitude', 'Longitude']].to_numpy(dtype=np.float64))
+    k = min(k, len(points) - 1)
+    _, index = BallTree(points, metric='haversine').query(points, k=k + 1)
+    return index[:, 1:]
+
+
+def sir_cases(table, days, seed=42, coupling=0.1, neighbours=5):
+    """
+    Daily stochastic SIR per node: random transmission / recovery rates, a handful of
+    infections seeded on a random day in the first third, and a `coupling` share of the
+    force of infection coming from the `neighbours` nearest nodes. Returns the (n_nodes, days)
+    float32 series of load_dataset's case channels.
+    """
+    rng = np.random.default_rng(seed)
+    population = table['Population'].to_numpy(dtype=np.int64)
+    n_nodes = len(population)
+    beta = rng.uniform(0.18, 0.32, n_nodes)
+    gamma = rng.uniform(0.08, 0.14, n_nodes)
+    death_rate = rng.uniform(0.005, 0.02, n_nodes)
+    first_day = rng.integers(0, max(1, days // 3), n_nodes)
+    near = nearest_neighbours(table, neighbours) if coupling and n_nodes > 1 else None
+
+    susceptible = population.copy()
+    infected = np.zeros(n_nodes, dtype=np.int64)
+    removed = np.zeros(n_nodes, dtype=np.int64)
+    new_cases = np.zeros((n_nodes, days), dtype=np.float32)
+    active = np.zeros((n_nodes, days), dtype=np.float32)
+    recovered = np.zeros((n_nodes, days), dtype=np.float32)
+    for day in range(days):
+        seeds = np.where(first_day == day, np.minimum(10, susceptible), 0)
+        prevalence = infected / population
+        if near is not None:
+            prevalence = (1 - coupling) * prevalence + coupling * prevalence[near].mean(axis=1)
+        new = rng.binomial(susceptible - seeds, -np.expm1(-beta * prevalence)) + seeds
+        cured = rng.binomial(infected, gamma)
+        susceptible -= new
+        infected += new - cured
+        removed += cured
+        new_cases[:, day], active[:, day], recovered[:, day] = new, infected, removed
+
+    deaths = np.round(recovered * death_rate[:, None])
+    return {
+        'Active_Cases': active,
+        'Confirmed_Cases': np.cumsum(new_cases, axis=1),
+        'New_cases': new_cases,
+        'Deaths': deaths,
+        'Recovered_Cases': recovered - deaths,
+    }
+
+
+def dataset(n_nodes, days, seed=42, extra_channels=0):
+    """
+    A load_dataset-style dict for node_table(n_nodes): sir_cases curves and the derived change
+    channels, days from START_DATE. extra_channels appends that many AR(1) covariates
+    ('covariate_0', ...) after them, for runs with more input features.
+    """
+    from features import DERIVED_CHANNELS, FEATURE_CHANNELS, STATIC_COLUMNS, derive_changes
+
+    table = node_table(n_nodes, seed)
+    table['Population_Density'] = table['Population'] / 1e3
+    rng = np.random.default_rng(seed)
+
+    covariates = [f'covariate_{k}' for k in range(extra_channels)]
+    channels = FEATURE_CHANNELS + DERIVED_CHANNELS + covariates
+    features = np.zeros((n_nodes, days, len(channels)), dtype=np.float32)
+    for name, series in sir_cases(table, days, seed).items():
+        features[..., channels.index(name)] = series
+    derive_changes(features, channels)
+
+    for name in covariates:
+        noise = rng.standard_normal((n_nodes, days)).astype(np.float32)
+        for day in range(1, days):
+            noise[:, day] += 0.9 * noise[:, day - 1]
+        features[..., channels.index(name)] = noise
+
+    return {
+        'states': table['State'].to_numpy(dtype=str),
+        'dates': (np.datetime64(START_DATE) + np.arange(days)).astype(str),
+        'static': table[STATIC_COLUMNS].to_numpy(dtype=np.float64),
+        'features': features,
+        'channels': np.asarray(channels, dtype=str),
+    }
+
+
+def write_sources(out_dir, n_states, days, counties_per_state=3, seed=42):
+    """
+    The case, county metadata and covid data CSVs of merge_sources for n_states synthetic
+    states of counties_per_state counties each, days from START_DATE (merge_sources keeps
+    the 2020 ones). Returns (cases_path, metadata_path, other_covid_data_path).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    counties = node_table(n_states * counties_per_state, seed)
+    counties['state_name'] = [f'State {i // counties_per_state}' for i in range(len(counties))]
+    metadata = pd.DataFrame({
+        'state_name': counties['state_name'],
+        'county': counties['State'],
+        'population': counties['Population'],
+        'density': counties['Population'] / 1e3,
+        'lat': counties['Latitude'],
+        'lng': counties['Longitude'],
+    })
+
+    # the state curves are simulated on the state-level table merge_sources builds
+    states = metadata.groupby('state_name', sort=False).agg(
+        {'population': 'sum', 'lat': 'mean', 'lng': 'mean'}).reset_index()
+    states = states.rename(columns={'state_name': 'State', 'population': 'Population', 'lat': 'Latitude',
+                                    'lng': 'Longitude'})
+    series = sir_cases(states, days, seed)
+    dates = pd.date_range(START_DATE, periods=days)
+
+    cases = pd.DataFrame(series['Confirmed_Cases'].astype(np.int64),
+                         columns=[f'{d.month}/{d.day}/{d.year % 100:02d}' for d in dates])
+    cases.insert(0, 'State', states['State'])
+
+    n = len(states)
+    other = pd.DataFrame({
+        'state': np.repeat(states['State'].to_numpy(), days),
+        'date_today': np.tile(dates.strftime('%Y-%m-%d'), n),
+        'longitude': 0.0,
+        'latitude': 0.0,
+        'fips': 0,
+        'confirmed': series['Confirmed_Cases'].astype(np.int64).ravel(),
+        'active': series['Active_Cases'].astype(np.int64).ravel(),
+        'hospitalization': np.round(series['Active_Cases'] * 0.05).astype(np.int64).ravel(),
+        'deaths': series['Deaths'].astype(np.int64).ravel(),
+        'recovered': series['Recovered_Cases'].astype(np.int64).ravel(),
+        'new_cases': series['New_cases'].astype(np.int64).ravel(),
+    })
+
+    paths = tuple(os.path.join(out_dir, name) for name in
+                  ['state_cases_data.csv', 'metadata.csv', 'state_covid_data_2020.csv'])
+    cases.to_csv(paths[0], index=False)
+    metadata.to_csv(paths[1], index=False)
+    other.to_csv(paths[2], index=False)
+    return paths
@@ -0,0 +1,261 @@
+"""Checkpoints written off the training thread, with best-k / last-n retention and exact resume.
+
+A checkpoint is one torch.save bundle with everything needed to carry on or to serve:
+
+    state, optimizer     as save_checkpoint writes them, so load_checkpoint and serve.py read it too
+    readout              the model's readout ('node' or 'global'), as save_checkpoint writes it
+    scheduler            its state_dict, if one was passed
+    epoch, metric        the epoch just finished and the validation metric it was ranked by
+    rng                  python / numpy / torch (and CUDA) generator states at the end of the epoch,
+                         and the shuffling generator's of the training DataLoader if one was passed
+    history              the caller's loss curves etc., restored as they were
+    normaliser           the dInf mean / std the inputs were normalised with
+    graph_hash           graph_hash of the graph the model was trained on
+
+    checkpoints = CheckpointManager('checkpoints', best_k=3, last_n=2, normaliser=normaliser, graph=g)
+    for epoch in range(start_epoch, epochs):
+        ...
+        checkpoints.save(epoch, model, optimizer, metric=val_loss.item(), history=history)
+    checkpoints.close()
+
+save copies the tensors to CPU on the calling thread (the training step may then change the
+parameters freely) and leaves serialising and writing to a background thread; files are written
+under a temporary name and renamed into place. Files outside the best_k lowest metrics and the
+last_n epochs are deleted, and checkpoints.json in the directory lists the rest. To pick a
+crashed run up where it stopped:
+
+    bundle = checkpoints.resume(model, optimizer)
+    start_epoch, history = bundle['epoch'] + 1, bundle['history']
+"""
+
+import copy
+import hashlib
+import json
+import os
+import random
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+# bump when the bundle layout changes
+CHECKPOINT_VERSION = 1
+MANIFEST_FILE = 'checkpoints.json'
+
+
+def graph_hash(g):
+    """hash of a dgl graph's node count and edges, in edge order"""
+    src, dst = g.edges()
+    digest = hashlib.sha256(str(g.num_nodes()).encode())
+    for index in (src, dst):
+        digest.update(index.cpu().to(torch.int64).numpy().tobytes())
+    return digest.hexdigest()[:20]
+
+
+def rng_state():
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def _snapshot(obj):
+    """a CPU copy of obj's tensors and arrays, nothing shared with the live training state"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((key, _snapshot(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(value) for value in obj)
+    return copy.deepcopy(obj)
+
+
+def _write_json(obj, path):
+    with open(path, 'w') as f:
+        json.dump(obj, f, indent=2)
+
+
+def _replace(write, path):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class CheckpointManager:
+    """
+    directory: where the epoch_<n>.pth files and checkpoints.json go (an existing manifest is
+    picked up, so a resumed run keeps evicting the same set).
+    best_k / last_n: how many of the best (lowest metric, or highest with mode='max') and of
+    the most recent checkpoints to keep.
+    best_file: also keep the current best bundle under this name, e.g. the
+    best_stan_model1.pth serve.py loads.
+    normaliser, graph: bundled with every checkpoint (graph as its graph_hash).
+    background=False writes on the calling thread, for debugging.
+    """
+
+    def __init__(self, directory='checkpoints', best_k=3, last_n=2, mode='min', best_file=None, normaliser=None,
+                 graph=None, background=True):
+        if mode not in ('min', 'max'):
+            raise ValueError(f"unknown mode {mode!r}, expected 'min' or 'max'")
+        self.directory = directory
+        self.best_k = best_k
+        self.last_n = last_n
+        self.mode = mode
+        self.best_file = best_file
+        self.normaliser = _snapshot(normaliser)
+        self.graph_hash = None if graph is None else graph_hash(graph)
+        os.makedirs(directory, exist_ok=True)
+
+        self.entries = []
+        manifest = os.path.join(directory, MANIFEST_FILE)
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                self.entries = [entry for entry in json.load(f)['checkpoints']
+                                if os.path.exists(os.path.join(directory, entry['file']))]
+
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self._pending = []
+
+    def _rank(self, entry):
+        return entry['metric'] if self.mode == 'min' else -entry['metric']
+
+    def best(self):
+        """path of the best checkpoint so far, None if no epoch had a metric"""
+        scored = [entry for entry in self.entries if entry['metric'] is not None]
+        if not scored:
+            return None
+        return os.path.join(self.directory, min(scored, key=self._rank)['file'])
+
+    def latest(self):
+        """path of the most recent checkpoint, None if there is none"""
+        if not self.entries:
+            return None
+        return os.path.join(self.directory, max(self.entries, key=lambda entry: entry['epoch'])['file'])
+
+    def save(self, epoch, model, optimizer, metric=None, scheduler=None, history=None, loader=None):
+        """
+        Checkpoint of the epoch just finished, ranked by metric (e.g. the validation loss; None
+        only counts towards last_n). loader, a shuffling DataLoader (windows.make_loader), has
+        its generator saved so a resumed run draws the same batch order. Returns the path it
+        will be written to.
+        """
+        self._raise_errors()
+        rng = rng_state()
+        if loader is not None:
+            rng['loader'] = loader.generator.get_state()
+        bundle = {
+            'version': CHECKPOINT_VERSION,
+            'epoch': epoch,
+            'metric': None if metric is None else float(metric),
+            'state': _snapshot(getattr(model, 'module', model).state_dict()),
+            'optimizer': _snapshot(optimizer.state_dict()),
+            'readout': getattr(getattr(model, 'module', model), 'readout', None),
+            'scheduler': None if scheduler is None else _snapshot(scheduler.state_dict()),
+            'rng': rng,
+            'history': _snapshot(history),
+            'normaliser': self.normaliser,
+            'graph_hash': self.graph_hash,
+        }
+        file = f'epoch_{epoch:05d}.pth'
+        if self._executor is None:
+            self._write(file, bundle)
+        else:
+            self._pending.append(self._executor.submit(self._write, file, bundle))
+        return os.path.join(self.directory, file)
+
+    def _write(self, file, bundle):
+        path = os.path.join(self.directory, file)
+        _replace(lambda tmp_path: torch.save(bundle, tmp_path), path)
+
+        self.entries = [entry for entry in self.entries if entry['file'] != file]
+        self.entries.append({'file': file, 'epoch': bundle['epoch'], 'metric': bundle['metric']})
+        self._evict()
+        if self.best_file is not None and self.best() == path:
+            _replace(lambda tmp_path: shutil.copyfile(path, tmp_path), self.best_file)
+        manifest = {'best': self.best(), 'latest': self.latest(), 'checkpoints': self.entries}
+        _replace(lambda tmp_path: _write_json(manifest, tmp_path), os.path.join(self.directory, MANIFEST_FILE))
+
+    def _evict(self):
+        scored = sorted((entry for entry in self.entries if entry['metric'] is not None), key=self._rank)
+        recent = sorted(self.entries, key=lambda entry: entry['epoch'], reverse=True)
+        keep = {entry['file'] for entry in scored[:self.best_k] + recent[:self.last_n]}
+        for entry in self.entries:
+            if entry['file'] not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, entry['file']))
+                except FileNotFoundError:
+                    pass
+        self.entries = sorted((entry for entry in self.entries if entry['file'] in keep),
+                              key=lambda entry: entry['epoch'])
+
+    def _raise_errors(self):
+        done = [future for future in self._pending if future.done()]
+        self._pending = [future for future in self._pending if not future.done()]
+        for future in done:
+            future.result()
+
+    def wait(self):
+        """blocks until every checkpoint saved so far is on disk, re-raising a failed write"""
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        self.wait()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def resume(self, model, optimizer=None, scheduler=None, path=None, device=None, loader=None):
+        """
+        Restores model / optimizer / scheduler and the RNG states from path (default: the latest
+        checkpoint) and returns the bundle; training continues with epoch bundle['epoch'] + 1.
+        loader is the training DataLoader to restore the shuffling generator of, created before
+        resuming. Raises ValueError if the checkpoint was trained on a different graph, or if
+        loader is given and the checkpoint has no loader state.
+        """
+        self.wait()
+        path = path or self.latest()
+        if path is None:
+            raise FileNotFoundError(f'no checkpoint in {self.directory}')
+        bundle = load_bundle(path, device)
+        if self.graph_hash is not None and bundle['graph_hash'] not in (None, self.graph_hash):
+            raise ValueError(f'{path} was trained on graph {bundle["graph_hash"]}, this one is {self.graph_hash}')
+
+        getattr(model, 'module', model).load_state_dict(bundle['state'])
+        if optimizer is not None:
+            optimizer.load_state_dict(bundle['optimizer'])
+        if scheduler is not None and bundle['scheduler'] is not None:
+            scheduler.load_state_dict(bundle['scheduler'])
+        set_rng_state(bundle['rng'])
+        if loader is not None:
+            if 'loader' not in bundle['rng']:
+                raise ValueError(f'{path} was saved without a loader, its batch order cannot be resumed')
+            loader.generator.set_state(bundle['rng']['loader'])
+        return bundle
+
+
+def load_bundle(path, device=None):
+    """a checkpoint bundle in one read, the tensors on device"""
+    bundle = torch.load(path, map_location=device)
+    if bundle.get('version', CHECKPOINT_VERSION) > CHECKPOINT_VERSION:
+        raise ValueError(f'{path} is checkpoint version {bundle["version"]}, this reads up to {CHECKPOINT_VERSION}')
+    return bundle
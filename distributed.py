@@ -0,0 +1,184 @@
+"""Data-parallel training over CPU processes: DistributedDataParallel on the gloo backend.
+
+Run from the repository root after gnn_final.py has written the feature stream:
+
+    python distributed.py --nprocs 4 --epochs 50
+    python distributed.py --nprocs 4 --shard regions
+
+The parent prepares the train / validation windows once (as tune.py does) and builds the
+graph into a GraphCache next to them; every rank memory-maps the same windows and loads the
+same cached graph, which the model only ever reads. Each rank then trains on its shard:
+--shard windows gives every rank its own chunks of seq_len consecutive windows (a
+DistributedSampler over the chunks, all regions in each), --shard regions gives every rank
+every window for its own regions. DDP averages the gradients, so all ranks step to the same
+parameters; rank 0 alone validates and writes the best model as {'state', 'optimizer'}.
+"""
+
+import argparse
+import math
+import os
+import socket
+import time
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DistributedSampler
+
+from graph_cache import GraphCache
+from models import GNN, initialise_weights
+from training import forecast_loss, mae, region_targets, save_checkpoint, validation_loss
+from tune import load_shared, prepare
+
+TRAIN_ARRAYS = ['train_x', 'train_cI', 'train_I', 'train_yI']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def window_chunks(n_windows, seq_len, batch_size, rank, world_size, epoch, seed=42):
+    """
+    This rank's batches of chunk start windows for the epoch. Every rank gets the same
+    number of batches (DistributedSampler pads by repeating chunks), so the all-reduces line up.
+    """
+    starts = list(range(0, n_windows - seq_len + 1, seq_len))
+    sampler = DistributedSampler(starts, num_replicas=world_size, rank=rank, shuffle=True, seed=seed)
+    sampler.set_epoch(epoch)
+    mine = [starts[i] for i in sampler]
+    return [mine[i:i + batch_size] for i in range(0, len(mine), batch_size)]
+
+
+def region_shard(num_regions, rank, world_size):
+    """
+    This rank's regions and the factor its loss is scaled by. Each rank's loss is a mean over
+    its own regions and DDP averages the ranks' gradients, so when world_size does not divide
+    num_regions the shards are weighted by their size: the update is then the single-process
+    one of the mean over all regions.
+    """
+    regions = torch.arange(num_regions)[rank::world_size]
+    return regions, len(regions) * world_size / num_regions
+
+
+def stack_chunks(array, starts, seq_len):
+    # (n_loc, windows, ...) -> (batch, n_loc, seq_len, ...)
+    return torch.stack([array[:, start:start + seq_len] for start in starts])
+
+
+def train(rank, world_size, args, results=None):
+    """
+    One rank of the run; with results (a queue) rank 0 puts its per-epoch seconds there
+    instead of printing them.
+    """
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    torch.set_num_threads(args.threads or max(1, (os.cpu_count() or 1) // world_size))
+
+    data, table = load_shared(args.cache_dir)
+    g = GraphCache(os.path.join(args.cache_dir, 'graphs')).graph(
+        table, threshold=args.threshold, min_connections=args.min_connections)
+
+    # the same initial parameters everywhere (DDP also broadcasts rank 0's on wrapping)
+    torch.manual_seed(args.seed)
+    device = torch.device('cpu')
+    history_window = data['train_x'].shape[-1]
+    pred_window = data['train_yI'].shape[-1]
+    model = GNN(g, history_window, args.hidden_dim, args.hidden_dim, args.hidden_dim, args.num_heads,
+                pred_window, device, readout='node')
+    model.apply(initialise_weights)
+    ddp_model = DistributedDataParallel(model)
+    optimizer = torch.optim.Adam(ddp_model.parameters(), lr=args.lr)
+    criterion = nn.MSELoss()
+
+    all_regions = torch.arange(len(table))
+    n_windows = data['train_x'].shape[1]
+    seq_len = min(args.seq_len, n_windows)
+    best, epoch_seconds = math.inf, []
+    for epoch in range(args.epochs):
+        start = time.perf_counter()
+        ddp_model.train()
+        epoch_loss, epoch_mae = [], []
+        loss_scale = 1.0
+        if args.shard == 'regions':
+            regions, loss_scale = region_shard(len(all_regions), rank, world_size)
+            batches = [(data['train_x'], data['train_cI'], data['train_I'], data['train_yI'])]
+        else:
+            regions = all_regions
+            batches = [tuple(stack_chunks(data[name], starts, seq_len) for name in TRAIN_ARRAYS)
+                       for starts in window_chunks(n_windows, seq_len, args.batch_size, rank, world_size, epoch,
+                                                   args.seed)]
+
+        for x, cI, I, yI in batches:
+            optimizer.zero_grad()
+            loss, active_pred, _, _ = forecast_loss(ddp_model, x, cI, data['N'], I, yI, data['dInf_mean'],
+                                                    data['dInf_std'], regions, criterion)
+            (loss * loss_scale).backward()
+            optimizer.step()
+            epoch_loss.append(loss.item())
+            epoch_mae.append(mae(active_pred, region_targets(model, regions, yI, x.dim() == 4)).item())
+        epoch_seconds.append(time.perf_counter() - start)
+
+        if rank == 0 and not args.no_validation:
+            # physics branch only, as gnn_final.py keeps its best model on
+            val_loss = validation_loss(model, data['val_x'], data['val_cI'], data['N'], data['val_I'], data['val_yI'],
+                                       data['dInf_mean'], data['dInf_std'], all_regions, criterion)[0].item()
+            if val_loss < best:
+                best = val_loss
+                save_checkpoint(args.checkpoint, model, optimizer)
+                print('-----Save best model-----')
+            if results is None:
+                print(f'Epoch {epoch}, Loss {np.mean(epoch_loss):.2f}, MAE {np.mean(epoch_mae):.2f}, '
+                      f'Val loss {val_loss:.2f}, {epoch_seconds[-1]:.2f}s on {world_size} processes')
+
+    if rank == 0 and results is not None:
+        results.put(epoch_seconds)
+    dist.destroy_process_group()
+
+
+def launch(args, nprocs, results=None):
+    """runs train on nprocs local processes, rendezvousing on a free localhost port"""
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(free_port())
+    mp.spawn(train, args=(nprocs, args, results), nprocs=nprocs, join=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stream', default='feature_stream')
+    parser.add_argument('--cache-dir', default='ddp_cache')
+    parser.add_argument('--nprocs', type=int, default=max(1, min(4, os.cpu_count() or 1)))
+    parser.add_argument('--threads', type=int, default=None, help='torch threads per process (default: cores / nprocs)')
+    parser.add_argument('--shard', choices=['windows', 'regions'], default='windows')
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--seq-len', type=int, default=20, help='windows per chunk with --shard windows')
+    parser.add_argument('--batch-size', type=int, default=1, help='chunks per step and process with --shard windows')
+    parser.add_argument('--hidden-dim', type=int, default=32)
+    parser.add_argument('--num-heads', type=int, default=1)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--threshold', type=float, default=17)
+    parser.add_argument('--min-connections', type=int, default=5)
+    parser.add_argument('--checkpoint', default='best_stan_model1.pth')
+    parser.add_argument('--no-validation', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser
+
+
+def prepare_run(args):
+    """windows and graph on disk for the ranks to share"""
+    prepare(args.stream, args.cache_dir)
+    _, table = load_shared(args.cache_dir)
+    GraphCache(os.path.join(args.cache_dir, 'graphs')).edges(table, args.threshold, args.min_connections)
+
+
+def main():
+    args = build_parser().parse_args()
+    prepare_run(args)
+    launch(args, args.nprocs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""K independently initialised GNNs trained together in one vectorised pass.
+
+The members are ordinary GNN modules (member k seeded with seed + k) whose parameters are
+stacked along a leading member dim on every forward, so autograd hands each member exactly
+the gradient its own run would get and the optimizer treats them as the K models they are.
+The pass shares the inputs and the graph:
+
+  - GAT layers: the members' heads run as K x num_heads heads of one projection and one
+    set of DGL kernels (gat_propagate), the first layer's input projected once for all;
+  - GRU: the K cells step together, one batched matmul per window (member_gru_sequence);
+  - heads and SIR rollout: torch.func.vmap over the members' stacked head weights.
+
+torch.func.vmap has no batching rules for DGL's kernels or for aten::gru, hence the
+explicit stacking for those two.
+
+    model = GNNEnsemble(g, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads, pred_window, device)
+    loss, active_pred, phy_active, _ = ensemble_loss(model, train_x, train_cI, N, train_I, train_yI,
+                                                     dInf_mean, dInf_std, regions, criterion)
+    bands = summarise(denormalise(active_pred, regions, dInf_mean, dInf_std))
+
+The saving over K separate runs is the per-op overhead they would each pay, so it is
+largest for few regions or short chunks of windows; model.members[k] is member k as a plain
+GNN, e.g. for save_checkpoint.
+
+Stacking needs every member to have the same architecture (in_dim, hidden sizes, gru_dim,
+num_heads, pred_window, readout). Hyperparameter variants that leave the shapes alone, such
+as seeds or per-member learning rates (one optimizer param group per member), fit in one
+ensemble; variants of the layer sizes are separate GNNEnsembles, one per architecture.
+"""
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.func import vmap
+
+from models import GNN, gat_propagate, initialise_weights, sir_rollout
+from training import forecast, normalise_phy, region_targets
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def _stack(modules, name):
+    return torch.stack([module.get_parameter(name) for module in modules])
+
+
+def member_gru_sequence(inputs, h, w_ih, w_hh, b_ih, b_hh):
+    """
+    K GRU cells over their own inputs (K, batch, timestep, in) from h (K, batch, hidden), with
+    stacked weights (K, 3 * hidden, ...) / biases (K, 3 * hidden); every step's state
+    (K, batch, timestep, hidden). nn.GRUCell's arithmetic, the members batched in each matmul:
+    the input terms of all steps in one einsum, then one baddbmm per step.
+    """
+    # time-major, so each step's slice is a separate tensor for autograd rather than a strided view
+    input_gates = (torch.einsum('kbti,kgi->tkbg', inputs, w_ih) + b_ih[:, None]).unbind(0)
+    w_hh_t, b_hh = w_hh.transpose(1, 2), b_hh[:, None]
+    out = []
+    for gates in input_gates:
+        hidden_gates = torch.baddbmm(b_hh, h, w_hh_t)
+        i_r, i_z, i_n = gates.chunk(3, dim=-1)
+        h_r, h_z, h_n = hidden_gates.chunk(3, dim=-1)
+        r = torch.sigmoid(i_r + h_r)
+        z = torch.sigmoid(i_z + h_z)
+        n = torch.tanh(i_n + r * h_n)
+        h = n + z * (h - n)
+        out.append(h)
+    return torch.stack(out, dim=2)
+
+
+def _member_heads(w_I, b_I, w_sir, b_sir, all_h, cI, I, N, pred_window: int):
+    hc = torch.cat((all_h, cI[:, :all_h.shape[1], None]), dim=-1)
+    new_I = F.linear(hc, w_I, b_I)
+    alpha = F.linear(hc, w_sir, b_sir)[..., 0]
+    alpha_scaled = torch.sigmoid(alpha)
+    phy_I = sir_rollout(alpha_scaled, I[:, :all_h.shape[1]], N, pred_window)
+    return new_I, phy_I, alpha_scaled
+
+
+def _shapes(model):
+    return {name: tuple(param.shape) for name, param in model.named_parameters()}
+
+
+def _check_member(k, member, expected, readout):
+    """ValueError unless member k has the parameter shapes and readout the ensemble stacks"""
+    if getattr(member, 'readout', None) != readout:
+        raise ValueError(f"member {k} has readout={getattr(member, 'readout', None)!r}, the ensemble {readout!r}")
+    shapes = _shapes(member)
+    for name in sorted(set(shapes) | set(expected)):
+        if shapes.get(name) != expected.get(name):
+            raise ValueError(f'member {k} has {name} of shape {shapes.get(name)}, the ensemble expects '
+                             f'{expected.get(name)}: members are stacked, so they need identical sizes '
+                             f'(one GNNEnsemble per architecture)')
+
+
+class GNNEnsemble(nn.Module):
+    """
+    num_members GNNs with the same sizes, called like one: forward takes the same inputs as
+    GNN.forward and returns (new_I, phy_I, h), each with a leading member dim. h, if given,
+    is (num_members, num_out, gru_dim) as returned. Execution options of GNN (debug,
+    compile, autocast, blocks) are not supported; the members' own forward still works.
+    members: existing GNNs (e.g. loaded from checkpoints) to use instead of num_members new
+    ones; they must all have the sizes and readout given, otherwise ValueError.
+    """
+
+    def __init__(self, g, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads, pred_window, device,
+                 num_members=16, seed=42, readout='node', members=None):
+        super(GNNEnsemble, self).__init__()
+        self.g = g
+        if members is None:
+            members = []
+            for k in range(num_members):
+                torch.manual_seed(seed + k)
+                member = GNN(g, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads, pred_window, device,
+                             readout=readout)
+                member.apply(initialise_weights)
+                members.append(member)
+        else:
+            expected = _shapes(GNN(g, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads, pred_window, device,
+                                   readout=readout))
+            for k, member in enumerate(members):
+                _check_member(k, member, expected, readout)
+        self.members = nn.ModuleList(members)
+
+        self.num_heads = num_heads
+        self.pred_window = pred_window
+        self.gru_dim = gru_dim
+        self.device = device
+        self.readout = readout
+
+    def __len__(self):
+        return len(self.members)
+
+    def layer_params(self, layer):
+        """the K members' heads of one MHGAT layer as K * num_heads stacked heads"""
+        heads = [head for member in self.members for head in member.get_submodule(layer).heads]
+        out_dim = heads[0].fc.out_features
+        weight = torch.stack([head.fc.weight for head in heads])
+        bias = torch.stack([head.fc.bias for head in heads])
+        attn = torch.stack([head.attn_fc.weight.view(2, out_dim) for head in heads])
+        attn_bias = torch.stack([head.attn_fc.bias for head in heads])
+        return weight, bias, attn, attn_bias
+
+    def graph_embed(self, dynamic):
+        """(num_loc, ..., n_feat) shared input -> (num_loc or 1, ..., K, hidden_dim2)"""
+        K, H = len(self), self.num_heads
+
+        # layer 1: one projection of the shared input for all members' heads
+        weight, bias, attn, attn_bias = self.layer_params('layer1')
+        z = F.linear(dynamic, weight.flatten(0, 1), bias.flatten())
+        cur_h = gat_propagate(self.g, z.view(*dynamic.shape[:-1], K * H, -1), attn, attn_bias)
+        # (..., K * H, out) -> (..., K, H * out), each member's heads concatenated as MHGAT does
+        cur_h = F.elu(cur_h.view(*cur_h.shape[:-2], K, -1))
+
+        # layer 2: a single head per member on the member's own embedding
+        weight, bias, attn, attn_bias = self.layer_params('layer2')
+        z = torch.einsum('...ki,koi->...ko', cur_h, weight) + bias
+        cur_h = F.elu(gat_propagate(self.g, z, attn, attn_bias))
+
+        if self.readout == 'global':
+            cur_h = torch.max(cur_h, 0, keepdim=True)[0]
+        return cur_h
+
+    def recurrence(self, inputs, h):
+        """the members' GRUs: inputs (K, num_out, T, in) from h (K, num_out, gru_dim)"""
+        return member_gru_sequence(inputs, h, *[_stack(self.members, f'gru.{name}')
+                                                for name in ['weight_ih', 'weight_hh', 'bias_ih', 'bias_hh']])
+
+    def forward(self, dynamic, cI, N, I, h=None, regions=None):
+        batched = dynamic.dim() == 4
+        if not batched:
+            dynamic = dynamic.unsqueeze(0)
+        if self.readout == 'global' and regions is not None:
+            raise ValueError("regions needs readout='node'")
+
+        # as in GNN.forward: one GRU row per sequence (global) or per sequence and region (node)
+        out_shape = cI.shape[:-1] if batched else (cI.shape[0] if self.readout == 'node' else 1,)
+        cI, I = cI.reshape(-1, cI.shape[-1]), I.reshape(-1, I.shape[-1])
+        num_out = cI.shape[0]
+        N = N.reshape(-1, 1)
+        if N.shape[0] not in (1, num_out):
+            N = N.repeat(num_out // N.shape[0], 1)
+
+        if h is None:
+            gain = nn.init.calculate_gain('relu')
+            h = torch.stack([nn.init.xavier_normal_(torch.zeros(num_out, self.gru_dim), gain=gain)
+                             for _ in self.members]).to(self.device)
+
+        # (num_loc or 1, batch, T, K, hidden) -> (K, num_out, T, hidden)
+        cur_h = self.graph_embed(dynamic.transpose(0, 1))
+        if regions is not None:
+            cur_h = cur_h[regions]
+        cur_h = cur_h.transpose(0, 1).reshape(num_out, *cur_h.shape[2:]).permute(2, 0, 1, 3)
+
+        all_h = self.recurrence(cur_h, h)
+        heads = [_stack(self.members, name) for name in
+                 ['nn_res_I.weight', 'nn_res_I.bias', 'nn_res_sir.weight', 'nn_res_sir.bias']]
+        new_I, phy_I, alpha_scaled = vmap(_member_heads, in_dims=(0, 0, 0, 0, 0, None, None, None, None))(
+            *heads, all_h, cI, I, N, self.pred_window)
+        self.alpha_scaled = alpha_scaled.detach()
+
+        timestep = all_h.shape[2]
+        new_I = new_I.reshape(len(self), *out_shape, timestep, self.pred_window)
+        phy_I = phy_I.reshape(len(self), *out_shape, timestep, self.pred_window)
+        return new_I, phy_I, all_h[:, :, -1]
+
+
+def ensemble_loss(model, x, cI, N, I, yI, dInf_mean, dInf_std, regions, criterion, phy_weight=0.1, h=None):
+    """
+    forecast_loss for a GNNEnsemble: the members' losses summed, so each member trains
+    exactly as it would alone. criterion must average (e.g. nn.MSELoss()).
+    Returns (loss, active_pred, phy_active, h) with the member dim leading.
+    """
+    active_pred, phy_active, h = forecast(model, x, cI, N, I, regions, h=h)
+    phy_active = normalise_phy(phy_active, regions, dInf_mean, dInf_std)
+    target = region_targets(model, regions, yI, x.dim() == 4).expand_as(active_pred)
+
+    loss = len(model) * (criterion(active_pred, target) + phy_weight * criterion(phy_active, target))
+    return loss, active_pred, phy_active, h
+
+
+def summarise(pred, quantiles=DEFAULT_QUANTILES):
+    """
+    Ensemble forecast of members' predictions (K, ...): {'mean': (...), 'quantiles': (len(quantiles), ...),
+    'levels': the quantile levels}.
+    """
+    levels = torch.tensor(quantiles, dtype=pred.dtype, device=pred.device)
+    return {'mean': pred.mean(dim=0), 'quantiles': torch.quantile(pred, levels, dim=0), 'levels': levels}
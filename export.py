@@ -0,0 +1,264 @@
+"""Export of a trained GNN to TorchScript or ONNX with its graph baked in, for serving without DGL.
+
+StaticGNN is GNN.forward's eval-mode arithmetic in plain torch ops: the graph's edges are a
+fixed index tensor of every node's in-neighbours (padded to the largest in-degree, with a
+mask), so attention is a masked softmax over gathered rows and needs no scatter ops (which
+ONNX only has in later opsets), and the GRU is an nn.GRU carrying the cell's weights.
+export writes it as <output>.pt (torch.jit.script) or <output>.onnx (torch.onnx.export, the
+number of windows left dynamic), plus <output>.json with what runtime.py needs: the region
+names, the sizes, the dInf normaliser, the graph hash and, for readout='global', the index
+of the region the model forecasts. Serving then only imports torch
+or onnxruntime and numpy (see runtime.py):
+
+    python export.py --checkpoint best_stan_model1.pth --stream feature_stream --format onnx --output forecaster
+
+Checkpoints written before the readout was saved with them need --readout node / global.
+
+The exported model forecasts every region from the windows given and needs the GRU state
+h explicitly (zeros for a cold start); it is checked against the GNN on random inputs
+before anything is written.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from checkpoint import graph_hash
+from models import sir_rollout
+from runtime import INPUT_NAMES
+
+EXPORT_VERSION = 1
+FORMATS = {'torchscript': '.pt', 'onnx': '.onnx'}
+OUTPUT_NAMES = ['active_pred', 'phy_active', 'h_out']
+
+
+def neighbour_table(g):
+    """
+    The in-edges of every node of a dgl graph as a padded (num_nodes, max_in_degree) table of
+    source nodes, and the mask of its real entries.
+    """
+    src, dst = (index.cpu().to(torch.int64) for index in g.edges())
+    num_nodes = g.num_nodes()
+    order = torch.argsort(dst, stable=True)
+    src, dst = src[order], dst[order]
+    degree = torch.bincount(dst, minlength=num_nodes)
+    # position of each edge among its destination's in-edges
+    slot = torch.arange(len(dst)) - (torch.cumsum(degree, 0) - degree)[dst]
+
+    width = max(int(degree.max()), 1) if num_nodes else 1
+    neighbours = torch.zeros(num_nodes, width, dtype=torch.int64)
+    mask = torch.zeros(num_nodes, width, dtype=torch.bool)
+    neighbours[dst, slot] = src
+    mask[dst, slot] = True
+    return neighbours, mask
+
+
+def _stacked_heads(heads):
+    """gat_heads' stacked projection and attention weights of an MHGAT layer's heads"""
+    out_dim = heads[0].fc.out_features
+    return (torch.cat([head.fc.weight for head in heads]).detach().clone(),
+            torch.cat([head.fc.bias for head in heads]).detach().clone(),
+            torch.stack([head.attn_fc.weight.view(2, out_dim) for head in heads]).detach().clone(),
+            torch.cat([head.attn_fc.bias for head in heads]).detach().clone())
+
+
+class StaticGNN(nn.Module):
+    """
+    A trained GNN frozen on its graph, for export.
+    forward(dynamic, cI, N, I, h) takes unbatched inputs for all regions at once:
+    dynamic (num_nodes, windows, in_dim), cI / I (num_out, windows), N (num_out, 1) and
+    h (num_out, gru_dim), num_out being num_nodes for readout='node' and 1 for 'global'.
+    Returns (active_pred, phy_active, h) as GNN.forward does in eval mode.
+    """
+
+    def __init__(self, model):
+        super(StaticGNN, self).__init__()
+        if getattr(model, 'assignment', None) is not None:
+            raise ValueError('HierarchicalGNN pools counties into states, export the state-level GNN')
+        neighbours, mask = neighbour_table(model.g)
+        self.register_buffer('neighbours', neighbours)
+        self.register_buffer('mask', mask)
+        self.num_nodes = model.g.num_nodes()
+        self.num_heads = len(model.layer1.heads)
+        self.node_readout = model.readout == 'node'
+        self.pred_window = model.pred_window
+
+        for layer in ['layer1', 'layer2']:
+            weight, bias, attn, attn_bias = _stacked_heads(model.get_submodule(layer).heads)
+            self.register_buffer(f'{layer}_weight', weight)
+            self.register_buffer(f'{layer}_bias', bias)
+            self.register_buffer(f'{layer}_attn', attn)
+            self.register_buffer(f'{layer}_attn_bias', attn_bias)
+
+        self.gru = nn.GRU(model.gru.input_size, model.gru.hidden_size, batch_first=True)
+        self.gru.load_state_dict({f'{name}_l0': value for name, value in model.gru.state_dict().items()})
+        self.nn_res_I = nn.Linear(model.nn_res_I.in_features, model.nn_res_I.out_features)
+        self.nn_res_I.load_state_dict(model.nn_res_I.state_dict())
+        self.nn_res_sir = nn.Linear(model.nn_res_sir.in_features, model.nn_res_sir.out_features)
+        self.nn_res_sir.load_state_dict(model.nn_res_sir.state_dict())
+        self.requires_grad_(False)
+        self.eval()
+
+    def gat(self, h, weight, bias, attn, attn_bias, num_heads: int):
+        """gat_propagate over the neighbour table: h (num_nodes, windows, in) -> (num_nodes, windows, heads * out)"""
+        z = F.linear(h, weight, bias)
+        z = z.view(z.shape[0], z.shape[1], num_heads, -1)
+        el = (z * attn[:, 0]).sum(dim=-1)
+        er = (z * attn[:, 1]).sum(dim=-1)
+        # (num_nodes, max_in_degree, windows, heads), the padding slots masked out of the softmax
+        e = F.leaky_relu(el[self.neighbours] + er.unsqueeze(1) + attn_bias)
+        mask = self.mask.view(self.mask.shape[0], self.mask.shape[1], 1, 1)
+        a = torch.softmax(e.masked_fill(~mask, -1e30), dim=1) * mask
+        out = (z[self.neighbours] * a.unsqueeze(-1)).sum(dim=1)
+        return out.flatten(2)
+
+    def forward(self, dynamic, cI, N, I, h):
+        cur_h = F.elu(self.gat(dynamic, self.layer1_weight, self.layer1_bias, self.layer1_attn,
+                               self.layer1_attn_bias, self.num_heads))
+        cur_h = F.elu(self.gat(cur_h, self.layer2_weight, self.layer2_bias, self.layer2_attn,
+                               self.layer2_attn_bias, 1))
+        if not self.node_readout:
+            cur_h = torch.max(cur_h, 0, keepdim=True)[0]
+
+        all_h, _ = self.gru(cur_h, h.unsqueeze(0))
+        hc = torch.cat((all_h, cI.unsqueeze(-1)), dim=-1)
+        new_I = self.nn_res_I(hc)
+        alpha_scaled = torch.sigmoid(self.nn_res_sir(hc)[..., 0])
+        phy_I = sir_rollout(alpha_scaled, I, N, self.pred_window)
+        return new_I, phy_I, all_h[:, -1]
+
+
+def example_inputs(static, windows=3, seed=0):
+    """random inputs of the exported forward's shapes, N population-sized"""
+    generator = torch.Generator().manual_seed(seed)
+    num_out = static.num_nodes if static.node_readout else 1
+    in_dim = static.layer1_weight.shape[1]
+    return (torch.randn(static.num_nodes, windows, in_dim, generator=generator),
+            torch.rand(num_out, windows, generator=generator) * 1e3,
+            torch.full((num_out, 1), 1e6),
+            torch.rand(num_out, windows, generator=generator) * 1e4,
+            torch.randn(num_out, static.gru.hidden_size, generator=generator))
+
+
+def check_export(model, static, exported=None, atol=1e-4):
+    """the frozen model (and the exported one, a callable on numpy arrays) against GNN.forward"""
+    inputs = example_inputs(static)
+    dynamic, cI, N, I, h = inputs
+    was_training = model.training
+    model.eval()
+    with torch.no_grad():
+        regions = torch.arange(static.num_nodes) if static.node_readout else None
+        expected = model(dynamic.to(model.device), cI.to(model.device), N.to(model.device), I.to(model.device),
+                         h=h.to(model.device), regions=regions)
+        outputs = {'StaticGNN': static(*inputs)}
+    model.train(was_training)
+    if exported is not None:
+        outputs['exported'] = [torch.from_numpy(np.asarray(out)) for out in exported(*[x.numpy() for x in inputs])]
+    for source, out in outputs.items():
+        for name, got, want in zip(OUTPUT_NAMES, out, expected):
+            want = want.cpu()
+            if not torch.allclose(got, want, rtol=1e-4, atol=atol * max(1.0, want.abs().max().item())):
+                raise RuntimeError(f'{source} {name} differs from the GNN by {(got - want).abs().max().item():.3g}')
+
+
+def export(model, output, format='torchscript', states=None, normaliser=None, history_window=None, opset=17,
+           region=None):
+    """
+    Writes model as output + '.pt' or '.onnx' and output + '.json'; returns the model path.
+    normaliser is the {'dInf': {'mean', 'std'}} of the training inputs, states the region names,
+    region the index of the single region a readout='global' model forecasts.
+    """
+    if format not in FORMATS:
+        raise ValueError(f'unknown format {format!r}, expected one of {sorted(FORMATS)}')
+    if region is not None and model.readout != 'global':
+        raise ValueError("region is the forecast region of a readout='global' model, a 'node' one forecasts all")
+    static = StaticGNN(model).cpu()
+    check_export(model, static)
+
+    path = output + FORMATS[format]
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    if format == 'torchscript':
+        torch.jit.script(static).save(tmp_path)
+    else:
+        windows = {name: {1: 'windows'} for name in ['dynamic', 'cI', 'I', 'active_pred', 'phy_active']}
+        torch.onnx.export(static, example_inputs(static), tmp_path, input_names=INPUT_NAMES, output_names=OUTPUT_NAMES,
+                          opset_version=opset, dynamic_axes=windows)
+    os.replace(tmp_path, path)
+
+    meta = {
+        'version': EXPORT_VERSION,
+        'format': format,
+        'model': os.path.basename(path),
+        'readout': 'node' if static.node_readout else 'global',
+        'region': None if region is None else int(region),
+        'num_nodes': static.num_nodes,
+        'num_edges': model.g.num_edges(),
+        'graph_hash': graph_hash(model.g),
+        'in_dim': int(static.layer1_weight.shape[1]),
+        'history_window': history_window,
+        'gru_dim': static.gru.hidden_size,
+        'pred_window': static.pred_window,
+        'states': None if states is None else [str(state) for state in states],
+        'normaliser': None if normaliser is None else {
+            name: {key: np.asarray(value, dtype=np.float64).ravel().tolist() for key, value in stats.items()}
+            for name, stats in normaliser.items()},
+        'torch': torch.__version__,
+    }
+    with open(f'{output}.json.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(f'{output}.json.tmp', f'{output}.json')
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='best_stan_model1.pth')
+    parser.add_argument('--stream', default='feature_stream')
+    parser.add_argument('--threshold', type=float, default=17)
+    parser.add_argument('--min-connections', type=int, default=5)
+    parser.add_argument('--format', choices=sorted(FORMATS), default='torchscript')
+    parser.add_argument('--output', default='forecaster')
+    parser.add_argument('--readout', choices=['node', 'global'],
+                        help='the readout of a checkpoint that does not record it (checked against one that does)')
+    parser.add_argument('--region', help="the state a readout='global' model forecasts, for denormalising")
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    from features import STATIC_COLUMNS
+    from graph_builder import build_graph
+    from incremental import FeatureStream
+    from serve import model_from_checkpoint
+
+    stream = FeatureStream(args.stream)
+    table = pd.DataFrame(stream.static, columns=STATIC_COLUMNS)
+    table.insert(0, 'State', stream.states)
+    g = build_graph(table, threshold=args.threshold, min_connections=args.min_connections)
+
+    device = torch.device('cpu')
+    bundle = torch.load(args.checkpoint, map_location=device)
+    if bundle.get('graph_hash') not in (None, graph_hash(g)):
+        raise ValueError(f'{args.checkpoint} was trained on another graph than --threshold / --min-connections give')
+    if bundle.get('readout') is None and args.readout is None:
+        # the .json readout decides the shapes runtime.py feeds the model, it must not be guessed
+        raise ValueError(f'{args.checkpoint} does not record its readout, pass --readout')
+    model = model_from_checkpoint(args.checkpoint, g, device, readout=args.readout)
+    # the checkpoint's normaliser is the training one, the stream's has seen any days appended since
+    normaliser = bundle.get('normaliser') or stream.normaliser
+    region = None
+    if args.region is not None:
+        if args.region not in list(stream.states):
+            raise ValueError(f'--region {args.region!r} is not a region of {args.stream}')
+        region = list(stream.states).index(args.region)
+    path = export(model, args.output, args.format, states=stream.states, normaliser=normaliser,
+                  history_window=model.layer1.heads[0].fc.in_features, region=region)
+    print(f'wrote {path} and {args.output}.json')
+
+
+if __name__ == '__main__':
+    main()
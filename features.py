@@ -0,0 +1,79 @@
+"""Feature tensor assembly and normalisation."""
+
+import numpy as np
+import pandas as pd
+
+FEATURE_CHANNELS = ['Active_Cases', 'Confirmed_Cases', 'New_cases', 'Deaths', 'Recovered_Cases']
+STATIC_COLUMNS = ['Population', 'Population_Density', 'Longitude', 'Latitude']
+
+# day to day changes in active cases, recovered, and susceptible
+DERIVED_CHANNELS = ['dInf', 'dRec', 'dSus']
+
+
+def check_dates_aligned(data):
+    """
+    Every region must have exactly one row for every date in the table, otherwise the
+    per-region time axes would not line up.
+    """
+    n_dates = data['Date'].nunique()
+    per_state = data.groupby('State', sort=False)['Date'].agg(['size', 'nunique'])
+    bad = per_state[(per_state['size'] != n_dates) | (per_state['nunique'] != n_dates)]
+    if len(bad):
+        details = ', '.join(f'{state} ({row["nunique"]} dates, {row["size"]} rows)' for state, row in bad.head(5).iterrows())
+        raise ValueError(f'dates are not aligned across regions, expected {n_dates} dates each: {details}'
+                         + (f' and {len(bad) - 5} more' if len(bad) > 5 else ''))
+
+
+def derive_changes(features, channels):
+    """
+    Fills the dInf / dRec / dSus channels of features (n_loc, T, n_channels) in place from the
+    active and recovered channels. The first day's change is 0. Susceptible is population minus
+    active minus recovered, so with a constant population dSus = -(dInf + dRec).
+    """
+    index = {name: i for i, name in enumerate(channels)}
+    active, recovered = index['Active_Cases'], index['Recovered_Cases']
+    d_inf, d_rec, d_sus = index['dInf'], index['dRec'], index['dSus']
+
+    features[:, 0, [d_inf, d_rec, d_sus]] = 0
+    np.subtract(features[:, 1:, active], features[:, :-1, active], out=features[:, 1:, d_inf])
+    np.subtract(features[:, 1:, recovered], features[:, :-1, recovered], out=features[:, 1:, d_rec])
+    np.add(features[:, 1:, d_inf], features[:, 1:, d_rec], out=features[:, 1:, d_sus])
+    np.negative(features[:, 1:, d_sus], out=features[:, 1:, d_sus])
+    return features
+
+
+def assemble_features(data, channels=FEATURE_CHANNELS, derived=DERIVED_CHANNELS):
+    """
+    Long table (one row per state and date) to
+      states  - first-appearance order, like data['State'].unique()
+      dates   - sorted
+      static  - (n_loc, 4) float64 STATIC_COLUMNS
+      features - contiguous (n_loc, T, len(channels) + len(derived)) float32, the derived
+                 channels filled in place by derive_changes
+    in one pivot, after checking the dates line up across states.
+    """
+    check_dates_aligned(data)
+
+    states = data['State'].unique()
+    dates = np.sort(data['Date'].unique())
+    n_loc, timestep, n_base = len(states), len(dates), len(channels)
+
+    wide = data.pivot(index='State', columns='Date', values=list(channels))
+    wide = wide.reindex(index=states, columns=pd.MultiIndex.from_product([list(channels), dates]))
+
+    all_channels = list(channels) + list(derived)
+    features = np.empty((n_loc, timestep, len(all_channels)), dtype=np.float32)
+    features[..., :n_base] = wide.to_numpy(dtype=np.float32).reshape(n_loc, n_base, timestep).transpose(0, 2, 1)
+    if derived:
+        derive_changes(features, all_channels)
+
+    static = data.drop_duplicates('State').set_index('State').loc[states, STATIC_COLUMNS].to_numpy(dtype=np.float64)
+    return np.asarray(states, dtype=str), np.asarray(dates, dtype=str), static, features, all_channels
+
+
+#normalise features and store so we can unnormalise
+def normalize_feature(feature):
+    # statistics accumulate in float64 so float32 features normalise like float64 ones
+    mean = np.mean(feature, axis=1, keepdims=True, dtype=np.float64)
+    std = np.std(feature, axis=1, keepdims=True, dtype=np.float64)
+    return (feature - mean) / (std + 1e-5), mean, std
@@ -28,6 +28,17 @@ import matplotlib.pyplot as plt
 import optuna
 import random
 
+from features import normalize_feature
+from checkpoint import CheckpointManager
+from graph_cache import GraphCache
+from hierarchy import HierarchicalGNN, county_graph, county_table
+from incremental import FeatureStream
+from instrument import Instrument, NullInstrument
+from ingest import load_dataset, static_table
+from models import GNN, initialise_weights
+from training import EarlyStopping, RingBuffer, forecast_loss, mae, region_targets, tbptt_epoch, validation_loss
+from windows import WindowDataset, batch_to_device, make_loader, prep_data
+
 """upload all data and metadata and combine
 1. State Covid Cases (active cases only)
 2. State Metadata (county level)
@@ -35,169 +46,41 @@ import random
 """
 
 cases_path = '/content/state_cases_data.csv'
-cases_data = pd.read_csv(cases_path)
-print(cases_data.head())
-print(cases_data.columns)
-
 metadata_path = '/content/drive/MyDrive/metadata.csv'
-metadata = pd.read_csv(metadata_path)
-print(metadata.head())
-print(metadata.columns)
-
-# metadata is by county so we have to combine it to state level datat
-state_meta = metadata.groupby('state_name').agg({
-    'population': 'sum',  # sum of all the county populations in a state
-    'density': 'mean',    # calculate mean state population density
-    'lat': 'mean',        # calculate mean state latitude
-    'lng': 'mean'         # calculate mean state longitude
-}).reset_index()
-
-state_meta = state_meta.rename(columns={'state_name': 'State', 'population': 'Population', 'density': 'Population_Density', 'lat': 'Latitude', 'lng': 'Longitude'})
-print(state_meta.head())
-
-# combine metadata with state cases data
-merged_data = pd.merge(cases_data, state_meta, how='inner', on='State')
-print(merged_data.head())
-
-#making all dates datetime format
-date_columns = merged_data.columns[1:-4]
-merged_data = merged_data.rename(columns=lambda x: pd.to_datetime(x).strftime('%Y-%m-%d') if x in date_columns else x)
-
-# taking only 2020 data
-columns_to_keep = [col for col in merged_data.columns if col.startswith('2020')]
-non_date_columns = ['State', 'Population', 'Population_Density', 'Latitude', 'Longitude']
-columns_to_keep = non_date_columns + columns_to_keep
-df_2020 = merged_data[columns_to_keep]
-
-#convert csv to long form
-df_2020 = pd.melt(df_2020, id_vars=['State', 'Population', 'Population_Density', 'Latitude', 'Longitude'], var_name='Date', value_name='Confirmed_Cases')
-
-print(df_2020)
-df_2020.to_csv('df_2020.csv', index=False)
-
-# finally combine that with the rest of the covid data on state and date (recovered/hospitalised)
 other_covid_data_path = '/content/drive/MyDrive/state_covid_data_2020.csv'
-other_covid_data = pd.read_csv(other_covid_data_path)
-# print(other_covid_data.head())
-# print(other_covid_data.columns)
-
-final_covid_data = other_covid_data.drop(columns=['longitude', 'latitude', 'fips', 'confirmed'])
-# final_covid_data.head()
-
-
-final_covid_data = final_covid_data.rename(columns={'state': 'State', 'date_today': 'Date', 'active' : 'Active_Cases', 'hospitalization':'Hospitalised_Cases', 'new_cases': 'New_cases', 'deaths': 'Deaths', 'recovered': 'Recovered_Cases'})
-final_data_complete = pd.merge(df_2020, final_covid_data, how='inner', on=['State', 'Date'])
 
-print(final_data_complete.head())
-final_data_complete.to_csv('final_data_complete.csv', index=False)
-
-data = pd.read_csv('/content/final_data_complete.csv')
-print(data.head())
+# merged once, then cached as the feature tensor keyed by a hash of the three files
+dataset = load_dataset(cases_path, metadata_path, other_covid_data_path, year='2020')
+print(f"{len(dataset['states'])} states, {len(dataset['dates'])} days from {dataset['dates'][0]} to {dataset['dates'][-1]}")
 
 """Calculate state similarity using gravity law"""
 
-def gravity_law(lat1, long1, pop1, lat2, long2, pop2, r=1e5, alpha=0.1, beta=0.1):
-    """
-    Calculates the gravity-law based distance between two points using longitude and latitude.
-    r is a scaling factor, alpha and beta are weights for population.
-    """
-    distance = haversine((lat1, long1), (lat2, long2), 'km')
-    weight = (np.exp(-distance / r)) / (abs((pop1 ** alpha) - (pop2 ** beta)) + 1e-5)
-    return weight
-
-similarity_dictionary = {}
-
-
 #create list of all the states
-state_list = list(data['State'].unique())
+state_list = list(dataset['states'])
 
 # print(state_list)
 
-for state1 in state_list:
-    # for every state create a dictionary for that state with other states
-    similarity_dictionary[state1] = {}
-    for state2 in state_list:
-        # find latitude for the first state by making sure the state we're looking at is the same as the state in the loop, then get the corresponding latitude for that entry
-        lat1 = data[data['State'] == state1]['Latitude'].values[0]
-        long1 = data[data['State'] == state1]['Longitude'].values[0]
-        pop1 = data[data['State'] == state1]['Population'].values[0]
-        lat2 = data[data['State'] == state2]['Latitude'].values[0]
-        long2 = data[data['State'] == state2]['Longitude'].values[0]
-        pop2 = data[data['State'] == state2]['Population'].values[0]
+# one row per state with its lat/long/population, then all pairwise weights in one pass
+# (cached on disk by table and gravity-law parameters, so reruns skip it)
+node_table = static_table(dataset)
+graph_cache = GraphCache('graph_cache')
+similarity_matrix = graph_cache.similarity(node_table)
 
-        similarity_dictionary[state1][state2] = gravity_law(lat1, long1, pop1, lat2, long2, pop2)
-
-similarity_dictionary
-
-"""make the adjacency map"""
-
-threshold = 17
-
-#listing highest similarities first in the dict
-for each_state1 in similarity_dictionary:
-    similarity_dictionary[each_state1] = {key: value for key, value in sorted(similarity_dictionary[each_state1].items(), key=lambda item: item[1], reverse=True)}
-
-# make the adjacency map, loops through each state in the similarity dict, if sim value is more than threshold and its in the top 3 states its added to the adjancy list
-# if its less than the threshodl it adds the first state only
-adjacency_map = {}
-for each_state1 in similarity_dictionary:
-    adjacency_map[each_state1] = []
-    for i, each_state2 in enumerate(similarity_dictionary[each_state1]):
-        if similarity_dictionary[each_state1][each_state2] > threshold:
-            if i <= 3:
-                adjacency_map[each_state1].append(each_state2)
-            else:
-                break
-        else:
-            if i <= 1:
-                adjacency_map[each_state1].append(each_state2)
-            else:
-                break
-
-rows = []
-cols = []
-for each_state1 in adjacency_map:
-    for each_state2 in adjacency_map[each_state1]:
-        rows.append(state_list.index(each_state1))
-        cols.append(state_list.index(each_state2))
+similarity_matrix
 
 """make graph"""
 
 random.seed(42)
 np.random.seed(42)
 
-edge_rows = []
-edge_cols = []
+# an edge wherever the similarity is above the threshold, topped up to at least 5 strongest neighbours per state
+threshold = 17
 min_connections = 5
 
-for state1 in similarity_dictionary:
-    connections = 0
-    extra_edges = []
-
-    for state2 in similarity_dictionary[state1]:
-        if state1 != state2 and similarity_dictionary[state1][state2] > threshold:
-            edge_rows.append(state_list.index(state1))
-            edge_cols.append(state_list.index(state2))
-            connections += 1
-        elif state1 != state2:  # Collect extra edges for potential addition
-            extra_edges.append((state1, state2, similarity_dictionary[state1][state2]))
-
-    # make sure each state has at least 5 connections
-    if connections < min_connections:
-        # most similarity first
-        extra_edges = sorted(extra_edges, key=lambda x: (x[2], x[1]), reverse=True)
-
-        # add more edges until atleast 5
-        for extra_edge in extra_edges:
-            if connections >= min_connections:
-                break
-            state2 = extra_edge[1]
-            edge_rows.append(state_list.index(state1))
-            edge_cols.append(state_list.index(state2))
-            connections += 1
+edge_rows, edge_cols = graph_cache.edges(node_table, threshold, min_connections)
 
 # create dgl graph
-g = dgl.graph((edge_rows, edge_cols))
+g = dgl.graph((edge_rows, edge_cols), num_nodes=len(state_list))
 
 # visualise
 nx_graph = g.to_networkx().to_undirected()
@@ -232,62 +115,26 @@ for layout in layouts:
 
 """make features"""
 
-covid_data = data.sort_values(by=['State', 'Date'])
-state_list = list(data['State'].unique())
-dates_list = data['Date'].unique()
-
+state_list = list(dataset['states'])
+dates_list = dataset['dates']
 
-active_cases = []
-confirmed_cases = []
-new_cases = []
-death_cases = []
-recovered_cases=[]
-static_feat = []
+# (n_loc, T, n_channels) float32, one channel per case series plus the day to day changes
+features = dataset['features']
+channel = {name: i for i, name in enumerate(dataset['channels'])}
+static_feat = dataset['static']
 
+active_cases = features[..., channel['Active_Cases']]
+confirmed_cases = features[..., channel['Confirmed_Cases']]
+new_cases = features[..., channel['New_cases']]
+death_cases = features[..., channel['Deaths']]
+recovered_cases = features[..., channel['Recovered_Cases']]
 
-# features by state
-for state in state_list:
-    state_data = covid_data[covid_data['State'] == state]
-    active_cases.append(state_data['Active_Cases'].values)
-    confirmed_cases.append(state_data['Confirmed_Cases'].values)
-    new_cases.append(state_data['New_cases'].values)
-    death_cases.append(state_data['Deaths'].values)
-    recovered_cases.append(state_data['Recovered_Cases'].values)
-    static_feat.append(state_data[['Population', 'Population_Density', 'Longitude', 'Latitude']].iloc[0].values)
-
-
-
-active_cases = np.array(active_cases)
-confirmed_cases = np.array(confirmed_cases)
-new_cases = np.array(new_cases)
-death_cases = np.array(death_cases)
-recovered_cases = np.array(recovered_cases)
-static_feat = np.array(static_feat)
-
-
-# pop of state - active cases - recovered = susceptible cases
-susceptible_cases = np.expand_dims(static_feat[:, 0], axis=-1) - active_cases - recovered_cases
-
-
-# day to day changes in active cases, recovered,and susceptivle
-dInf = np.concatenate((np.zeros((active_cases.shape[0], 1), dtype=np.float32), np.diff(active_cases, axis=1)), axis=-1)
+# day to day changes in active cases, recovered,and susceptivle (pop of state - active cases - recovered)
+dInf = features[..., channel['dInf']]
+dRec = features[..., channel['dRec']]
+dSus = features[..., channel['dSus']]
 print("dInf shape:",dInf.shape)
-# dDeath = np.concatenate((np.zeros((death_cases.shape[0], 1), dtype=np.float32), np.diff(death_cases, axis=1)), axis=-1)
-# print ("dDeath")
-# print(dDeath.shape)
-dRec = np.concatenate((np.zeros((recovered_cases.shape[0], 1), dtype=np.float32), np.diff(recovered_cases, axis=1)), axis=-1)
-# print ("dRec")
-# print(dRecovered.shape)
-dSus = np.concatenate((np.zeros((susceptible_cases.shape[0], 1), dtype=np.float32), np.diff(susceptible_cases, axis=1)), axis=-1)
-# print ("dSus")
-# print(dSus.shape)
-
-
-#normalise features and store so we can unnormalise
-def normalize_feature(feature):
-    mean = np.mean(feature, axis=1, keepdims=True)
-    std = np.std(feature, axis=1, keepdims=True)
-    return (feature - mean) / (std + 1e-5), mean, std
+
 
 normalised_dInf, mean_dInf, std_dInf = normalize_feature(dInf)
 # normalised_dRec, mean_dRec, std_dRec = normalize_feature(dRec)
@@ -307,38 +154,6 @@ print("dynamic feat shape:",dynamic_feat.shape)
 
 
 
-def prep_data(data, sum_I, history_window=5, pred_window=15, slide_step=5):
-    n_loc = data.shape[0]
-    timestep = data.shape[1]
-    n_feat = data.shape[2]
-
-    x = []
-    y_I = []
-    last_I = []
-    concat_I = []
-
-    for i in range(0, timestep, slide_step):
-        if i + history_window + pred_window - 1 >= timestep or i + history_window >= timestep:
-            break
-        x.append(data[:, i:i + history_window, :].reshape((n_loc, history_window * n_feat)))
-
-        concat_I.append(data[:, i + history_window - 1, 0])
-        last_I.append(sum_I[:, i + history_window - 1])
-
-        y_I.append(data[:, i + history_window:i + history_window + pred_window, 0])
-
-    print("x shape before transpose:", np.array(x).shape)
-    print("y_I shape before transpose:", np.array(y_I).shape)
-    print("concat_I shape before transpose:", np.array(concat_I).shape)
-    print("last_I shape before transpose:", np.array(last_I).shape)
-
-    x = np.array(x, dtype=np.float32).transpose((1, 0, 2))
-    last_I = np.array(last_I, dtype=np.float32).transpose((1, 0))
-    concat_I = np.array(concat_I, dtype=np.float32).transpose((1, 0))
-    y_I = np.array(y_I, dtype=np.float32).transpose((1, 0, 2))
-
-    return x, last_I, concat_I, y_I
-
 history_window, pred_window, slide_step = 5, 10, 1
 valid_window, test_window = 25, 25
 
@@ -373,152 +188,6 @@ print(f"test yI shape: {test_yI.shape}")
 
 """make model"""
 
-def initialise_weights(m):
-    if isinstance(m, nn.Linear):
-        nn.init.xavier_uniform_(m.weight)
-        nn.init.zeros_(m.bias)
-    elif isinstance(m, nn.GRUCell):
-        for name, param in m.named_parameters():
-            if 'weight_ih' in name:
-                nn.init.xavier_uniform_(param.data)
-            elif 'weight_hh' in name:
-                nn.init.orthogonal_(param.data)
-            elif 'bias' in name:
-                param.data.fill_(0)
-
-class GAT(nn.Module):
-    def __init__(self, g, in_dim, out_dim):
-        super(GAT, self).__init__()
-        self.g = g
-        self.fc = nn.Linear(in_dim, out_dim)
-        self.attn_fc = nn.Linear(2 * out_dim, 1)
-        self.reset_parameters()
-
-    def reset_parameters(self):
-        gain = nn.init.calculate_gain('relu')
-        nn.init.xavier_normal_(self.fc.weight, gain=gain)
-        nn.init.xavier_normal_(self.attn_fc.weight, gain=gain)
-
-    def edge_attention(self, edges):
-        z2 = torch.cat([edges.src['z'], edges.dst['z']], dim=1)
-        a = self.attn_fc(z2)
-        return {'e': F.leaky_relu(a)}
-
-    def message_func(self, edges):
-        return {'z': edges.src['z'], 'e': edges.data['e']}
-
-    def reduce_func(self, nodes):
-        alpha = F.softmax(nodes.mailbox['e'], dim=1)
-        h = torch.sum(alpha * nodes.mailbox['z'], dim=1)
-        return {'h': h}
-
-    def forward(self, h):
-        z = self.fc(h)
-        self.g.ndata['z'] = z
-        self.g.apply_edges(self.edge_attention)
-        self.g.update_all(self.message_func, self.reduce_func)
-        return self.g.ndata.pop('h')
-
-class MHGAT(nn.Module):
-    def __init__(self, g, in_dim, out_dim, num_heads, merge='cat'):
-        super(MHGAT, self).__init__()
-        self.heads = nn.ModuleList()
-        for i in range(num_heads):
-            self.heads.append(GAT(g, in_dim, out_dim))
-        self.merge = merge
-
-    def forward(self, h):
-        head_outs = [attn_head(h) for attn_head in self.heads]
-        if self.merge == 'cat':
-            return torch.cat(head_outs, dim=1)
-        else:
-            return torch.mean(torch.stack(head_outs))
-
-class GNN(nn.Module):
-    def __init__(self, g, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads, pred_window, device):
-        super(GNN, self).__init__()
-        self.g = g
-
-        self.layer1 = MHGAT(self.g, in_dim, hidden_dim1, num_heads)
-        self.layer2 = MHGAT(self.g, hidden_dim1 * num_heads, hidden_dim2, 1)
-
-        self.pred_window = pred_window
-        self.gru = nn.GRUCell(hidden_dim2, gru_dim)
-
-        self.nn_res_I = nn.Linear(gru_dim + 1, pred_window)
-
-        self.nn_res_sir = nn.Linear(gru_dim + 1, 1)
-
-        self.hidden_dim2 = hidden_dim2
-        self.gru_dim = gru_dim
-        self.device = device
-
-    def forward(self, dynamic, cI, N, I, h=None):
-        num_loc, timestep, n_feat = dynamic.size()
-        N = N.squeeze()
-
-        if h is None:
-            h = torch.zeros(1, self.gru_dim).to(self.device)
-            gain = nn.init.calculate_gain('relu')
-            nn.init.xavier_normal_(h, gain=gain)
-
-        new_I = []
-        phy_I = []
-        self.alpha_list = []
-        self.alpha_scaled = []
-
-        for each_step in range(timestep):
-            cur_h = self.layer1(dynamic[:, each_step, :])
-
-            if torch.isnan(cur_h).any():
-                print("NaN detected after layer1 at timestep:", each_step)
-
-            cur_h = F.elu(cur_h)
-            cur_h = self.layer2(cur_h)
-
-            if torch.isnan(cur_h).any():
-                print("NaN detected after layer2 at timestep:", each_step)
-
-            cur_h = F.elu(cur_h)
-
-            cur_h = torch.max(cur_h, 0)[0].reshape(1, self.hidden_dim2)
-
-            h = self.gru(cur_h, h)
-
-            if torch.isnan(h).any():
-                print("NaN detected after GRU at timestep:", each_step)
-
-            hc = torch.cat((h, cI[each_step].reshape(1,1)), dim=1)
-
-            pred_I = self.nn_res_I(hc)
-            new_I.append(pred_I)
-
-            pred_res = self.nn_res_sir(hc)
-            alpha = pred_res[:, 0]
-
-            self.alpha_list.append(alpha)
-            alpha = torch.sigmoid(alpha)
-            self.alpha_scaled.append(alpha)
-
-            cur_phy_I = []
-            for i in range(self.pred_window):
-                last_I = I[each_step] if i == 0 else last_I + dI.detach()
-                last_S = N - last_I
-
-                dI = alpha * last_I * (last_S/N)
-                cur_phy_I.append(dI)
-
-            cur_phy_I = torch.stack(cur_phy_I).to(self.device).permute(1, 0)
-            phy_I.append(cur_phy_I)
-
-        new_I = torch.stack(new_I).to(self.device).permute(1, 0, 2)
-        phy_I = torch.stack(phy_I).to(self.device).permute(1, 0, 2)
-
-        self.alpha_list = torch.stack(self.alpha_list).squeeze()
-        self.alpha_scaled = torch.stack(self.alpha_scaled).squeeze()
-
-        return new_I, phy_I, h
-
 in_dim = history_window
 hidden_dim1 = 32
 hidden_dim2 = 32
@@ -526,8 +195,25 @@ gru_dim = 32
 num_heads = 1
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
-g = g.to(device)
-model = GNN(g, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads, pred_window, device).to(device)
+# 'node' gives every state its own readout so all target states train in one pass,
+# 'global' is the max-pooled single-state model (target_states must then hold one state)
+readout = 'node'
+
+# debug=True checks for NaNs after every layer / GRU step; compile_mode='script' and
+# autocast_dtype=torch.bfloat16 are faster execution modes (see benchmarks/bench_forward.py --execution)
+debug = False
+
+# hierarchical=True runs the graph layers on the county gravity graph (sparse, ~3,100 nodes)
+# and pools each state's counties back into it; the forecasts stay per state
+hierarchical = False
+
+if hierarchical:
+    county_nodes, county_assignment = county_table(metadata_path, state_list)
+    g = county_graph(county_nodes, threshold=100, min_connections=5, graph_cache=graph_cache).to(device)
+    model = HierarchicalGNN(g, county_assignment, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads, pred_window, device, readout=readout, debug=debug).to(device)
+else:
+    g = g.to(device)
+    model = GNN(g, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads, pred_window, device, readout=readout, debug=debug).to(device)
 model.apply(initialise_weights)
 optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
 criterion = nn.MSELoss()
@@ -563,7 +249,7 @@ dInf_std = torch.tensor(std_dInf, dtype=torch.float32).to(device).reshape((std_d
 
 N = torch.tensor(static_feat[:, 0], dtype=torch.float32).to(device).unsqueeze(-1)
 
-"""train the model for the state of california"""
+"""train the model for the target states"""
 
 train_x = train_x.float()
 train_cI = train_cI.float()
@@ -581,54 +267,145 @@ val_mae_list = []
 file_name = 'best_stan_model1.pth'
 min_loss = 1e10
 
-state_name = 'California'
-current_state = state_list.index(state_name)
+# validation (the physics branch only) every val_every epochs and on the last one; the learning
+# rate halves after lr_patience validations without improvement, and training stops after
+# patience of them (early_stopping = None always runs all the epochs)
+epochs = 50
+val_every = 1
+scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=3)
+early_stopping = EarlyStopping(patience=10, min_delta=0.0)
+
+# checkpoints are written in a background thread: the best 3 by validation loss and the last 2
+# epochs in checkpoints/, the best one also as file_name; each bundles the normaliser, the graph
+# hash, the RNG states and the loss history, so resume = True carries on from the latest one
+checkpoints = CheckpointManager('checkpoints', best_k=3, last_n=2, best_file=file_name, normaliser=normaliser, graph=g)
+# all states at once, or a subset e.g. ['California']
+target_states = state_list if readout == 'node' else ['California']
+regions = torch.tensor([state_list.index(state_name) for state_name in target_states], device=device)
+
+# mini-batches of seq_len consecutive windows in shuffled order (each chunk its own GRU sequence);
+# batch_size = None trains full-batch on the whole window sequence
+batch_size = None
+seq_len = 20
+num_workers = 0
+
+# truncated backprop through time for long histories: the training windows in order, in chunks
+# of tbptt_len windows with one backward each and h carried over, so memory does not grow
+# with the history; the last alpha_history windows of alpha_scaled are kept for inspection
+tbptt_len = None
+alpha_history = RingBuffer(1000)
+
+if tbptt_len is not None:
+    train_batches = WindowDataset(train_feat, active_cases[:, :-valid_window-test_window], history_window, pred_window, slide_step, tbptt_len, drop_last=False)
+elif batch_size is None:
+    train_batches = [{'x': train_x, 'cI': train_cI, 'I': train_I, 'yI': train_yI}]
+else:
+    train_dataset = WindowDataset(train_feat, active_cases[:, :-valid_window-test_window], history_window, pred_window, slide_step, seq_len)
+    train_batches = make_loader(train_dataset, batch_size, shuffle=True, num_workers=num_workers)
+
+# the shuffling generator of the batches goes into every checkpoint too, so a resumed run draws the
+# same batch order as an uninterrupted one (resuming after the loader is made, which draws its seed)
+train_loader = train_batches if tbptt_len is None and batch_size is not None else None
+resume = False
+start_epoch = 0
+if resume and checkpoints.latest() is not None:
+    bundle = checkpoints.resume(model, optimizer, scheduler, device=device, loader=train_loader)
+    start_epoch = bundle['epoch'] + 1
+    all_loss, all_rmse, all_mae, val_rmse_list, val_mae_list = (bundle['history'][name] for name in ['loss', 'rmse', 'mae', 'val_rmse', 'val_mae'])
+    min_loss = bundle['history']['min_loss']
+    if early_stopping is not None:
+        early_stopping.load_state_dict(bundle['history']['early_stopping'])
+    print(f'resuming after epoch {bundle["epoch"]} from {checkpoints.latest()}')
+
+# opt-in instrumentation: per-stage timers (GAT / GRU / heads / SIR inside the model, and the
+# loop's own stages), peak RSS and one JSON line per epoch in metrics.jsonl; profile_epochs
+# also writes Chrome traces of those epochs to traces/ (see instrument.py)
+instrument = NullInstrument()
+# instrument = Instrument('metrics.jsonl', profile_epochs=[1], trace_dir='traces', count_allocations=False)
+model.instrument = instrument
+
+for epoch in range(start_epoch, epochs):
+    with instrument.epoch(epoch):
+        model.train()
+        epoch_loss = []
+        epoch_mae = []
+
+        if tbptt_len is not None:
+            chunks = (batch_to_device(chunk, device) for chunk in train_batches)
+            with instrument.stage('train'):
+                chunk_loss, chunk_mae, _ = tbptt_epoch(model, optimizer, chunks, N, dInf_mean, dInf_std, regions, criterion, alpha_buffer=alpha_history)
+            epoch_loss.append(chunk_loss)
+            epoch_mae.append(chunk_mae)
+        else:
+            for batch in train_batches:
+                batch = batch_to_device(batch, device)
+                optimizer.zero_grad()
+
+                with instrument.stage('forward'):
+                    loss, active_pred, phy_active, _ = forecast_loss(model, batch['x'], batch['cI'], N, batch['I'], batch['yI'], dInf_mean, dInf_std, regions, criterion)
 
-for epoch in range(50):
-    model.train()
-    optimizer.zero_grad()
+                with instrument.stage('backward'):
+                    loss.backward()
+                with instrument.stage('optimizer'):
+                    optimizer.step()
 
+                epoch_loss.append(loss.item())
+                epoch_mae.append(mae(active_pred, region_targets(model, regions, batch['yI'], batch['x'].dim() == 4)).item())
 
-    active_pred, phy_active, _ = model(train_x, train_cI[current_state], N[current_state], train_I[current_state])
-    phy_active = (phy_active - dInf_mean[current_state]) / dInf_std[current_state]
+        all_loss.append(np.mean(epoch_loss))
 
-    loss = criterion(active_pred.squeeze(), train_yI[current_state]) + \
-           0.1 * criterion(phy_active.squeeze(), train_yI[current_state])
 
+        train_rmse = np.sqrt(all_loss[-1])
+        all_rmse.append(train_rmse)
 
-    loss.backward()
-    optimizer.step()
-    all_loss.append(loss.item())
 
+        train_mae = np.mean(epoch_mae)
+        all_mae.append(train_mae)
 
-    train_rmse = np.sqrt(loss.item())
-    all_rmse.append(train_rmse)
+        validate = epoch % val_every == 0 or epoch == epochs - 1
+        val_loss = None
+        if validate:
+            with instrument.stage('validation'):
+                val_loss, val_phy_active = validation_loss(model, val_x, val_cI, N, val_I, val_yI, dInf_mean, dInf_std, regions, criterion)
+                val_loss = val_loss.item()
 
+                val_rmse = np.sqrt(val_loss)
+                val_rmse_list.append(val_rmse)
 
-    train_mae = torch.mean(torch.abs(active_pred.squeeze() - train_yI[current_state]))
-    all_mae.append(train_mae.item())
 
-    model.eval()
-    with torch.no_grad():
-        _, val_phy_active, _ = model(val_x, val_cI[current_state], N[current_state], val_I[current_state])
+                val_mae = mae(val_phy_active, val_yI[regions]).item()
+                val_mae_list.append(val_mae)
 
-        val_phy_active = (val_phy_active - dInf_mean[current_state]) / dInf_std[current_state]
-        val_loss = criterion(val_phy_active.squeeze(), val_yI[current_state])
+            scheduler.step(val_loss)
+            if val_loss < min_loss:
+                min_loss = val_loss
+                print('-----Save best model-----')
 
-        val_rmse = np.sqrt(val_loss.item())
-        val_rmse_list.append(val_rmse)
+        stop = validate and early_stopping is not None and early_stopping.step(val_loss)
+        with instrument.stage('save'):
+            history = {'loss': all_loss, 'rmse': all_rmse, 'mae': all_mae, 'val_rmse': val_rmse_list, 'val_mae': val_mae_list, 'min_loss': min_loss,
+                       'early_stopping': None if early_stopping is None else early_stopping.state_dict()}
+            checkpoints.save(epoch, model, optimizer, metric=val_loss, scheduler=scheduler, history=history, loader=train_loader)
+
+        if validate:
+            instrument.log(loss=all_loss[-1], mae=train_mae, val_loss=val_loss, val_mae=val_mae, lr=optimizer.param_groups[0]['lr'])
+            print(f'Epoch {epoch}, Loss {all_loss[-1]:.2f}, RMSE {train_rmse:.2f}, MAE {train_mae:.2f}, Val loss {val_loss:.2f}, Val RMSE {val_rmse:.2f}, Val MAE {val_mae:.2f}')
+        else:
+            instrument.log(loss=all_loss[-1], mae=train_mae, lr=optimizer.param_groups[0]['lr'])
+            print(f'Epoch {epoch}, Loss {all_loss[-1]:.2f}, RMSE {train_rmse:.2f}, MAE {train_mae:.2f}')
 
+    if stop:
+        print(f'early stopping after epoch {epoch}: no improvement in {early_stopping.patience} validations')
+        break
 
-        val_mae = torch.mean(torch.abs(val_phy_active.squeeze() - val_yI[current_state]))
-        val_mae_list.append(val_mae.item())
+checkpoints.close()
 
-        if val_loss < min_loss:
-            state = {
-                'state': model.state_dict(),
-                'optimizer': optimizer.state_dict(),
-            }
-            torch.save(state, file_name)
-            min_loss = val_loss
-            print('-----Save best model-----')
+"""daily updates"""
 
-    print(f'Epoch {epoch}, Loss {all_loss[-1]:.2f}, RMSE {train_rmse:.2f}, MAE {train_mae.item():.2f}, Val loss {val_loss.item():.2f}, Val RMSE {val_rmse:.2f}, Val MAE {val_mae.item():.2f}')
\ No newline at end of file
+# the features as an append-only stream, so a new day costs only its own row and windows:
+#   stream.append_day(date, new_day_table)
+#   finetune(stream, model, optimizer, timestep_before_append, N, regions, criterion, history_window, pred_window, slide_step)
+#   forecast_latest(stream, model, N, regions, history_window, slide_step)
+# (both in incremental.py; the model state comes back with training.load_checkpoint(file_name, model, optimizer))
+stream = FeatureStream.create('feature_stream', dataset)
+print(f"feature stream with {stream.timestep} days up to {stream.dates[-1]}")
@@ -0,0 +1,264 @@
+"""Build the gravity-law graph as COO edge arrays.
+
+Every node i gets an edge to every other node j whose gravity-law weight is above
+`threshold`; nodes with fewer than `min_connections` such edges are topped up with
+their strongest remaining neighbours. Edges come out grouped by source node in order
+of decreasing weight, ready for dgl.graph((src, dst)).
+
+Two equivalent strategies are available:
+  - 'dense' walks the similarity matrix in row blocks (argpartition top-k per block),
+  - 'index' never forms the n x n matrix. Candidates for the threshold pass are found
+    with a range query on pop**beta (the weight is bounded by 1 / (|pop_i**alpha - pop_j**beta| + 1e-5))
+    or a BallTree haversine radius query (the weight is bounded by exp(-d / r) / 1e-5),
+    whichever gives fewer candidates; the top-k top-up uses the same population bound
+    seeded from the nearest populations.
+"""
+
+import math
+
+import numpy as np
+
+from similarity import AVG_EARTH_RADIUS_KM, DEFAULT_MAX_BYTES, gravity_weights, iter_similarity_blocks
+
+POP_EPS = 1e-5
+
+# above this many nodes 'auto' switches from the dense to the index strategy
+DENSE_MAX_NODES = 4096
+
+
+def _order_edges(src, dst, weight):
+    # group by source, strongest first, ties by destination index
+    order = np.lexsort((dst, -weight, src))
+    return src[order], dst[order]
+
+
+def _edges_from_block(weights, start, threshold, min_connections):
+    n_rows, n = weights.shape
+    rows = np.arange(n_rows)
+    weights[rows, rows + start] = -np.inf
+
+    above = weights > threshold
+    k = min(min_connections, n - 1)
+    if k > 0:
+        short = above.sum(axis=1) < k
+        if short.any():
+            top = np.argpartition(weights[short], n - k, axis=1)[:, n - k:]
+            above[np.flatnonzero(short)[:, None], top] = True
+
+    src, dst = np.nonzero(above)
+    return src + start, dst, weights[src, dst]
+
+
+def edges_from_similarity(similarity, threshold=17, min_connections=5):
+    """
+    Edge arrays (src, dst) from a precomputed dense similarity matrix.
+    """
+    weights = np.array(similarity, dtype=np.float64, copy=True)
+    src, dst, weight = _edges_from_block(weights, 0, threshold, min_connections)
+    return _order_edges(src, dst, weight)
+
+
+def _dense_edges(lat, lng, pop, threshold, min_connections, r, alpha, beta, exact, max_bytes):
+    srcs, dsts, ws = [], [], []
+    for start, _, weights in iter_similarity_blocks(lat, lng, pop, r, alpha, beta, exact, max_bytes):
+        src, dst, weight = _edges_from_block(weights, start, threshold, min_connections)
+        srcs.append(src)
+        dsts.append(dst)
+        ws.append(weight)
+    return _order_edges(np.concatenate(srcs), np.concatenate(dsts), np.concatenate(ws))
+
+
+def _expand_ranges(lo, hi):
+    # flattened (owner, position) pairs for the ragged ranges [lo[i], hi[i])
+    counts = hi - lo
+    owner = np.repeat(np.arange(len(lo)), counts)
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return owner, np.arange(counts.sum()) + starts
+
+
+def _chunks(counts, max_pairs):
+    # consecutive node ranges whose candidate counts add up to at most max_pairs (at least one node each)
+    cum = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        base = cum[start - 1] if start else 0
+        stop = max(int(np.searchsorted(cum, base + max_pairs, side='right')), start + 1)
+        yield start, stop
+        start = stop
+
+
+class _PopulationIndex:
+    """1-d range queries on pop**beta around pop**alpha."""
+
+    def __init__(self, pop, alpha, beta):
+        self.u = pop ** alpha
+        v = pop ** beta
+        self.order = np.argsort(v, kind='stable')
+        self.v_sorted = v[self.order]
+
+    def bounds(self, nodes, radius):
+        # slightly widened so that rounding never drops a candidate; exact weights filter afterwards
+        radius = radius * (1 + 1e-9) + 1e-12
+        lo = np.searchsorted(self.v_sorted, self.u[nodes] - radius, side='left')
+        hi = np.searchsorted(self.v_sorted, self.u[nodes] + radius, side='right')
+        return lo, hi
+
+    def nearest_bounds(self, nodes, k):
+        n = len(self.v_sorted)
+        pos = np.searchsorted(self.v_sorted, self.u[nodes])
+        lo = np.clip(pos - k - 1, 0, max(n - 2 * k - 2, 0))
+        return lo, np.minimum(lo + 2 * k + 2, n)
+
+
+def _range_candidates(nodes, lo, hi, pop_index, max_pairs):
+    # (owner, src, dst) candidate pairs, without self pairs, in chunks of at most max_pairs
+    for start, stop in _chunks(hi - lo, max_pairs):
+        owner, pos = _expand_ranges(lo[start:stop], hi[start:stop])
+        src, dst = nodes[start:stop][owner], pop_index.order[pos]
+        keep = src != dst
+        yield owner[keep] + start, src[keep], dst[keep]
+
+
+def _pair_weights(src, dst, lat, lng, pop, r, alpha, beta, exact):
+    return gravity_weights(lat[src], lng[src], pop[src], lat[dst], lng[dst], pop[dst],
+                           r=r, alpha=alpha, beta=beta, exact=exact)
+
+
+def _index_threshold_edges(nodes, lat, lng, pop, pop_index, threshold, r, alpha, beta, exact, max_pairs):
+    pop_radius = 1 / threshold - POP_EPS
+    if pop_radius <= 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+
+    lo, hi = pop_index.bounds(nodes, pop_radius)
+    pop_candidates = int((hi - lo).sum())
+
+    ball = None
+    if threshold * POP_EPS < 1:
+        dist_radius = -r * math.log(threshold * POP_EPS) / AVG_EARTH_RADIUS_KM
+        if dist_radius < math.pi:
+            from sklearn.neighbors import BallTree
+
+            coords = np.radians(np.stack([lat, lng], axis=1))
+            tree = BallTree(coords, metric='haversine')
+            if int(tree.query_radius(coords[nodes], dist_radius, count_only=True).sum()) < pop_candidates:
+                ball = (tree, coords, dist_radius)
+
+    if ball is None:
+        candidates = _range_candidates(nodes, lo, hi, pop_index, max_pairs)
+    else:
+        tree, coords, dist_radius = ball
+        neighbours = tree.query_radius(coords[nodes], dist_radius)
+        counts = np.array([len(each) for each in neighbours])
+        src = np.repeat(nodes, counts)
+        dst = np.concatenate(neighbours).astype(np.int64)
+        keep = src != dst
+        candidates = [(None, src[keep], dst[keep])]
+
+    srcs, dsts, ws = [], [], []
+    for _, src, dst in candidates:
+        weight = _pair_weights(src, dst, lat, lng, pop, r, alpha, beta, exact)
+        keep = weight > threshold
+        srcs.append(src[keep])
+        dsts.append(dst[keep])
+        ws.append(weight[keep])
+    return np.concatenate(srcs).astype(np.int64), np.concatenate(dsts).astype(np.int64), np.concatenate(ws)
+
+
+def _top_k(owner, dst, weight, k):
+    # mask of the k largest weights within each owner group, ties to the lower destination index
+    order = np.lexsort((dst, -weight, owner))
+    sorted_owner = owner[order]
+    group_start = np.searchsorted(sorted_owner, sorted_owner, side='left')
+    rank = np.arange(len(order)) - group_start
+    keep = np.zeros(len(order), dtype=bool)
+    keep[order[rank < k]] = True
+    return keep
+
+
+def _index_top_k_edges(nodes, lat, lng, pop, pop_index, k, r, alpha, beta, exact, max_pairs):
+    # seed with the nearest populations to get a lower bound on each node's k-th best weight
+    lo, hi = pop_index.nearest_bounds(nodes, k)
+    owner, pos = _expand_ranges(lo, hi)
+    src, dst = nodes[owner], pop_index.order[pos]
+    keep = src != dst
+    owner, src, dst = owner[keep], src[keep], dst[keep]
+    weight = _pair_weights(src, dst, lat, lng, pop, r, alpha, beta, exact)
+    top = _top_k(owner, dst, weight, k)
+    kth = np.full(len(nodes), np.inf)
+    np.minimum.at(kth, owner[top], weight[top])
+
+    # any neighbour at least that strong has |pop_i**alpha - pop_j**beta| <= 1 / kth - eps
+    lo, hi = pop_index.bounds(nodes, np.maximum(1 / kth - POP_EPS, 0))
+    srcs, dsts, ws = [], [], []
+    for owner, src, dst in _range_candidates(nodes, lo, hi, pop_index, max_pairs):
+        weight = _pair_weights(src, dst, lat, lng, pop, r, alpha, beta, exact)
+        top = _top_k(owner, dst, weight, k)
+        srcs.append(src[top])
+        dsts.append(dst[top])
+        ws.append(weight[top])
+    return np.concatenate(srcs).astype(np.int64), np.concatenate(dsts).astype(np.int64), np.concatenate(ws)
+
+
+def _index_edges(lat, lng, pop, threshold, min_connections, r, alpha, beta, exact, max_bytes):
+    n = lat.shape[0]
+    nodes = np.arange(n)
+    pop_index = _PopulationIndex(pop, alpha, beta)
+    # about 16 float64 temporaries per candidate pair
+    max_pairs = max(1, max_bytes // (16 * 8))
+
+    src, dst, weight = _index_threshold_edges(nodes, lat, lng, pop, pop_index, threshold, r, alpha, beta, exact, max_pairs)
+
+    k = min(min_connections, n - 1)
+    short = np.flatnonzero(np.bincount(src, minlength=n) < k) if k > 0 else np.empty(0, np.int64)
+    if len(short):
+        # the top-k of a short node contains all of its above-threshold edges, so replace them
+        t_src, t_dst, t_w = _index_top_k_edges(short, lat, lng, pop, pop_index, k, r, alpha, beta, exact, max_pairs)
+        keep = ~np.isin(src, short)
+        src = np.concatenate([src[keep], t_src])
+        dst = np.concatenate([dst[keep], t_dst])
+        weight = np.concatenate([weight[keep], t_w])
+
+    return _order_edges(src, dst, weight)
+
+
+def build_edges(lat, lng, pop, threshold=17, min_connections=5, r=1e5, alpha=0.1, beta=0.1, exact=True,
+                method='auto', max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Edge arrays (src, dst) of the gravity-law graph.
+    method is 'dense', 'index' or 'auto' (dense up to DENSE_MAX_NODES nodes).
+    Equal weights are ordered by node index rather than by name as in the original
+    dictionary sort; which of several equal weights survives the min_connections cut-off
+    is unspecified.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    pop = np.asarray(pop)
+
+    if method == 'auto':
+        method = 'dense' if lat.shape[0] <= DENSE_MAX_NODES else 'index'
+    if method == 'dense':
+        return _dense_edges(lat, lng, pop, threshold, min_connections, r, alpha, beta, exact, max_bytes)
+    if method == 'index':
+        return _index_edges(lat, lng, pop, threshold, min_connections, r, alpha, beta, exact, max_bytes)
+    raise ValueError(f"unknown method {method!r}, expected 'auto', 'dense' or 'index'")
+
+
+def build_edges_from_table(table, threshold=17, min_connections=5, r=1e5, alpha=0.1, beta=0.1, exact=True,
+                           method='auto', max_bytes=DEFAULT_MAX_BYTES):
+    """
+    build_edges for a table from similarity.node_static_table.
+    """
+    return build_edges(table['Latitude'].values, table['Longitude'].values, table['Population'].values,
+                       threshold=threshold, min_connections=min_connections, r=r, alpha=alpha, beta=beta,
+                       exact=exact, method=method, max_bytes=max_bytes)
+
+
+def build_graph(table, **kwargs):
+    """
+    dgl graph of the gravity-law edges for a node table.
+    """
+    import dgl
+    import torch
+
+    src, dst = build_edges_from_table(table, **kwargs)
+    return dgl.graph((torch.from_numpy(src), torch.from_numpy(dst)), num_nodes=len(table))
@@ -0,0 +1,150 @@
+"""Content-addressed on-disk cache of similarity matrices and gravity-law graphs.
+
+Graphs are keyed by the node table (names, coordinates, populations) and all the build
+parameters and stored as compressed COO .npz; similarity matrices are keyed by the table
+and r / alpha / beta only, so a new threshold or min_connections re-derives its edges from
+the cached matrix without recomputing any haversines. The least recently used files are
+evicted once the cache grows past its disk budget.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+from graph_builder import DENSE_MAX_NODES, build_edges_from_table, edges_from_similarity
+from similarity import similarity_from_table
+
+# bump when edges for the same parameters change, to invalidate old cache files
+GRAPH_CACHE_VERSION = 1
+
+DEFAULT_DISK_BYTES = 1 << 30
+
+
+def table_digest(table):
+    """hash of the columns the gravity law reads, in row order"""
+    digest = hashlib.sha256()
+    digest.update('\0'.join(map(str, table['State'])).encode())
+    for column in ['Latitude', 'Longitude', 'Population']:
+        digest.update(np.ascontiguousarray(table[column].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+def _key(*parts):
+    return hashlib.sha256(repr((GRAPH_CACHE_VERSION,) + parts).encode()).hexdigest()[:20]
+
+
+class GraphCache:
+    """
+    GraphCache(cache_dir).edges(table, threshold, min_connections, r, alpha, beta) is
+    build_edges_from_table with the result kept in cache_dir. Safe to share between processes:
+    files are written under a temporary name and renamed into place.
+    """
+
+    def __init__(self, cache_dir='graph_cache', max_bytes=DEFAULT_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = {'graph': 0, 'similarity': 0}
+        self.misses = {'graph': 0, 'similarity': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, kind, key, ext):
+        return os.path.join(self.cache_dir, f'{kind}_{key}{ext}')
+
+    def _hit(self, kind, path):
+        if not os.path.exists(path):
+            self.misses[kind] += 1
+            return False
+        try:
+            # mtime is the recency the eviction goes by
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another process in between
+            self.misses[kind] += 1
+            return False
+        self.hits[kind] += 1
+        return True
+
+    def _save(self, path, save, *args, **kwargs):
+        tmp_path = f'{path}.{os.getpid()}.tmp{os.path.splitext(path)[1]}'
+        save(tmp_path, *args, **kwargs)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def similarity(self, table, r=1e5, alpha=0.1, beta=0.1, exact=True):
+        """dense similarity_from_table, from the cache when the table and r / alpha / beta were seen before"""
+        path = self._path('similarity', _key(table_digest(table), r, alpha, beta, exact), '.npy')
+        if self._hit('similarity', path):
+            try:
+                return np.load(path)
+            except (FileNotFoundError, ValueError):
+                pass
+        similarity = similarity_from_table(table, r=r, alpha=alpha, beta=beta, exact=exact)
+        self._save(path, np.save, similarity)
+        return similarity
+
+    def edges(self, table, threshold=17, min_connections=5, r=1e5, alpha=0.1, beta=0.1, exact=True, method='auto'):
+        """
+        Edge arrays (src, dst) as build_edges_from_table gives them. Tables of up to
+        DENSE_MAX_NODES nodes go through the cached similarity matrix; larger ones use the
+        index strategy, which never forms the matrix, and only their edges are cached.
+        method='index' takes the index strategy at any size (both give the same edges, so
+        it is not part of the key).
+        """
+        digest = table_digest(table)
+        path = self._path('graph', _key(digest, threshold, min_connections, r, alpha, beta, exact), '.npz')
+        if self._hit('graph', path):
+            try:
+                with np.load(path) as cached:
+                    return cached['src'], cached['dst']
+            except (FileNotFoundError, ValueError):
+                pass
+
+        if method != 'index' and len(table) <= DENSE_MAX_NODES:
+            src, dst = edges_from_similarity(self.similarity(table, r, alpha, beta, exact), threshold, min_connections)
+        else:
+            src, dst = build_edges_from_table(table, threshold=threshold, min_connections=min_connections,
+                                              r=r, alpha=alpha, beta=beta, exact=exact, method=method)
+        self._save(path, np.savez_compressed, src=src, dst=dst, num_nodes=len(table))
+        return src, dst
+
+    def graph(self, table, **kwargs):
+        """dgl graph of the cached edges, like graph_builder.build_graph"""
+        import dgl
+        import torch
+
+        src, dst = self.edges(table, **kwargs)
+        return dgl.graph((torch.from_numpy(src), torch.from_numpy(dst)), num_nodes=len(table))
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.startswith(('graph_', 'similarity_')) or '.tmp' in name:
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return entries
+
+    def evict(self, keep=None):
+        """Deletes least recently used files until the cache fits max_bytes. Returns the bytes freed."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in entries:
+            if total - freed <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            freed += size
+        return freed
@@ -0,0 +1,111 @@
+"""County graph pooled into the state nodes the forecasts are made for.
+
+The graph layers run on the gravity-law graph between counties, which at ~3,100 nodes is
+only ever handled as sparse COO edges (the index strategy of graph_builder, DGL's sparse
+message passing); every state then reads out the segment-pooled embeddings of its own
+counties, and the GRU, heads and SIR branch run per state exactly as in GNN. Counties are
+ordered state by state, so each state's counties are one contiguous segment.
+"""
+
+import dgl.ops
+import numpy as np
+import pandas as pd
+import torch
+
+from models import GNN
+
+POOLS = ('mean', 'max', 'sum')
+
+
+def county_table(metadata_path, states):
+    """
+    One row per county of the given states from the county metadata CSV, in the layout of
+    ingest.static_table (State holds the county name) with the state ordered as in `states`.
+    Returns (table, assignment), assignment being each county's state index, non-decreasing.
+    """
+    metadata = pd.read_csv(metadata_path)
+    state_index = {state: i for i, state in enumerate(states)}
+    metadata = metadata[metadata['state_name'].isin(state_index)]
+    assignment = metadata['state_name'].map(state_index).to_numpy(dtype=np.int64)
+
+    missing = sorted(set(state_index) - set(metadata['state_name']))
+    if missing:
+        raise ValueError(f'no counties in the metadata for {missing}')
+
+    order = np.argsort(assignment, kind='stable')
+    metadata, assignment = metadata.iloc[order], assignment[order]
+    names = metadata['county'] if 'county' in metadata else pd.Series(range(len(metadata)), index=metadata.index)
+    table = pd.DataFrame({
+        'State': names.astype(str) + ', ' + metadata['state_name'],
+        'Population': metadata['population'],
+        'Population_Density': metadata['density'],
+        'Longitude': metadata['lng'],
+        'Latitude': metadata['lat'],
+        'Parent': metadata['state_name'],
+    }).reset_index(drop=True)
+    return table, assignment
+
+
+def county_graph(table, threshold=100, min_connections=5, graph_cache=None, **kwargs):
+    """
+    dgl graph between the counties of county_table, built with the index strategy so the
+    n x n similarity matrix is never formed. Counties are far more alike in population than
+    states, so the threshold is higher than the state graph's to keep the degree moderate.
+    """
+    if graph_cache is not None:
+        return graph_cache.graph(table, threshold=threshold, min_connections=min_connections, method='index', **kwargs)
+    from graph_builder import build_graph
+    return build_graph(table, threshold=threshold, min_connections=min_connections, method='index', **kwargs)
+
+
+def segment_pool(h, seglen, pool='mean'):
+    """
+    (n_county, ...) rows pooled into (len(seglen), ...), seglen counting the contiguous rows
+    of each segment. One DGL segment_reduce kernel, differentiable.
+    """
+    # segment_reduce has no low-precision CPU kernels, pool in float32 under autocast
+    return dgl.ops.segment_reduce(seglen, h.float(), pool).to(h.dtype)
+
+
+class HierarchicalGNN(GNN):
+    """
+    GNN with its graph layers on the county graph g. dynamic (and cI / N / I) stay per state:
+    every county starts from its state's features, the two GAT layers mix them over the
+    county edges, and segment_pool turns the county embeddings back into one row per state.
+    readout='node' then forecasts every state (or the `regions` subset), readout='global'
+    max-pools the states as GNN does. dynamic may also be given per county already.
+
+    assignment (n_county,) is each county's state index, non-decreasing (see county_table).
+    It is kept in a non-persistent buffer, so the state_dict is the same as GNN's and the
+    checkpoint helpers work unchanged.
+    """
+
+    def __init__(self, g, assignment, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads, pred_window, device,
+                 pool='mean', **kwargs):
+        super(HierarchicalGNN, self).__init__(g, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads,
+                                              pred_window, device, **kwargs)
+        assignment = torch.as_tensor(assignment, dtype=torch.int64)
+        if len(assignment) != g.num_nodes():
+            raise ValueError(f'{len(assignment)} county assignments for a graph of {g.num_nodes()} nodes')
+        if (assignment[1:] < assignment[:-1]).any():
+            raise ValueError('assignment must be non-decreasing, counties grouped state by state')
+        seglen = torch.bincount(assignment)
+        if (seglen == 0).any():
+            raise ValueError(f'states without counties: {torch.flatnonzero(seglen == 0).tolist()}')
+        if pool not in POOLS:
+            raise ValueError(f'unknown pool {pool!r}, expected one of {POOLS}')
+        self.pool = pool
+        self.register_buffer('assignment', assignment, persistent=False)
+        self.register_buffer('seglen', seglen, persistent=False)
+
+    def graph_embed(self, dynamic, blocks=None):
+        if blocks is not None:
+            raise ValueError('HierarchicalGNN runs on the whole county graph, not on sampled blocks')
+        if dynamic.shape[0] != len(self.assignment):
+            # per-state input, broadcast to the counties
+            dynamic = dynamic[self.assignment]
+        cur_h = segment_pool(self.node_embed(dynamic), self.seglen, self.pool)
+
+        if self.readout == 'global':
+            cur_h = torch.max(cur_h, 0, keepdim=True)[0]
+        return cur_h
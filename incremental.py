@@ -0,0 +1,264 @@
+"""Daily incremental updates of the feature tensor, the dInf normaliser and the model.
+
+A FeatureStream keeps the (n_loc, T, n_channels) feature tensor on disk day-major in an
+append-only file, next to a small meta .npz with the states, dates and running statistics.
+Appending a day writes that day's row and updates the dInf mean/std with Welford's online
+update, so a daily refresh costs O(new days) rather than a re-ingest of the whole history.
+
+Earlier windows keep the normalisation they were built with; only windows touching new days
+are normalised with the updated statistics.
+"""
+
+import os
+
+import numpy as np
+import torch
+
+from features import DERIVED_CHANNELS, derive_changes
+from training import denormalise, forecast, forecast_loss
+from windows import history_windows, prep_data
+
+DAYS_FILE = 'days.f32'
+META_FILE = 'meta.npz'
+
+
+class RunningStats:
+    """
+    Per-region running mean / variance over days, (n_loc, 1) like normalize_feature's, with
+    Welford's update (Chan et al.'s pairwise form when several days arrive at once).
+    """
+
+    def __init__(self, count, mean, m2):
+        self.count = int(count)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.m2 = np.asarray(m2, dtype=np.float64)
+
+    @classmethod
+    def from_series(cls, series):
+        """statistics of series (n_loc, T), matching normalize_feature"""
+        mean = np.mean(series, axis=1, keepdims=True, dtype=np.float64)
+        std = np.std(series, axis=1, keepdims=True, dtype=np.float64)
+        return cls(series.shape[1], mean, std ** 2 * series.shape[1])
+
+    def update(self, values):
+        """adds days values (n_loc, k)"""
+        values = np.asarray(values, dtype=np.float64)
+        k = values.shape[1]
+        if k == 0:
+            return self
+        batch_mean = values.mean(axis=1, keepdims=True)
+        batch_m2 = ((values - batch_mean) ** 2).sum(axis=1, keepdims=True)
+
+        total = self.count + k
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * k / total
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * self.count * k / total
+        self.count = total
+        return self
+
+    @property
+    def std(self):
+        # population std, np.std's default
+        return np.sqrt(self.m2 / self.count)
+
+    def as_normaliser(self):
+        return {'mean': self.mean, 'std': self.std}
+
+
+def num_windows(timestep, history_window, pred_window, slide_step):
+    """len(window_starts(...)) without building the starts"""
+    if timestep < history_window + pred_window:
+        return 0
+    return (timestep - history_window - pred_window) // slide_step + 1
+
+
+class FeatureStream:
+    """
+    The feature tensor of a load_dataset dict, kept in directory `path` so days can be
+    appended. Create one with FeatureStream.create(path, dataset), reopen with FeatureStream(path).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with np.load(os.path.join(path, META_FILE), allow_pickle=False) as meta:
+            self.states = meta['states']
+            self.channels = meta['channels']
+            self.static = meta['static']
+            self.dates = meta['dates']
+            self.stats = RunningStats(meta['count'], meta['mean'], meta['m2'])
+            # inference progress: next history window start and the GRU state after the last one
+            self.next_start = int(meta['next_start'])
+            self.hidden = meta['hidden'] if meta['hidden'].size else None
+        self.channel = {name: i for i, name in enumerate(self.channels)}
+        self.base_channels = [name for name in self.channels if name not in DERIVED_CHANNELS]
+
+        # a crash between writing a day and renaming the meta file leaves a row the meta does
+        # not list; drop it, the day is appended again
+        days_path = os.path.join(path, DAYS_FILE)
+        if os.path.getsize(days_path) > self.timestep * self._row_bytes:
+            os.truncate(days_path, self.timestep * self._row_bytes)
+
+    @classmethod
+    def create(cls, path, dataset):
+        features = dataset['features']
+        os.makedirs(path, exist_ok=True)
+        np.ascontiguousarray(features.transpose(1, 0, 2), dtype=np.float32).tofile(os.path.join(path, DAYS_FILE))
+
+        channels = list(dataset['channels'])
+        stats = RunningStats.from_series(features[..., channels.index('dInf')])
+        _save_meta(path, dataset['states'], dataset['channels'], dataset['static'], dataset['dates'], stats, 0, None)
+        return cls(path)
+
+    def save(self):
+        _save_meta(self.path, self.states, self.channels, self.static, self.dates, self.stats,
+                   self.next_start, self.hidden)
+
+    @property
+    def timestep(self):
+        return len(self.dates)
+
+    @property
+    def _row_bytes(self):
+        return len(self.states) * len(self.channels) * np.dtype(np.float32).itemsize
+
+    @property
+    def features(self):
+        """(n_loc, T, n_channels) float32, a read-only view of the days file"""
+        days = np.memmap(os.path.join(self.path, DAYS_FILE), dtype=np.float32, mode='r',
+                         shape=(self.timestep, len(self.states), len(self.channels)))
+        return days.transpose(1, 0, 2)
+
+    @property
+    def normaliser(self):
+        return {'dInf': self.stats.as_normaliser()}
+
+    def day_values(self, day):
+        """
+        One day of the long table (State plus the base channel columns, like merge_sources
+        gives) as (n_loc, n_base) in stream order.
+        """
+        rows = day.drop_duplicates('State').set_index('State').reindex(self.states)
+        missing = rows.index[rows[self.base_channels].isna().any(axis=1)]
+        if len(missing):
+            raise ValueError(f'no data for {len(missing)} regions, e.g. {list(missing[:5])}')
+        return rows[self.base_channels].to_numpy(dtype=np.float32)
+
+    def append_day(self, date, values):
+        """
+        Appends the day after the last one. values is (n_loc, n_base) in base channel order,
+        or a one-day long table for day_values. Returns the full (n_loc, n_channels) day row.
+        """
+        last_date = np.datetime64(self.dates[-1], 'D')
+        if np.datetime64(date, 'D') != last_date + 1:
+            raise ValueError(f'expected data for {last_date + 1}, got {date}')
+        if not isinstance(values, np.ndarray):
+            values = self.day_values(values)
+
+        # previous day + new day, so derive_changes can fill the new day's changes
+        pair = np.empty((len(self.states), 2, len(self.channels)), dtype=np.float32)
+        pair[:, 0] = self.features[:, -1]
+        pair[:, 1, :len(self.base_channels)] = values
+        derive_changes(pair, list(self.channels))
+        row = pair[:, 1]
+
+        # at the row the meta expects, not the end of the file
+        with open(os.path.join(self.path, DAYS_FILE), 'r+b') as f:
+            f.seek(self.timestep * self._row_bytes)
+            row.tofile(f)
+        self.dates = np.append(self.dates, str(np.datetime64(date, 'D')))
+        self.stats.update(row[:, self.channel['dInf'], None])
+        self.save()
+        return row
+
+    def dynamic_feat(self, start=0):
+        """normalised dInf from day `start` on, (n_loc, T - start, 1) like gnn_final's dynamic_feat"""
+        dInf = self.features[:, start:, self.channel['dInf']]
+        return ((dInf - self.stats.mean) / (self.stats.std + 1e-5))[..., np.newaxis]
+
+    def training_windows(self, old_timestep, history_window=5, pred_window=15, slide_step=5):
+        """
+        prep_data outputs for the windows whose targets became complete after old_timestep
+        days, built from the tail of the history only.
+        """
+        first = num_windows(old_timestep, history_window, pred_window, slide_step)
+        start = first * slide_step
+        sum_I = self.features[:, start:, self.channel['Active_Cases']]
+        return prep_data(self.dynamic_feat(start), sum_I, history_window, pred_window, slide_step)
+
+    def forecast_windows(self, history_window=5, slide_step=5, start=None):
+        """
+        history_windows from day `start` (default: since the last forecast_latest), ending
+        with the window on the latest days. Returns (x, last_I, concat_I, starts).
+        """
+        if start is None:
+            start = self.next_start
+        sum_I = self.features[:, start:, self.channel['Active_Cases']]
+        x, last_I, concat_I = history_windows(self.dynamic_feat(start), sum_I, history_window, slide_step)
+        starts = start + slide_step * np.arange(x.shape[1])
+        return x, last_I, concat_I, starts
+
+
+def _save_meta(path, states, channels, static, dates, stats, next_start, hidden):
+    # write then rename; the days file only grows, and the meta's dates say how far it is valid
+    tmp_path = os.path.join(path, META_FILE + '.tmp.npz')
+    np.savez(tmp_path, states=states, channels=channels, static=static, dates=np.asarray(dates, dtype=str),
+             count=stats.count, mean=stats.mean, m2=stats.m2, next_start=next_start,
+             hidden=np.zeros((0,), dtype=np.float32) if hidden is None else hidden)
+    os.replace(tmp_path, os.path.join(path, META_FILE))
+
+
+def _normaliser_tensors(stream, device):
+    dInf_mean = torch.tensor(stream.stats.mean, dtype=torch.float32, device=device).reshape(-1, 1, 1)
+    dInf_std = torch.tensor(stream.stats.std, dtype=torch.float32, device=device).reshape(-1, 1, 1)
+    return dInf_mean, dInf_std
+
+
+def finetune(stream, model, optimizer, old_timestep, N, regions, criterion, history_window=5, pred_window=15,
+             slide_step=5, epochs=1, phy_weight=0.1):
+    """
+    Trains on the windows completed since old_timestep days, as one GRU sequence like a
+    WindowDataset chunk. Returns the per-epoch losses, empty when no window completed.
+    """
+    device = N.device
+    x, I, cI, yI = stream.training_windows(old_timestep, history_window, pred_window, slide_step)
+    if x.shape[1] == 0:
+        return []
+    x, I, cI, yI = (torch.from_numpy(each).to(device) for each in (x, I, cI, yI))
+    dInf_mean, dInf_std = _normaliser_tensors(stream, device)
+
+    losses = []
+    model.train()
+    for epoch in range(epochs):
+        optimizer.zero_grad()
+        loss, _, _, _ = forecast_loss(model, x, cI, N, I, yI, dInf_mean, dInf_std, regions, criterion, phy_weight)
+        loss.backward()
+        optimizer.step()
+        losses.append(loss.item())
+    return losses
+
+
+def forecast_latest(stream, model, N, regions, history_window=5, slide_step=5):
+    """
+    Forecasts from the latest window, running the GRU only over the windows added since the
+    previous call and carrying its state in the stream (the first call replays the history).
+    Regions must be the same on every call. Returns (active_pred, phy_active), each
+    (num_regions, pred_window) daily new infections, or None when no new window is complete.
+    """
+    device = N.device
+    x, I, cI, starts = stream.forecast_windows(history_window, slide_step)
+    if len(starts) == 0:
+        return None
+    x, I, cI = (torch.from_numpy(each).to(device) for each in (x, I, cI))
+    h = None if stream.hidden is None else torch.from_numpy(stream.hidden).to(device)
+
+    model.eval()
+    with torch.no_grad():
+        active_pred, phy_active, h = forecast(model, x, cI, N, I, regions, h=h)
+
+    stream.next_start = int(starts[-1]) + slide_step
+    stream.hidden = h.cpu().numpy()
+    stream.save()
+
+    dInf_mean, dInf_std = _normaliser_tensors(stream, device)
+    active_pred = denormalise(active_pred[..., -1, :], regions, dInf_mean[:, 0], dInf_std[:, 0])
+    return active_pred, phy_active[..., -1, :]
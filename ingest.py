@@ -0,0 +1,155 @@
+"""Ingestion of the state case, metadata and covid data CSVs.
+
+merge_sources runs the melt / merge pipeline and returns the long-form table (one row per
+state and date). load_dataset caches its result as the (n_loc, T, n_channels) feature tensor
+in an .npz keyed by a hash of the source files, so later runs skip the CSV parsing, melt and merges;
+the hash itself is only recomputed when a file's size or modification time changes.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from features import STATIC_COLUMNS, assemble_features
+
+# bump when the merge or the cached layout changes, to invalidate old cache files
+INGEST_VERSION = 2
+SOURCES_FILE = 'sources.json'
+
+
+def merge_sources(cases_path, metadata_path, other_covid_data_path, year='2020'):
+    """
+    1. State Covid Cases (active cases only)
+    2. State Metadata (county level)
+    3. State Covid Data (recovered/hospitalised cases)
+    combined into one long table on state and date, for the given year only.
+    """
+    cases_data = pd.read_csv(cases_path)
+    metadata = pd.read_csv(metadata_path)
+
+    # metadata is by county so we have to combine it to state level datat
+    state_meta = metadata.groupby('state_name').agg({
+        'population': 'sum',  # sum of all the county populations in a state
+        'density': 'mean',    # calculate mean state population density
+        'lat': 'mean',        # calculate mean state latitude
+        'lng': 'mean'         # calculate mean state longitude
+    }).reset_index()
+
+    state_meta = state_meta.rename(columns={'state_name': 'State', 'population': 'Population', 'density': 'Population_Density', 'lat': 'Latitude', 'lng': 'Longitude'})
+
+    # combine metadata with state cases data
+    merged_data = pd.merge(cases_data, state_meta, how='inner', on='State')
+
+    # making all dates datetime format, parsing the headers in one call
+    date_columns = merged_data.columns[1:-4]
+    iso_dates = pd.to_datetime(date_columns, format='mixed').strftime('%Y-%m-%d')
+    merged_data = merged_data.rename(columns=dict(zip(date_columns, iso_dates)))
+
+    # taking only one year of data
+    columns_to_keep = [col for col in merged_data.columns if col.startswith(year)]
+    non_date_columns = ['State', 'Population', 'Population_Density', 'Latitude', 'Longitude']
+    df_year = merged_data[non_date_columns + columns_to_keep]
+
+    #convert csv to long form
+    df_year = pd.melt(df_year, id_vars=non_date_columns, var_name='Date', value_name='Confirmed_Cases')
+
+    # finally combine that with the rest of the covid data on state and date (recovered/hospitalised)
+    other_covid_data = pd.read_csv(other_covid_data_path)
+    final_covid_data = other_covid_data.drop(columns=['longitude', 'latitude', 'fips', 'confirmed'])
+    final_covid_data = final_covid_data.rename(columns={'state': 'State', 'date_today': 'Date', 'active' : 'Active_Cases', 'hospitalization':'Hospitalised_Cases', 'new_cases': 'New_cases', 'deaths': 'Deaths', 'recovered': 'Recovered_Cases'})
+
+    return pd.merge(df_year, final_covid_data, how='inner', on=['State', 'Date'])
+
+
+def table_to_arrays(data):
+    """
+    The long table as arrays: states (first-appearance order, like data['State'].unique()),
+    sorted dates, the per-state static columns, the float32 feature tensor and its channel names.
+    """
+    states, dates, static, features, channels = assemble_features(data)
+    return {
+        'states': states,
+        'dates': dates,
+        'static': static,
+        'features': features,
+        'channels': np.asarray(channels, dtype=str),
+    }
+
+
+def _content_hash(paths, year):
+    digest = hashlib.sha256(f'{INGEST_VERSION}:{year}'.encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def source_hash(*paths, year='2020', cache_dir=None):
+    """
+    Hash of the source files' contents. With cache_dir the hash is remembered in
+    cache_dir/sources.json against every file's (path, size, mtime_ns) and the files are only
+    read again once one of those changes, so a warm start costs a stat per file.
+    """
+    stats = []
+    for path in paths:
+        stat = os.stat(path)
+        stats.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    stat_key = json.dumps([INGEST_VERSION, year, stats])
+
+    index_path = None if cache_dir is None else os.path.join(cache_dir, SOURCES_FILE)
+    index = {}
+    if index_path is not None and os.path.exists(index_path):
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except ValueError:
+            # a damaged index only costs a rehash
+            index = {}
+    if stat_key in index:
+        return index[stat_key]
+
+    key = _content_hash(paths, year)
+    if index_path is not None:
+        index[stat_key] = key
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f'{index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, index_path)
+    return key
+
+
+def load_dataset(cases_path, metadata_path, other_covid_data_path, year='2020', cache_dir='ingest_cache'):
+    """
+    The arrays of table_to_arrays for the given sources, from cache_dir when the same source
+    files were ingested before. cache_dir=None always rebuilds and writes nothing.
+    """
+    if cache_dir is not None:
+        key = source_hash(cases_path, metadata_path, other_covid_data_path, year=year, cache_dir=cache_dir)
+        cache_path = os.path.join(cache_dir, f'dataset_{key}.npz')
+        if os.path.exists(cache_path):
+            with np.load(cache_path, allow_pickle=False) as cached:
+                return {name: cached[name] for name in cached.files}
+
+    arrays = table_to_arrays(merge_sources(cases_path, metadata_path, other_covid_data_path, year=year))
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write then rename so an interrupted run never leaves a truncated cache file
+        tmp_path = cache_path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, cache_path)
+    return arrays
+
+
+def static_table(dataset):
+    """
+    One row per state with the static columns, the layout similarity.node_static_table produces.
+    """
+    table = pd.DataFrame(dataset['static'], columns=STATIC_COLUMNS)
+    table.insert(0, 'State', dataset['states'])
+    return table
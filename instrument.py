@@ -0,0 +1,242 @@
+"""Opt-in performance instrumentation for the training loop.
+
+An Instrument times named stages (wall clock, accumulated per epoch), tracks the peak RSS
+and optionally counts tensor allocations, and appends one JSON line per epoch to a log;
+the first line of every run records the commit and versions, so logs from different
+commits can be compared. Selected epochs can also be recorded with torch.profiler and
+written as Chrome traces (chrome://tracing or https://ui.perfetto.dev), the stages showing
+up as labelled ranges.
+
+    instrument = Instrument('metrics.jsonl', profile_epochs=[1], trace_dir='traces')
+    model.instrument = instrument           # GNN.forward then times gat / gru / heads / sir
+    for epoch in range(epochs):
+        with instrument.epoch(epoch):
+            with instrument.stage('backward'):
+                loss.backward()
+            instrument.log(loss=loss.item())
+
+NullInstrument has the same interface and does nothing, for uninstrumented runs.
+To compare the runs in a log (median seconds per stage, run by run with their commits):
+
+    python instrument.py metrics.jsonl
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import torch
+from torch.utils._python_dispatch import TorchDispatchMode
+from torch.utils._pytree import tree_flatten
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+
+def git_commit(path=None):
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=path or os.path.dirname(os.path.abspath(__file__)),
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _storages(tree):
+    return {t.untyped_storage().data_ptr() for t in tree_flatten(tree)[0] if isinstance(t, torch.Tensor)}
+
+
+class AllocationCounter(TorchDispatchMode):
+    """
+    Counts the tensors aten ops allocate and their bytes: outputs whose storage is not one
+    of the inputs' (views and in-place results are not allocations). Slows every op down,
+    which the stage timers then include.
+    """
+
+    def __init__(self):
+        super(AllocationCounter, self).__init__()
+        self.count = 0
+        self.bytes = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        out = func(*args, **(kwargs or {}))
+        inputs = _storages((args, kwargs))
+        for tensor in tree_flatten(out)[0]:
+            if isinstance(tensor, torch.Tensor):
+                storage = tensor.untyped_storage()
+                if storage.data_ptr() not in inputs:
+                    self.count += 1
+                    self.bytes += storage.nbytes()
+        return out
+
+
+class Instrument:
+    """
+    log_path: JSONL file appended to (None keeps the records in self.records only).
+    profile_epochs: epochs to record with torch.profiler into trace_dir/epoch_<n>.json.
+    count_allocations: count tensor allocations with an AllocationCounter during epochs.
+    sync: synchronise CUDA at stage boundaries so GPU time lands in the right stage
+    (default: when CUDA is available).
+    """
+
+    def __init__(self, log_path='metrics.jsonl', profile_epochs=(), trace_dir='traces', count_allocations=False,
+                 sync=None, **run_info):
+        self.log_path = log_path
+        self.profile_epochs = set(profile_epochs)
+        self.trace_dir = trace_dir
+        self.count_allocations = count_allocations
+        self.sync = torch.cuda.is_available() if sync is None else sync
+        self.records = []
+        self._reset()
+        self._profiling = False
+        self._write({
+            'event': 'run',
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'threads': torch.get_num_threads(),
+            'host': platform.node(),
+            **run_info,
+        })
+
+    def _reset(self):
+        self.stages = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.metrics = {}
+
+    def _write(self, record):
+        self.records.append(record)
+        if self.log_path is not None:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def _synchronize(self):
+        if self.sync and torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """wall clock of the block, added to the epoch's total for name (stages may nest)"""
+        self._synchronize()
+        start = time.perf_counter()
+        with torch.profiler.record_function(name) if self._profiling else contextlib.nullcontext():
+            try:
+                yield
+            finally:
+                self._synchronize()
+                self.stages[name] += time.perf_counter() - start
+                self.calls[name] += 1
+
+    def log(self, **metrics):
+        """values (losses etc.) to add to the current epoch's record"""
+        self.metrics.update({name: float(value) for name, value in metrics.items()})
+
+    @contextlib.contextmanager
+    def epoch(self, epoch):
+        """one epoch: resets the stage totals, profiles if selected, writes the record on exit"""
+        self._reset()
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        counter = AllocationCounter() if self.count_allocations else None
+        profiler = None
+        if epoch in self.profile_epochs:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            profiler = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+
+        start = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            if profiler is not None:
+                stack.enter_context(profiler)
+                self._profiling = True
+            if counter is not None:
+                stack.enter_context(counter)
+            try:
+                yield self
+            finally:
+                self._profiling = False
+        seconds = time.perf_counter() - start
+
+        record = {
+            'event': 'epoch',
+            'epoch': epoch,
+            'seconds': seconds,
+            'stages': dict(self.stages),
+            'calls': dict(self.calls),
+            'peak_rss_mb': peak_rss_mb(),
+            **self.metrics,
+        }
+        if counter is not None:
+            record['allocations'] = counter.count
+            record['allocated_mb'] = counter.bytes / 1024 ** 2
+        if torch.cuda.is_available():
+            record['cuda_peak_mb'] = torch.cuda.max_memory_allocated() / 1024 ** 2
+        if profiler is not None:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            record['trace'] = os.path.join(self.trace_dir, f'epoch_{epoch}.json')
+            profiler.export_chrome_trace(record['trace'])
+        self._write(record)
+
+
+class NullInstrument:
+    """Instrument's interface, doing nothing."""
+
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def log(self, **metrics):
+        pass
+
+    def epoch(self, epoch):
+        return contextlib.nullcontext(self)
+
+
+def read_log(path):
+    """the records of a JSONL log, grouped by run: [(run record, [epoch records])]"""
+    runs = []
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['event'] == 'run':
+                runs.append((record, []))
+            elif runs:
+                runs[-1][1].append(record)
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Median stage times of every run in an Instrument log.')
+    parser.add_argument('log')
+    parser.add_argument('--skip', type=int, default=1, help='warm-up epochs left out of each run')
+    args = parser.parse_args()
+
+    import numpy as np
+
+    for run, epochs in read_log(args.log):
+        # profiled epochs run much slower, leave them out
+        epochs = [epoch for epoch in epochs[args.skip:] if 'trace' not in epoch] or epochs
+        commit = (run.get('commit') or 'unknown')[:10]
+        print(f"{run['time']} {commit} torch {run['torch']}, {len(epochs)} epochs")
+        if not epochs:
+            continue
+        names = sorted({name for epoch in epochs for name in epoch['stages']})
+        for name in ['seconds'] + names:
+            values = [epoch['seconds'] if name == 'seconds' else epoch['stages'].get(name, 0.0) for epoch in epochs]
+            print(f'  {name:<12} {np.median(values) * 1e3:9.1f}ms')
+        print(f"  {'peak RSS':<12} {max(epoch['peak_rss_mb'] for epoch in epochs):9.0f}MB")
+
+
+if __name__ == '__main__':
+    main()
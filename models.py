@@ -0,0 +1,361 @@
+"""GAT + GRU forecaster with an SIR physics branch."""
+
+import contextlib
+
+import dgl.function as fn
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from dgl.nn.functional import edge_softmax
+
+
+def initialise_weights(m):
+    if isinstance(m, nn.Linear):
+        nn.init.xavier_uniform_(m.weight)
+        nn.init.zeros_(m.bias)
+    elif isinstance(m, nn.GRUCell):
+        for name, param in m.named_parameters():
+            if 'weight_ih' in name:
+                nn.init.xavier_uniform_(param.data)
+            elif 'weight_hh' in name:
+                nn.init.orthogonal_(param.data)
+            elif 'bias' in name:
+                param.data.fill_(0)
+
+
+def sir_rollout(alpha, I0, N, pred_window: int):
+    """
+    SIR physics rollout for every timestep at once: alpha and I0 hold one entry per
+    timestep, the result is (..., pred_window) daily new infections. Same recurrence and
+    detach points as stepping each window separately, so gradients are unchanged.
+    Plain tensor ops, usable under torch.jit.script / torch.compile.
+    """
+    last_I = I0
+    out = []
+    for i in range(pred_window):
+        last_S = N - last_I
+
+        dI = alpha * last_I * (last_S/N)
+        out.append(dI)
+        last_I = last_I + dI.detach()
+    return torch.stack(out, dim=-1)
+
+
+def _stage(instrument, name):
+    return contextlib.nullcontext() if instrument is None else instrument.stage(name)
+
+
+def gru_sequence(inputs, h, w_ih, w_hh, b_ih, b_hh, train: bool = True):
+    """
+    nn.GRUCell over inputs (batch, timestep, in) from h, every step's state (batch, timestep, hidden).
+    Runs nn.GRU's fused kernel on the cell's weights, so the steps loop in C++ with the same
+    arithmetic as calling the cell step by step. Usable under torch.jit.script / torch.compile.
+    """
+    return torch.gru(inputs, h.unsqueeze(0), [w_ih, w_hh, b_ih, b_hh], True, 1, 0.0, train, False, True)[0]
+
+
+def gat_heads(g, h, heads):
+    """
+    Runs a list of GAT heads on g in one pass with DGL built-in kernels.
+    The per-head fc / attn_fc weights are stacked so all heads share one projection,
+    one u_add_v, one edge_softmax and one u_mul_e/sum.
+    h is (num_nodes, ..., in_dim); any extra dims (e.g. timesteps) are propagated
+    independently in the same kernels. Returns (num_nodes, ..., num_heads, out_dim).
+    g may also be a sampled block (dgl.dataloading): h then holds its source nodes and the
+    result its destination nodes, which DGL places first among the sources.
+    """
+    num_heads = len(heads)
+    out_dim = heads[0].fc.out_features
+
+    weight = torch.cat([head.fc.weight for head in heads], dim=0)
+    bias = torch.cat([head.fc.bias for head in heads], dim=0)
+    z = F.linear(h, weight, bias).view(*h.shape[:-1], num_heads, out_dim)
+
+    attn = torch.stack([head.attn_fc.weight.view(2, out_dim) for head in heads], dim=0)
+    attn_bias = torch.stack([head.attn_fc.bias for head in heads], dim=0)
+    return gat_propagate(g, z, attn, attn_bias)
+
+
+def gat_propagate(g, z, attn, attn_bias):
+    """
+    The attention and message passing of gat_heads for already projected z (num_nodes, ...,
+    num_heads, out_dim), with attn (num_heads, 2, out_dim) the source / destination halves
+    of each head's attn_fc weight and attn_bias (num_heads, 1).
+    """
+    # attn_fc on [z_src, z_dst] splits into a source and a destination term
+    el = (z * attn[:, 0]).sum(dim=-1, keepdim=True)
+    er = (z * attn[:, 1]).sum(dim=-1, keepdim=True)
+
+    with g.local_scope():
+        # on a plain graph srcdata and dstdata are both ndata
+        g.srcdata.update({'z': z, 'el': el})
+        g.dstdata['er'] = er[:g.num_dst_nodes()]
+        g.apply_edges(fn.u_add_v('el', 'er', 'e'))
+        e = F.leaky_relu(g.edata.pop('e') + attn_bias)
+        # under autocast z may be lower precision than the softmax, message passing needs one dtype
+        g.edata['a'] = edge_softmax(g, e).to(z.dtype)
+        g.update_all(fn.u_mul_e('z', 'a', 'm'), fn.sum('m', 'h'))
+        return g.dstdata['h']
+
+
+class GAT(nn.Module):
+    def __init__(self, g, in_dim, out_dim):
+        super(GAT, self).__init__()
+        self.g = g
+        self.fc = nn.Linear(in_dim, out_dim)
+        self.attn_fc = nn.Linear(2 * out_dim, 1)
+        self.reset_parameters()
+
+    def reset_parameters(self):
+        gain = nn.init.calculate_gain('relu')
+        nn.init.xavier_normal_(self.fc.weight, gain=gain)
+        nn.init.xavier_normal_(self.attn_fc.weight, gain=gain)
+
+    def forward(self, h, block=None):
+        return gat_heads(self.g if block is None else block, h, [self])[..., 0, :]
+
+
+class MHGAT(nn.Module):
+    def __init__(self, g, in_dim, out_dim, num_heads, merge='cat'):
+        super(MHGAT, self).__init__()
+        self.g = g
+        self.heads = nn.ModuleList()
+        for i in range(num_heads):
+            self.heads.append(GAT(g, in_dim, out_dim))
+        self.merge = merge
+
+    def forward(self, h, block=None):
+        """h on the full graph g, or on the source nodes of a sampled block"""
+        head_outs = gat_heads(self.g if block is None else block, h, self.heads)
+        if self.merge == 'cat':
+            return head_outs.flatten(-2)
+        else:
+            return torch.mean(head_outs)
+
+
+class GATUDF(GAT):
+    """Reference GAT head with Python message / reduce functions."""
+
+    def edge_attention(self, edges):
+        z2 = torch.cat([edges.src['z'], edges.dst['z']], dim=1)
+        a = self.attn_fc(z2)
+        return {'e': F.leaky_relu(a)}
+
+    def message_func(self, edges):
+        return {'z': edges.src['z'], 'e': edges.data['e']}
+
+    def reduce_func(self, nodes):
+        alpha = F.softmax(nodes.mailbox['e'], dim=1)
+        h = torch.sum(alpha * nodes.mailbox['z'], dim=1)
+        return {'h': h}
+
+    def forward(self, h):
+        z = self.fc(h)
+        self.g.ndata['z'] = z
+        self.g.apply_edges(self.edge_attention)
+        self.g.update_all(self.message_func, self.reduce_func)
+        return self.g.ndata.pop('h')
+
+
+class MHGATUDF(nn.Module):
+    """Reference multi-head GAT running one UDF head at a time; same state_dict as MHGAT."""
+
+    def __init__(self, g, in_dim, out_dim, num_heads, merge='cat'):
+        super(MHGATUDF, self).__init__()
+        self.heads = nn.ModuleList()
+        for i in range(num_heads):
+            self.heads.append(GATUDF(g, in_dim, out_dim))
+        self.merge = merge
+
+    def forward(self, h):
+        head_outs = [attn_head(h) for attn_head in self.heads]
+        if self.merge == 'cat':
+            return torch.cat(head_outs, dim=1)
+        else:
+            return torch.mean(torch.stack(head_outs))
+
+
+class GNN(nn.Module):
+    """
+    With batch_time=True the GAT layers see the whole (num_loc, timestep, n_feat) input in
+    one graph call, since they do not depend on the GRU state; only the GRU runs step by step.
+    batch_time=False propagates one timestep at a time as before.
+
+    readout='global' max-pools the graph into one GRU state and forecasts the single region
+    whose cI / N / I are passed in. readout='node' runs the (shared) GRU and heads on every
+    node's own embedding, forecasting all nodes - or the `regions` index subset - in one pass;
+    cI and I are then (num_regions, timestep) and N is (num_regions,) or (num_regions, 1).
+    Both modes have the same parameters.
+
+    blocks, the two message flow graphs of a dgl.dataloading neighbor sampler, run the
+    layers on a sampled subgraph instead of g (readout='node' only): dynamic then holds the
+    input nodes of the first block and cI / N / I the output nodes of the last, which are
+    the regions forecast.
+
+    dynamic may also carry a leading batch dim of independent sequences, (batch, num_loc,
+    timestep, n_feat), with cI / I of shape (batch, timestep) or (batch, num_regions, timestep);
+    outputs then keep those leading dims.
+
+    Execution options, none of which change the parameters:
+    debug=True checks for NaNs after each layer and GRU step (each check syncs with the device).
+    compile_mode='script' or 'compile' runs the GRU recurrence and the SIR rollout through
+    torch.jit.script / torch.compile; the DGL graph layers stay eager. (Not named compile,
+    which would shadow nn.Module.compile.)
+    autocast_dtype=torch.bfloat16 runs the graph layers and heads under autocast on the model's
+    device; the GRU state and the SIR rollout stay float32, as do the outputs.
+    Setting model.instrument to an instrument.Instrument times the gat / gru / heads / sir
+    stages of every forward (backward time is not included).
+
+    physics_only=True skips the nn_res_I head and returns None for new_I, for validation,
+    which only scores the physics branch.
+    """
+
+    def __init__(self, g, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads, pred_window, device,
+                 batch_time=True, readout='global', debug=False, compile_mode=None, autocast_dtype=None):
+        super(GNN, self).__init__()
+        self.g = g
+
+        self.layer1 = MHGAT(self.g, in_dim, hidden_dim1, num_heads)
+        self.layer2 = MHGAT(self.g, hidden_dim1 * num_heads, hidden_dim2, 1)
+
+        self.pred_window = pred_window
+        self.gru = nn.GRUCell(hidden_dim2, gru_dim)
+
+        self.nn_res_I = nn.Linear(gru_dim + 1, pred_window)
+
+        self.nn_res_sir = nn.Linear(gru_dim + 1, 1)
+
+        self.hidden_dim2 = hidden_dim2
+        self.gru_dim = gru_dim
+        self.device = device
+        self.batch_time = batch_time
+        if readout not in ('global', 'node'):
+            raise ValueError(f"unknown readout {readout!r}, expected 'global' or 'node'")
+        self.readout = readout
+
+        self.debug = debug
+        self.autocast_dtype = autocast_dtype
+        if compile_mode is None:
+            self._gru_sequence, self._sir_rollout = gru_sequence, sir_rollout
+        elif compile_mode == 'script':
+            self._gru_sequence, self._sir_rollout = torch.jit.script(gru_sequence), torch.jit.script(sir_rollout)
+        elif compile_mode == 'compile':
+            self._gru_sequence, self._sir_rollout = torch.compile(gru_sequence), torch.compile(sir_rollout)
+        else:
+            raise ValueError(f"unknown compile_mode {compile_mode!r}, expected None, 'script' or 'compile'")
+        self.compile_mode = compile_mode
+        self.instrument = None
+
+    def node_embed(self, dynamic, blocks=None):
+        """the two GAT layers, one embedding per graph node (per output node of the blocks)"""
+        block1, block2 = (None, None) if blocks is None else blocks
+        cur_h = self.layer1(dynamic, block1)
+
+        if self.debug and torch.isnan(cur_h).any():
+            print("NaN detected after layer1")
+
+        cur_h = F.elu(cur_h)
+        cur_h = self.layer2(cur_h, block2)
+
+        if self.debug and torch.isnan(cur_h).any():
+            print("NaN detected after layer2")
+
+        return F.elu(cur_h)
+
+    def graph_embed(self, dynamic, blocks=None):
+        cur_h = self.node_embed(dynamic, blocks)
+
+        if self.readout == 'global':
+            # max pooling over locations
+            cur_h = torch.max(cur_h, 0, keepdim=True)[0]
+        return cur_h
+
+    def recurrence(self, inputs, h):
+        """GRU over inputs (num_out, timestep, hidden_dim2) from h, every step's state."""
+        # the recurrent state stays float32 under autocast, rounding it every step compounds
+        inputs, h = inputs.float(), h.float()
+        with torch.autocast(inputs.device.type, enabled=False):
+            if not self.debug:
+                return self._gru_sequence(inputs, h, self.gru.weight_ih, self.gru.weight_hh,
+                                          self.gru.bias_ih, self.gru.bias_hh, self.training)
+            out = []
+            for each_step in range(inputs.shape[1]):
+                h = self.gru(inputs[:, each_step], h)
+                if torch.isnan(h).any():
+                    print("NaN detected after GRU at timestep:", each_step)
+                out.append(h)
+            return torch.stack(out, dim=1)
+
+    def forward(self, dynamic, cI, N, I, h=None, regions=None, blocks=None, physics_only=False):
+        # an optional leading batch dim holds independent sequences (e.g. DataLoader chunks)
+        batched = dynamic.dim() == 4
+        if not batched:
+            dynamic = dynamic.unsqueeze(0)
+        batch_size, num_loc, timestep, n_feat = dynamic.size()
+
+        if self.readout == 'global' and regions is not None:
+            raise ValueError("regions needs readout='node'")
+        if blocks is not None and (self.readout == 'global' or regions is not None):
+            raise ValueError("blocks need readout='node' and pick their own regions")
+
+        # one GRU row per sequence (global) or per sequence and region (node), batch-major
+        out_shape = cI.shape[:-1] if batched else (cI.shape[0] if self.readout == 'node' else 1,)
+        cI, I = cI.reshape(-1, cI.shape[-1]), I.reshape(-1, I.shape[-1])
+        num_out = cI.shape[0]
+        N = N.reshape(-1, 1)
+        if N.shape[0] not in (1, num_out):
+            N = N.repeat(num_out // N.shape[0], 1)
+
+        if h is None:
+            h = torch.zeros(num_out, self.gru_dim).to(self.device)
+            gain = nn.init.calculate_gain('relu')
+            nn.init.xavier_normal_(h, gain=gain)
+
+        def readout_rows(cur_h):
+            # (num_loc or 1, batch, ..., hidden) -> (num_out, ..., hidden)
+            if regions is not None:
+                cur_h = cur_h[regions]
+            return cur_h.transpose(0, 1).reshape(num_out, *cur_h.shape[2:])
+
+        with torch.autocast(dynamic.device.type, dtype=self.autocast_dtype or torch.bfloat16,
+                            enabled=self.autocast_dtype is not None):
+            if self.batch_time:
+                with _stage(self.instrument, 'gat'):
+                    cur_h = readout_rows(self.graph_embed(dynamic.transpose(0, 1), blocks))
+                with _stage(self.instrument, 'gru'):
+                    all_h = self.recurrence(cur_h, h)
+            else:
+                all_h = []
+                for each_step in range(timestep):
+                    with _stage(self.instrument, 'gat'):
+                        cur_h = readout_rows(self.graph_embed(dynamic[:, :, each_step, :].transpose(0, 1), blocks))
+                    with _stage(self.instrument, 'gru'):
+                        h = self.recurrence(cur_h.unsqueeze(1), h)[:, 0]
+                    all_h.append(h)
+                all_h = torch.stack(all_h, dim=1)
+            h = all_h[:, -1]
+
+            with _stage(self.instrument, 'heads'):
+                # the heads only read [h, cI] of each step, so they run once over all steps
+                hc = torch.cat((all_h, cI[:, :timestep, None].to(all_h.dtype)), dim=-1)
+                # (num_out, timestep, pred_window)
+                new_I = None if physics_only else self.nn_res_I(hc).float()
+                alpha = self.nn_res_sir(hc)[..., 0].float()
+
+        alpha_scaled = torch.sigmoid(alpha)
+
+        # physics branch for all timesteps in one rollout, in float32
+        with _stage(self.instrument, 'sir'):
+            phy_I = self._sir_rollout(alpha_scaled, I[:, :timestep].float(), N.float(), self.pred_window)
+
+        # kept for inspection only, detached so they do not hold on to the autograd graph
+        self.alpha_list = alpha.detach()
+        self.alpha_scaled = alpha_scaled.detach()
+        if self.readout == 'global' and not batched:
+            self.alpha_list = self.alpha_list.squeeze()
+            self.alpha_scaled = self.alpha_scaled.squeeze()
+
+        if new_I is not None:
+            new_I = new_I.reshape(*out_shape, timestep, self.pred_window)
+        phy_I = phy_I.reshape(*out_shape, timestep, self.pred_window)
+        return new_I, phy_I, h
@@ -0,0 +1,79 @@
+"""Dependency-light forecasts from a model written by export.py.
+
+Needs numpy and either torch (for the TorchScript .pt) or onnxruntime (for the .onnx), none
+of DGL, pandas or the training code:
+
+    forecaster = ExportedForecaster('forecaster.json')
+    active_pred, phy_active, h = forecaster(dynamic, cI, N, I, h)
+    daily_new_infections = forecaster.denormalise(active_pred)
+
+Inputs are the unbatched windows of all regions as numpy arrays (see export.StaticGNN);
+h=None starts from zeros.
+"""
+
+import json
+import os
+
+import numpy as np
+
+INPUT_NAMES = ['dynamic', 'cI', 'N', 'I', 'h']
+
+
+class ExportedForecaster:
+    """
+    The exported model described by an export.py .json file, run with the backend of its
+    format. The .json fields (states, pred_window, normaliser, ...) are in self.meta.
+    """
+
+    def __init__(self, meta_path, threads=None):
+        with open(meta_path) as f:
+            self.meta = json.load(f)
+        path = os.path.join(os.path.dirname(os.path.abspath(meta_path)), self.meta['model'])
+        self.format = self.meta['format']
+        self.states = self.meta['states']
+        self.pred_window = self.meta['pred_window']
+        self.num_out = self.meta['num_nodes'] if self.meta['readout'] == 'node' else 1
+
+        if self.format == 'torchscript':
+            import torch
+
+            if threads is not None:
+                torch.set_num_threads(threads)
+            self._torch = torch
+            self.model = torch.jit.load(path, map_location='cpu').eval()
+        elif self.format == 'onnx':
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            if threads is not None:
+                options.intra_op_num_threads = threads
+            self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        else:
+            raise ValueError(f"unknown format {self.format!r}, expected 'torchscript' or 'onnx'")
+
+    def __call__(self, dynamic, cI, N, I, h=None):
+        """(active_pred, phy_active, h) as numpy arrays, active_pred on the normalised dInf scale"""
+        if h is None:
+            h = np.zeros((self.num_out, self.meta['gru_dim']), dtype=np.float32)
+        inputs = [np.ascontiguousarray(x, dtype=np.float32) for x in (dynamic, cI, N, I, h)]
+        if self.format == 'onnx':
+            return tuple(self.session.run(None, dict(zip(INPUT_NAMES, inputs))))
+        with self._torch.inference_mode():
+            outputs = self.model(*[self._torch.from_numpy(x) for x in inputs])
+        return tuple(out.numpy() for out in outputs)
+
+    def denormalise(self, pred, regions=None):
+        """
+        training.denormalise with the exported normaliser: (num_regions, ...) daily new infections.
+        regions defaults to all of them, or for readout='global' to the exported forecast region.
+        """
+        stats = self.meta['normaliser']['dInf']
+        mean, std = np.asarray(stats['mean']), np.asarray(stats['std'])
+        if regions is None and self.meta['readout'] == 'global':
+            if self.meta.get('region') is None:
+                raise ValueError("readout='global' forecasts one region: pass regions=[index], or export with region")
+            regions = [self.meta['region']]
+        if regions is not None:
+            mean, std = mean[regions], std[regions]
+        shape = (-1,) + (1,) * (np.ndim(pred) - 1)
+        return pred * (std.reshape(shape) + 1e-5) + mean.reshape(shape)
@@ -0,0 +1,85 @@
+"""Neighbor-sampled training for graphs too large for a full-graph pass every step.
+
+Each batch is a set of seed regions plus the two message flow graphs (blocks) a
+dgl.dataloading.NeighborSampler draws for them, one per MHGAT layer; the model reads the
+features of the sampled input nodes only and forecasts the seeds. Sampling runs in the
+DataLoader's worker processes. Over the windows every region keeps its own GRU row, so a
+batch of seeds is the same computation as readout='node' restricted to those regions,
+with each seed's neighbourhood capped at the fanouts.
+"""
+
+import dgl.dataloading
+import numpy as np
+import torch
+
+from training import mae, normalise_phy
+from windows import seed_worker
+
+
+def neighbor_loader(g, nodes=None, fanouts=(10, 10), batch_size=1024, shuffle=True, num_workers=0, seed=None):
+    """
+    dgl DataLoader yielding (input_nodes, output_nodes, blocks) for the seed nodes (all of
+    g's by default). fanouts gives the neighbours sampled per node for the first and second
+    layer, -1 taking all of them; fanouts=None samples every neighbour (for inference).
+    Shuffling is seeded from numpy's global RNG unless seed is given, like windows.make_loader.
+    """
+    if nodes is None:
+        nodes = torch.arange(g.num_nodes())
+    if seed is None:
+        seed = int(np.random.randint(2 ** 31))
+    if fanouts is None:
+        sampler = dgl.dataloading.MultiLayerFullNeighborSampler(2)
+    else:
+        sampler = dgl.dataloading.NeighborSampler(list(fanouts))
+
+    kwargs = {}
+    if num_workers > 0:
+        kwargs = {'persistent_workers': True, 'worker_init_fn': seed_worker}
+    return dgl.dataloading.DataLoader(g, torch.as_tensor(nodes), sampler, batch_size=batch_size, shuffle=shuffle,
+                                      drop_last=False, num_workers=num_workers,
+                                      generator=torch.Generator().manual_seed(seed), **kwargs)
+
+
+def sampled_forecast(model, blocks, x, cI, N, I, input_nodes, output_nodes, h=None):
+    """forward pass on one sampled batch, (active_pred, phy_active, h) for output_nodes"""
+    device = x.device
+    blocks = [block.to(device) for block in blocks]
+    input_nodes, output_nodes = input_nodes.to(device), output_nodes.to(device)
+    return model(x[input_nodes], cI[output_nodes], N[output_nodes], I[output_nodes], h=h, blocks=blocks)
+
+
+def sampled_epoch(model, optimizer, loader, x, cI, N, I, yI, dInf_mean, dInf_std, criterion, phy_weight=0.1):
+    """
+    One epoch over the batches of a neighbor_loader, one optimizer step per batch.
+    x / cI / I / yI hold every node, as prep_data returns them. Returns (mean loss, mean MAE).
+    """
+    losses, maes = [], []
+    model.train()
+    for input_nodes, output_nodes, blocks in loader:
+        optimizer.zero_grad()
+        active_pred, phy_active, _ = sampled_forecast(model, blocks, x, cI, N, I, input_nodes, output_nodes)
+        output_nodes = output_nodes.to(x.device)
+        phy_active = normalise_phy(phy_active, output_nodes, dInf_mean, dInf_std)
+        target = yI[output_nodes]
+
+        loss = criterion(active_pred, target) + phy_weight * criterion(phy_active, target)
+        loss.backward()
+        optimizer.step()
+        losses.append(loss.item())
+        maes.append(mae(active_pred, target).item())
+    return float(np.mean(losses)), float(np.mean(maes))
+
+
+def sampled_predict(model, loader, x, cI, N, I):
+    """
+    (active_pred, phy_active) for every seed node of an unshuffled loader, in seed order,
+    without ever running the layers on the full graph. Use fanouts=None for the exact forecast.
+    """
+    model.eval()
+    active, phy = [], []
+    with torch.no_grad():
+        for input_nodes, output_nodes, blocks in loader:
+            active_pred, phy_active, _ = sampled_forecast(model, blocks, x, cI, N, I, input_nodes, output_nodes)
+            active.append(active_pred)
+            phy.append(phy_active)
+    return torch.cat(active), torch.cat(phy)
@@ -0,0 +1,332 @@
+"""Forecast service: the trained model, graph and normaliser loaded once, micro-batched requests.
+
+Run from the repository root after training (best_stan_model1.pth) and writing the feature
+stream (feature_stream/, see incremental.py):
+
+    python serve.py --port 8000
+    curl -s localhost:8000/forecast -d '{"regions": ["California", "Texas"]}'
+
+    echo '{"regions": ["California"]}' | python serve.py --stdin
+
+The GRU state over the history is computed once and kept, so a request only runs the graph
+layers and one GRU step on the latest window. Requests arriving within max_wait of each other
+share one forward pass. New days appended to the stream are picked up before the next batch.
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import torch
+
+from features import STATIC_COLUMNS
+from graph_builder import build_graph
+from incremental import META_FILE, FeatureStream
+from models import GNN
+from training import denormalise, forecast, load_checkpoint
+
+
+def model_from_checkpoint(file_name, g, device, readout=None):
+    """
+    GNN with the layer sizes and readout of a {'state', 'optimizer', 'readout'} checkpoint,
+    weights loaded, in eval mode. readout is needed for checkpoints written before it was
+    saved (default 'node'); given for a newer one, it has to match the saved readout.
+    """
+    bundle = torch.load(file_name, map_location=device)
+    state = bundle['state']
+    saved = bundle.get('readout')
+    if readout is not None and saved is not None and readout != saved:
+        raise ValueError(f'{file_name} was trained with readout={saved!r}, not {readout!r}')
+    readout = saved or readout or 'node'
+    num_heads = len({key.split('.')[2] for key in state if key.startswith('layer1.heads.')})
+    hidden_dim1, in_dim = state['layer1.heads.0.fc.weight'].shape
+    hidden_dim2 = state['layer2.heads.0.fc.weight'].shape[0]
+    gru_dim = state['gru.weight_hh'].shape[1]
+    pred_window = state['nn_res_I.weight'].shape[0]
+
+    model = GNN(g, in_dim, hidden_dim1, hidden_dim2, gru_dim, num_heads, pred_window, device, readout=readout)
+    load_checkpoint(file_name, model, device=device)
+    return model.to(device).eval()
+
+
+class Forecaster:
+    """
+    De-normalised forecasts from the latest window of a feature stream, for any regions.
+
+    Keeps h, the node-readout GRU state of every region after all windows but the latest one,
+    and the latest window's inputs; predict runs the graph layers over that window and a single
+    GRU step for the requested rows. Not thread safe, MicroBatcher serialises the calls.
+    readout is passed to model_from_checkpoint, for checkpoints that do not record it.
+    """
+
+    def __init__(self, checkpoint, stream_path, threshold=17, min_connections=5, slide_step=1, device=None,
+                 seed=42, readout=None):
+        self.device = device or torch.device('cpu')
+        self.stream_path = stream_path
+        self.slide_step = slide_step
+        self.seed = seed
+
+        stream = FeatureStream(stream_path)
+        self.states = list(stream.states)
+        self.index = {state: i for i, state in enumerate(self.states)}
+        table = pd.DataFrame(stream.static, columns=STATIC_COLUMNS)
+        table.insert(0, 'State', stream.states)
+        self.g = build_graph(table, threshold=threshold, min_connections=min_connections).to(self.device)
+
+        self.model = model_from_checkpoint(checkpoint, self.g, self.device, readout=readout)
+        if self.model.readout != 'node':
+            raise ValueError(f"{checkpoint} has readout={self.model.readout!r}, the service needs a 'node' readout model")
+        # one dynamic feature (normalised dInf) per day
+        self.history_window = self.model.layer1.heads[0].fc.in_features
+        self.pred_window = self.model.pred_window
+        self.N = torch.tensor(stream.static[:, 0], dtype=torch.float32, device=self.device).unsqueeze(-1)
+        self.all_regions = torch.arange(len(self.states), device=self.device)
+
+        # start of the resident latest window, h covers every window before it
+        self.start = 0
+        self.h = None
+        self.timestep = 0
+        self.version = None
+        self.refresh()
+
+    def refresh(self):
+        """Folds windows of days appended since the last refresh into h. Returns True if any."""
+        version = os.stat(os.path.join(self.stream_path, META_FILE)).st_mtime_ns
+        if version == self.version:
+            return False
+        stream = FeatureStream(self.stream_path)
+        if stream.timestep < self.timestep:
+            # rewritten from scratch, start over
+            self.start, self.h = 0, None
+        x, I, cI, starts = stream.forecast_windows(self.history_window, self.slide_step, start=self.start)
+        if len(starts) == 0:
+            raise ValueError(f'the stream has fewer than history_window={self.history_window} days')
+        x, I, cI = (torch.from_numpy(each).to(self.device) for each in (x, I, cI))
+
+        with torch.no_grad():
+            if self.h is None:
+                # GNN.forward's random initial state, made repeatable
+                torch.manual_seed(self.seed)
+                self.h = torch.zeros(len(self.states), self.model.gru_dim, device=self.device)
+                torch.nn.init.xavier_normal_(self.h, gain=torch.nn.init.calculate_gain('relu'))
+            if len(starts) > 1:
+                _, _, self.h = forecast(self.model, x[:, :-1], cI[:, :-1], self.N, I[:, :-1], self.all_regions, h=self.h)
+
+        self.x, self.I, self.cI = x[:, -1:], I[:, -1:], cI[:, -1:]
+        self.start = int(starts[-1])
+        self.timestep = stream.timestep
+        self.first_date = np.datetime64(stream.dates[-1], 'D') + 1
+        self.dInf_mean = torch.tensor(stream.stats.mean, dtype=torch.float32, device=self.device)
+        self.dInf_std = torch.tensor(stream.stats.std, dtype=torch.float32, device=self.device)
+        self.version = version
+        return True
+
+    def regions(self, names):
+        if not names:
+            raise ValueError('no regions requested')
+        unknown = [name for name in names if name not in self.index]
+        if unknown:
+            raise ValueError(f'unknown regions: {unknown}')
+        return [self.index[name] for name in names]
+
+    def predict(self, regions):
+        """
+        (active_pred, phy_active) for region indices, each (num_regions, pred_window) daily
+        new infections for the pred_window days after the last day of data.
+        """
+        regions = torch.as_tensor(regions, device=self.device)
+        with torch.no_grad():
+            active_pred, phy_active, _ = forecast(self.model, self.x, self.cI, self.N, self.I, regions,
+                                                  h=self.h[regions])
+            active_pred = denormalise(active_pred[:, -1], regions, self.dInf_mean, self.dInf_std)
+        return active_pred.cpu().numpy(), phy_active[:, -1].cpu().numpy()
+
+    def forecast_dates(self):
+        return [str(self.first_date + day) for day in range(self.pred_window)]
+
+
+class MicroBatcher:
+    """
+    Runs Forecaster.predict on a worker thread for the union of the regions of all requests
+    that arrive within max_wait seconds of the first one (up to max_batch requests).
+    """
+
+    def __init__(self, forecaster, max_batch=64, max_wait=0.002, auto_refresh=True):
+        self.forecaster = forecaster
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.auto_refresh = auto_refresh
+        self.queue = queue.Queue()
+        self.batch_sizes = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, names):
+        """Future of the response dict for region names; unknown names raise ValueError here."""
+        future = Future()
+        self.queue.put((names, self.forecaster.regions(names), future))
+        return future
+
+    def forecast(self, names, timeout=None):
+        return self.submit(names).result(timeout)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _collect(self):
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if item is None:
+                # stop after answering what was already queued
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                if self.auto_refresh:
+                    self.forecaster.refresh()
+                regions = sorted({index for _, indices, _ in batch for index in indices})
+                row = {index: i for i, index in enumerate(regions)}
+                active_pred, phy_active = self.forecaster.predict(regions)
+                dates = self.forecaster.forecast_dates()
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batch_sizes.append(len(batch))
+            for names, indices, future in batch:
+                future.set_result({
+                    'dates': dates,
+                    'forecast': {name: active_pred[row[i]].tolist() for name, i in zip(names, indices)},
+                    'physics': {name: phy_active[row[i]].tolist() for name, i in zip(names, indices)},
+                })
+
+
+def _parse_request(body):
+    request = json.loads(body)
+    names = request.get('regions')
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise ValueError('expected {"regions": [region names]}')
+    return names
+
+
+class _Server(ThreadingHTTPServer):
+    # the default listen backlog of 5 makes bursts of concurrent callers wait out a SYN retry
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def make_server(batcher, host='127.0.0.1', port=8000):
+    """
+    POST /forecast {"regions": [...]} -> {"dates", "forecast", "physics"}; GET /regions.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/regions':
+                self._reply(200, {'regions': batcher.forecaster.states})
+            else:
+                self._reply(404, {'error': f'unknown path {self.path}'})
+
+        def do_POST(self):
+            if self.path != '/forecast':
+                self._reply(404, {'error': f'unknown path {self.path}'})
+                return
+            try:
+                names = _parse_request(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                result = batcher.forecast(names)
+            except ValueError as e:
+                self._reply(400, {'error': str(e)})
+                return
+            self._reply(200, result)
+
+        def log_message(self, format, *args):
+            pass
+
+    return _Server((host, port), Handler)
+
+
+def serve_stdin(batcher, lines=sys.stdin, out=sys.stdout):
+    """one JSON request per line in, one JSON response per line out"""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            result = batcher.forecast(_parse_request(line))
+        except ValueError as e:
+            result = {'error': str(e)}
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='best_stan_model1.pth')
+    parser.add_argument('--stream', default='feature_stream')
+    parser.add_argument('--threshold', type=float, default=17)
+    parser.add_argument('--min-connections', type=int, default=5)
+    parser.add_argument('--slide-step', type=int, default=1)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--stdin', action='store_true', help='serve JSON lines on stdin instead of HTTP')
+    parser.add_argument('--readout', choices=['node', 'global'],
+                        help='the readout of a checkpoint that does not record it (checked against one that does)')
+    args = parser.parse_args()
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    forecaster = Forecaster(args.checkpoint, args.stream, args.threshold, args.min_connections, args.slide_step, device,
+                            readout=args.readout)
+    batcher = MicroBatcher(forecaster, args.max_batch, args.max_wait_ms / 1e3)
+
+    if args.stdin:
+        serve_stdin(batcher)
+        batcher.close()
+        return
+
+    server = make_server(batcher, args.host, args.port)
+    print(f'serving {len(forecaster.states)} regions on http://{args.host}:{args.port}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == '__main__':
+    main()
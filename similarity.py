@@ -0,0 +1,135 @@
+"""Gravity-law similarity between locations.
+
+The weights are computed from a per-location static table (one row per node)
+rather than by filtering the long-form case table for every pair.
+"""
+
+import math
+
+import numpy as np
+from haversine import haversine
+
+# same constant the haversine package uses for 'km'
+AVG_EARTH_RADIUS_KM = 6371.0088
+
+# default working memory for one block of the similarity matrix
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+_asin = np.frompyfunc(math.asin, 1, 1)
+
+
+def gravity_law(lat1, long1, pop1, lat2, long2, pop2, r=1e5, alpha=0.1, beta=0.1):
+    """
+    Calculates the gravity-law based distance between two points using longitude and latitude.
+    r is a scaling factor, alpha and beta are weights for population.
+    """
+    distance = haversine((lat1, long1), (lat2, long2), 'km')
+    weight = (np.exp(-distance / r)) / (abs((pop1 ** alpha) - (pop2 ** beta)) + 1e-5)
+    return weight
+
+
+def node_static_table(data, key='State'):
+    """
+    One row per location with the columns the gravity law needs, in order of first appearance
+    (the same order as data[key].unique()).
+    """
+    return data.drop_duplicates(key)[[key, 'Latitude', 'Longitude', 'Population']].reset_index(drop=True)
+
+
+def haversine_km(lat1, lng1, lat2, lng2, exact=True):
+    """
+    Broadcasting great-circle distance in km, the same formula as haversine.haversine.
+    With exact=True the arcsine goes through math.asin so the result is bit-for-bit the
+    scalar haversine; otherwise numpy's (faster, possibly 1 ulp off) arcsin is used.
+    """
+    lat1, lng1, lat2, lng2 = np.radians(lat1), np.radians(lng1), np.radians(lat2), np.radians(lng2)
+    lat = lat2 - lat1
+    lng = lng2 - lng1
+    d = np.sin(lat * 0.5) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(lng * 0.5) ** 2
+    if exact:
+        # frompyfunc hands back a bare float for scalar inputs, an object array otherwise
+        angle = np.asarray(_asin(np.sqrt(d)), dtype=np.float64)
+    else:
+        angle = np.arcsin(np.sqrt(d))
+    return AVG_EARTH_RADIUS_KM * (2 * angle)
+
+
+def gravity_weights(lat1, lng1, pop1, lat2, lng2, pop2, r=1e5, alpha=0.1, beta=0.1, exact=True):
+    """
+    Vectorised gravity_law, broadcasting over the location arrays.
+    """
+    distance = haversine_km(lat1, lng1, lat2, lng2, exact=exact)
+    return np.exp(-distance / r) / (np.abs((pop1 ** alpha) - (pop2 ** beta)) + 1e-5)
+
+
+def _as_arrays(lat, lng, pop):
+    return np.asarray(lat, dtype=np.float64), np.asarray(lng, dtype=np.float64), np.asarray(pop)
+
+
+def block_rows_for(n, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Number of source rows per block so that one block (plus the temporaries of the
+    haversine computation) stays within max_bytes.
+    """
+    # about 8 float64 temporaries of shape (rows, n) are alive at the peak
+    return int(max(1, min(n, max_bytes // (8 * 8 * max(n, 1)))))
+
+
+def iter_similarity_blocks(lat, lng, pop, r=1e5, alpha=0.1, beta=0.1, exact=True,
+                           max_bytes=DEFAULT_MAX_BYTES, block_rows=None):
+    """
+    Yields (start, stop, weights) where weights[i - start, j] is the gravity-law weight
+    from location i to location j, for consecutive row blocks of the full matrix.
+    """
+    lat, lng, pop = _as_arrays(lat, lng, pop)
+    n = lat.shape[0]
+    if block_rows is None:
+        block_rows = block_rows_for(n, max_bytes)
+
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        weights = gravity_weights(lat[start:stop, None], lng[start:stop, None], pop[start:stop, None],
+                                  lat[None, :], lng[None, :], pop[None, :],
+                                  r=r, alpha=alpha, beta=beta, exact=exact)
+        yield start, stop, weights
+
+
+def similarity_matrix(lat, lng, pop, r=1e5, alpha=0.1, beta=0.1, exact=True,
+                      max_bytes=DEFAULT_MAX_BYTES, dtype=np.float64):
+    """
+    Dense (n, n) gravity-law similarity matrix, row i holding the weights from location i.
+    Only the output is n x n; the computation itself runs in row blocks bounded by max_bytes.
+    """
+    lat, lng, pop = _as_arrays(lat, lng, pop)
+    n = lat.shape[0]
+    out = np.empty((n, n), dtype=dtype)
+    for start, stop, weights in iter_similarity_blocks(lat, lng, pop, r, alpha, beta, exact, max_bytes):
+        out[start:stop] = weights
+    return out
+
+
+def sparse_similarity_matrix(lat, lng, pop, min_weight, r=1e5, alpha=0.1, beta=0.1, exact=True,
+                             max_bytes=DEFAULT_MAX_BYTES):
+    """
+    scipy.sparse CSR matrix keeping only the weights strictly above min_weight, built block
+    by block so the dense matrix is never held in memory.
+    """
+    from scipy import sparse
+
+    lat, lng, pop = _as_arrays(lat, lng, pop)
+    n = lat.shape[0]
+    rows, cols, vals = [], [], []
+    for start, stop, weights in iter_similarity_blocks(lat, lng, pop, r, alpha, beta, exact, max_bytes):
+        r_idx, c_idx = np.nonzero(weights > min_weight)
+        rows.append(r_idx + start)
+        cols.append(c_idx)
+        vals.append(weights[r_idx, c_idx])
+    return sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n))
+
+
+def similarity_from_table(table, r=1e5, alpha=0.1, beta=0.1, exact=True, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Dense similarity matrix for a table from node_static_table.
+    """
+    return similarity_matrix(table['Latitude'].values, table['Longitude'].values, table['Population'].values,
+                             r=r, alpha=alpha, beta=beta, exact=exact, max_bytes=max_bytes)
@@ -0,0 +1,27 @@
+import torch
+import torch.nn as nn
+from torch.utils.data import TensorDataset
+
+from checkpoint import CheckpointManager
+from windows import make_loader
+
+
+def _order(loader):
+    return [batch[0].tolist() for batch in loader]
+
+
+def test_resume_restores_loader_order(tmp_path):
+    model = nn.Linear(2, 1)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    dataset = TensorDataset(torch.arange(20))
+
+    loader = make_loader(dataset, 4, seed=0)
+    _order(loader)
+    with CheckpointManager(str(tmp_path), background=False) as checkpoints:
+        checkpoints.save(0, model, optimizer, loader=loader)
+    expected = _order(loader)
+
+    # a fresh run draws another seed, resume puts the generator back where epoch 0 left it
+    resumed = make_loader(dataset, 4, seed=1)
+    CheckpointManager(str(tmp_path), background=False).resume(model, optimizer, loader=resumed)
+    assert _order(resumed) == expected
@@ -0,0 +1,42 @@
+import torch
+import torch.nn as nn
+
+from benchmarks.synthetic import node_table
+from distributed import region_shard
+from graph_builder import build_graph
+from models import GNN, initialise_weights
+from training import forecast_loss
+
+
+def test_region_shards_weight_to_the_global_mean():
+    torch.manual_seed(0)
+    per_region = torch.rand(52)
+    for world_size in [1, 3, 4, 5]:
+        shards = [region_shard(52, rank, world_size) for rank in range(world_size)]
+        assert sorted(torch.cat([regions for regions, _ in shards]).tolist()) == list(range(52))
+        # DDP averages the ranks' (scaled) losses' gradients
+        averaged = sum(scale * per_region[regions].mean() for regions, scale in shards) / world_size
+        torch.testing.assert_close(averaged, per_region.mean())
+
+
+def test_sharded_gradient_matches_single_process():
+    g = build_graph(node_table(7), threshold=17)
+    torch.manual_seed(0)
+    model = GNN(g, 5, 8, 8, 8, 1, 4, torch.device('cpu'), readout='node')
+    model.apply(initialise_weights)
+    x, cI, I = torch.randn(7, 6, 5), torch.rand(7, 6), torch.rand(7, 6) * 100
+    N, yI = torch.full((7,), 1e6), torch.randn(7, 6, 4)
+    dInf_mean, dInf_std = torch.zeros(7, 1, 1), torch.ones(7, 1, 1)
+
+    def gradients(regions, scale=1.0):
+        model.zero_grad()
+        loss = forecast_loss(model, x, cI, N, I, yI, dInf_mean, dInf_std, regions, nn.MSELoss(),
+                             h=torch.zeros(len(regions), 8))[0]
+        (loss * scale).backward()
+        return [param.grad.clone() for param in model.parameters()]
+
+    expected = gradients(torch.arange(7))
+    # 7 regions on 3 ranks: shards of 3, 2 and 2, their gradients averaged as DDP does
+    ranks = [gradients(*region_shard(7, rank, 3)) for rank in range(3)]
+    for want, *got in zip(expected, *ranks):
+        torch.testing.assert_close(sum(got) / 3, want)
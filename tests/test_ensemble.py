@@ -0,0 +1,43 @@
+import pytest
+import torch
+
+from benchmarks.synthetic import node_table
+from ensemble import GNNEnsemble
+from graph_builder import build_graph
+from models import GNN, initialise_weights
+
+DEVICE = torch.device('cpu')
+
+
+def _members(g, sizes, seeds):
+    members = []
+    for seed in seeds:
+        torch.manual_seed(seed)
+        member = GNN(g, *sizes, DEVICE, readout='node')
+        member.apply(initialise_weights)
+        members.append(member)
+    return members
+
+
+def test_members_match_their_own_forward():
+    g = build_graph(node_table(12), threshold=17)
+    sizes = (5, 8, 8, 8, 2, 4)
+    ensemble = GNNEnsemble(g, *sizes, DEVICE, members=_members(g, sizes, [0, 1, 2]))
+    generator = torch.Generator().manual_seed(0)
+    dynamic = torch.randn(12, 3, 5, generator=generator)
+    cI, I = torch.rand(12, 3, generator=generator), torch.rand(12, 3, generator=generator) * 100
+    N = torch.full((12, 1), 1e6)
+    h = torch.randn(3, 12, 8, generator=generator)
+
+    new_I, phy_I, h_out = ensemble(dynamic, cI, N, I, h=h)
+    for k, member in enumerate(ensemble.members):
+        expected = member(dynamic, cI, N, I, h=h[k])
+        for got, want in zip((new_I[k], phy_I[k], h_out[k]), expected):
+            torch.testing.assert_close(got, want, rtol=1e-5, atol=1e-5)
+
+
+def test_mixed_sizes_rejected():
+    g = build_graph(node_table(12), threshold=17)
+    members = _members(g, (5, 8, 8, 8, 2, 4), [0]) + _members(g, (5, 8, 8, 16, 2, 4), [1])
+    with pytest.raises(ValueError, match='member 1 has gru'):
+        GNNEnsemble(g, 5, 8, 8, 8, 2, 4, DEVICE, members=members)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import torch
+
+from benchmarks.synthetic import node_table
+from export import StaticGNN, check_export, example_inputs, export
+from graph_builder import build_graph
+from models import GNN, initialise_weights
+from runtime import ExportedForecaster
+
+
+def _model(readout, num_heads):
+    g = build_graph(node_table(20), threshold=17)
+    torch.manual_seed(0)
+    model = GNN(g, 5, 8, 8, 8, num_heads, 4, torch.device('cpu'), readout=readout)
+    model.apply(initialise_weights)
+    return model
+
+
+@pytest.mark.parametrize('readout', ['node', 'global'])
+@pytest.mark.parametrize('num_heads', [1, 3])
+def test_static_matches_forward(readout, num_heads):
+    model = _model(readout, num_heads)
+    # raises if StaticGNN differs from GNN.forward
+    check_export(model, StaticGNN(model))
+
+
+@pytest.mark.parametrize('format', ['torchscript', 'onnx'])
+@pytest.mark.parametrize('readout', ['node', 'global'])
+def test_exported_matches_forward(tmp_path, format, readout):
+    if format == 'onnx':
+        pytest.importorskip('onnxruntime')
+    model = _model(readout, 2)
+    output = str(tmp_path / 'forecaster')
+    export(model, output, format)
+
+    forecaster = ExportedForecaster(output + '.json')
+    assert forecaster.meta['readout'] == readout
+    check_export(model, StaticGNN(model), exported=forecaster, atol=1e-5)
+    # a different number of windows than the export was traced with
+    dynamic, cI, N, I, h = (x.numpy() for x in example_inputs(StaticGNN(model), windows=5, seed=1))
+    assert forecaster(dynamic, cI, N, I, h)[0].shape == (cI.shape[0], 5, 4)
+
+
+def test_denormalise_global_region(tmp_path):
+    model = _model('global', 1)
+    normaliser = {'dInf': {'mean': np.arange(20.0)[:, None], 'std': np.full((20, 1), 2.0)}}
+    pred = np.ones((1, 3, 4), dtype=np.float32)
+
+    export(model, str(tmp_path / 'unknown'), normaliser=normaliser)
+    with pytest.raises(ValueError, match='one region'):
+        ExportedForecaster(str(tmp_path / 'unknown.json')).denormalise(pred)
+
+    export(model, str(tmp_path / 'texas'), normaliser=normaliser, region=7)
+    forecaster = ExportedForecaster(str(tmp_path / 'texas.json'))
+    expected = pred * (2.0 + 1e-5) + 7.0
+    np.testing.assert_allclose(forecaster.denormalise(pred), expected)
+    np.testing.assert_allclose(forecaster.denormalise(pred, regions=[7]), expected)
+    with pytest.raises(ValueError, match='region'):
+        export(_model('node', 1), str(tmp_path / 'node'), region=7)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import FEATURE_CHANNELS, STATIC_COLUMNS, assemble_features, check_dates_aligned
+
+
+@pytest.fixture
+def table():
+    rng = np.random.default_rng(0)
+    states, dates = ['Texas', 'Alaska', 'Ohio'], pd.date_range('2020-03-01', periods=8).strftime('%Y-%m-%d')
+    rows = [{'State': state, 'Date': date, **{column: float(i) for i, column in enumerate(STATIC_COLUMNS)},
+             **{channel: float(rng.integers(0, 1000)) for channel in FEATURE_CHANNELS}}
+            for state in states for date in dates]
+    # row order must not matter
+    return pd.DataFrame(rows).sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+def test_assemble_matches_per_state_filter(table):
+    states, dates, static, features, channels = assemble_features(table)
+    assert list(states) == list(table['State'].unique())
+    assert list(dates) == sorted(table['Date'].unique())
+    for i, state in enumerate(states):
+        # the per-state filtering the pivot replaced
+        rows = table[table['State'] == state].sort_values('Date')
+        np.testing.assert_array_equal(features[i, :, :len(FEATURE_CHANNELS)],
+                                      rows[FEATURE_CHANNELS].to_numpy(dtype=np.float32))
+        np.testing.assert_array_equal(static[i], rows[STATIC_COLUMNS].iloc[0].to_numpy(dtype=np.float64))
+
+    channel = {name: i for i, name in enumerate(channels)}
+    d_inf, d_rec, d_sus = (features[..., channel[name]] for name in ['dInf', 'dRec', 'dSus'])
+    np.testing.assert_array_equal(d_inf[:, 1:], np.diff(features[..., channel['Active_Cases']], axis=1))
+    np.testing.assert_array_equal(d_rec[:, 1:], np.diff(features[..., channel['Recovered_Cases']], axis=1))
+    np.testing.assert_array_equal(d_sus, -(d_inf + d_rec))
+    assert not features[:, 0, [channel['dInf'], channel['dRec'], channel['dSus']]].any()
+
+
+def test_misaligned_dates_rejected(table):
+    check_dates_aligned(table)
+    with pytest.raises(ValueError, match='Alaska'):
+        check_dates_aligned(table.drop(table.index[table['State'] == 'Alaska'][:1]))
+    duplicated = pd.concat([table, table[table['State'] == 'Ohio'].head(1)])
+    with pytest.raises(ValueError, match='Ohio'):
+        assemble_features(duplicated)
@@ -0,0 +1,28 @@
+import graph_builder
+from benchmarks.synthetic import node_table
+from graph_cache import GraphCache
+
+
+def _pairs(src, dst):
+    return sorted(zip(src.tolist(), dst.tolist()))
+
+
+def test_index_method_reaches_index_path(tmp_path, monkeypatch):
+    table = node_table(60)
+    dense = graph_builder.build_edges_from_table(table, threshold=17, min_connections=5, method='dense')
+
+    calls = []
+    index_edges = graph_builder._index_edges
+
+    def spy(*args, **kwargs):
+        calls.append(args)
+        return index_edges(*args, **kwargs)
+
+    monkeypatch.setattr(graph_builder, '_index_edges', spy)
+    cache = GraphCache(str(tmp_path))
+    src, dst = cache.edges(table, 17, 5, method='index')
+
+    assert len(calls) == 1
+    # the dense similarity matrix was never formed
+    assert cache.misses['similarity'] == 0 and cache.hits['similarity'] == 0
+    assert _pairs(src, dst) == _pairs(*dense)
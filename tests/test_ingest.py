@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+
+import ingest
+from benchmarks.synthetic import write_sources
+
+
+def test_warm_start_skips_hashing(tmp_path, monkeypatch):
+    paths = write_sources(str(tmp_path / 'sources'), 4, 60)
+    cache_dir = str(tmp_path / 'cache')
+    hashed = []
+    content_hash = ingest._content_hash
+    monkeypatch.setattr(ingest, '_content_hash', lambda *args: hashed.append(args) or content_hash(*args))
+
+    cold = ingest.load_dataset(*paths, cache_dir=cache_dir)
+    warm = ingest.load_dataset(*paths, cache_dir=cache_dir)
+    assert len(hashed) == 1
+    for name in cold:
+        np.testing.assert_array_equal(warm[name], cold[name])
+
+    # a changed file is read again and misses the old cache entry
+    with open(paths[0], 'a') as f:
+        f.write('\n')
+    stat = os.stat(paths[0])
+    os.utime(paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    ingest.load_dataset(*paths, cache_dir=cache_dir)
+    assert len(hashed) == 2
+    assert len([name for name in os.listdir(cache_dir) if name.endswith('.npz')]) == 2
@@ -0,0 +1,33 @@
+import pytest
+import torch
+
+from benchmarks.synthetic import node_table
+from graph_builder import build_graph
+from models import GNN
+from serve import model_from_checkpoint
+from training import save_checkpoint
+
+
+@pytest.fixture
+def global_checkpoint(tmp_path):
+    g = build_graph(node_table(12), threshold=17)
+    model = GNN(g, 5, 8, 8, 8, 1, 4, torch.device('cpu'), readout='global')
+    path = str(tmp_path / 'model.pth')
+    save_checkpoint(path, model, torch.optim.Adam(model.parameters()))
+    return g, path
+
+
+def test_readout_from_checkpoint(global_checkpoint):
+    g, path = global_checkpoint
+    assert model_from_checkpoint(path, g, torch.device('cpu')).readout == 'global'
+    with pytest.raises(ValueError, match='readout'):
+        model_from_checkpoint(path, g, torch.device('cpu'), readout='node')
+
+
+def test_readout_of_old_checkpoint(global_checkpoint):
+    g, path = global_checkpoint
+    bundle = torch.load(path)
+    del bundle['readout']
+    torch.save(bundle, path)
+    assert model_from_checkpoint(path, g, torch.device('cpu')).readout == 'node'
+    assert model_from_checkpoint(path, g, torch.device('cpu'), readout='global').readout == 'global'
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import node_table
+from haversine import haversine
+
+from similarity import gravity_law, gravity_weights, haversine_km, similarity_from_table, sparse_similarity_matrix
+
+
+def _loop_similarity(table):
+    """the pairwise gravity_law loop the vectorised matrix replaced, with the baseline's scalar types"""
+    # per-column .values[i] as the baseline read them: numpy float64 coordinates, int64 populations
+    lat, lng, pop = (table[column].values for column in ['Latitude', 'Longitude', 'Population'])
+    n = len(table)
+    return np.array([[gravity_law(lat[i], lng[i], pop[i], lat[j], lng[j], pop[j]) for j in range(n)]
+                     for i in range(n)])
+
+
+def test_distances_match_haversine():
+    table = node_table(30)
+    lat, lng = table['Latitude'].values, table['Longitude'].values
+    expected = np.array([[haversine((lat1, lng1), (lat2, lng2), 'km') for lat2, lng2 in zip(lat, lng)]
+                         for lat1, lng1 in zip(lat, lng)])
+    np.testing.assert_array_equal(haversine_km(lat[:, None], lng[:, None], lat[None], lng[None]), expected)
+    np.testing.assert_allclose(haversine_km(lat[:, None], lng[:, None], lat[None], lng[None], exact=False), expected,
+                               rtol=1e-12)
+
+
+def test_similarity_matches_gravity_law():
+    table = node_table(52)
+    assert table['Population'].dtype == np.int64
+    expected = _loop_similarity(table)
+    np.testing.assert_array_equal(similarity_from_table(table), expected)
+    np.testing.assert_array_equal(similarity_from_table(table, max_bytes=1), expected)
+    # numpy's arcsin may be an ulp off math.asin
+    np.testing.assert_allclose(similarity_from_table(table, exact=False), expected, rtol=1e-12)
+
+
+def test_sparse_matches_dense():
+    table = node_table(30)
+    dense = similarity_from_table(table)
+    lat, lng, pop = (table[column].values for column in ['Latitude', 'Longitude', 'Population'])
+    sparse = sparse_similarity_matrix(lat, lng, pop, min_weight=17, max_bytes=1).toarray()
+    np.testing.assert_array_equal(sparse, np.where(dense > 17, dense, 0))
+
+
+def test_scalar_inputs():
+    lat1, lng1, lat2, lng2 = np.float64(34.05), np.float64(-118.24), np.float64(40.71), np.float64(-74.01)
+    pop1, pop2 = np.int64(3900000), np.int64(8300000)
+    expected = gravity_law(lat1, lng1, pop1, lat2, lng2, pop2)
+    weight = gravity_weights(lat1, lng1, pop1, lat2, lng2, pop2)
+    assert np.ndim(weight) == 0 and weight == expected
+    assert gravity_weights(lat1, lng1, pop1, lat2, lng2, pop2, exact=False) == pytest.approx(expected, rel=1e-12)
+    # plain Python floats too
+    assert np.ndim(haversine_km(34.05, -118.24, 40.71, -74.01)) == 0
+    assert haversine_km(34.05, -118.24, 40.71, -74.01) == haversine((34.05, -118.24), (40.71, -74.01), 'km')
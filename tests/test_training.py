@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+import torch
+import torch.nn as nn
+
+from benchmarks.synthetic import node_table
+from graph_builder import build_graph
+from models import GNN, initialise_weights
+from training import (EarlyStopping, RingBuffer, forecast, normalise_phy, region_targets, tbptt_epoch,
+                      validation_loss)
+
+DEVICE = torch.device('cpu')
+
+
+@pytest.fixture(scope='module')
+def g():
+    return build_graph(node_table(12), threshold=17)
+
+
+def _model(g, readout):
+    torch.manual_seed(0)
+    model = GNN(g, 5, 8, 8, 8, 2, 4, DEVICE, readout=readout)
+    model.apply(initialise_weights)
+    return model
+
+
+def _inputs(windows=6):
+    generator = torch.Generator().manual_seed(0)
+    x = torch.randn(12, windows, 5, generator=generator)
+    cI, I = torch.rand(12, windows, generator=generator), torch.rand(12, windows, generator=generator) * 100
+    N = torch.full((12,), 1e6)
+    yI = torch.randn(12, windows, 4, generator=generator)
+    return x, cI, N, I, yI
+
+
+def test_readout_shapes(g):
+    x, cI, N, I, yI = _inputs()
+    regions = torch.tensor([1, 4, 7])
+    node, phy, h = forecast(_model(g, 'node'), x, cI, N, I, regions, h=torch.zeros(3, 8))
+    assert node.shape == phy.shape == region_targets(_model(g, 'node'), regions, yI).shape == (3, 6, 4)
+    assert h.shape == (3, 8)
+
+    single = torch.tensor([4])
+    glob, phy, h = forecast(_model(g, 'global'), x, cI, N, I, single, h=torch.zeros(1, 8))
+    assert glob.shape == phy.shape == (1, 6, 4) and h.shape == (1, 8)
+    with pytest.raises(ValueError, match='one region'):
+        forecast(_model(g, 'global'), x, cI, N, I, regions)
+
+
+def test_node_regions_are_independent_rows(g):
+    # each region's forecast is the same whether it runs alone or with others
+    x, cI, N, I, _ = _inputs()
+    model = _model(g, 'node')
+    regions = torch.tensor([1, 4, 7])
+    together = forecast(model, x, cI, N, I, regions, h=torch.zeros(3, 8))[0]
+    for row, region in enumerate(regions):
+        alone = forecast(model, x, cI, N, I, region.view(1), h=torch.zeros(1, 8))[0]
+        torch.testing.assert_close(alone[0], together[row])
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(4)
+    assert buffer.values().shape == (0,)
+    buffer.push(np.arange(3))
+    np.testing.assert_array_equal(buffer.values(), [0, 1, 2])
+    buffer.push(np.arange(3, 9))
+    np.testing.assert_array_equal(buffer.values(), [5, 6, 7, 8])
+
+    sampled = RingBuffer(3, sample=2)
+    for start in range(0, 10, 3):
+        sampled.push(np.arange(start, min(start + 3, 10)))
+    # every second row across pushes, the last three of them
+    np.testing.assert_array_equal(sampled.values(), [4, 6, 8])
+
+
+def test_tbptt_carries_state_across_chunks(g):
+    x, cI, N, I, yI = _inputs(windows=10)
+    model = _model(g, 'node')
+    regions = torch.arange(12)
+    chunks = [{'x': x[:, s], 'cI': cI[:, s], 'I': I[:, s], 'yI': yI[:, s]}
+              for s in (slice(0, 4), slice(4, 8), slice(8, 10))]
+    steps = []
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.0)
+    optimizer.register_step_post_hook(lambda *args: steps.append(1))
+    alphas = RingBuffer(100)
+    dInf_mean, dInf_std = torch.zeros(12, 1, 1), torch.ones(12, 1, 1)
+
+    h0 = torch.zeros(12, 8)
+    _, _, h = tbptt_epoch(model, optimizer, chunks, N, dInf_mean, dInf_std, regions, nn.MSELoss(), h=h0,
+                          alpha_buffer=alphas)
+    # one update per chunk, h detached between them, and (with lr=0) the state of one pass
+    # over the whole timeline
+    assert len(steps) == 3 and not h.requires_grad
+    assert alphas.values().shape == (10, 12)
+    with torch.no_grad():
+        _, _, h_full = forecast(model, x, cI, N, I, regions, h=h0)
+    torch.testing.assert_close(h, h_full)
+
+
+def test_early_stopping_patience():
+    stopping = EarlyStopping(patience=3, min_delta=0.5)
+    assert [stopping.step(metric) for metric in [10, 9, 8.8, 8.7, 8.6]] == [False, False, False, False, True]
+    assert stopping.best == 9
+
+    resumed = EarlyStopping(patience=3, min_delta=0.5)
+    resumed.load_state_dict({'best': 9.0, 'bad_steps': 2})
+    assert not resumed.step(8) and resumed.bad_steps == 0
+
+    rising = EarlyStopping(patience=2, mode='max')
+    assert [rising.step(metric) for metric in [1, 2, 2, 1]] == [False, False, False, True]
+    with pytest.raises(ValueError):
+        EarlyStopping(mode='median')
+
+
+def test_validation_loss_scores_physics_only(g):
+    x, cI, N, I, yI = _inputs()
+    model = _model(g, 'node')
+    model.train()
+    regions = torch.arange(12)
+    dInf_mean, dInf_std = torch.rand(12, 1, 1), torch.rand(12, 1, 1) + 0.5
+    criterion = nn.MSELoss()
+
+    head_calls = []
+    hook = model.nn_res_I.register_forward_hook(lambda *args: head_calls.append(1))
+    torch.manual_seed(1)
+    loss, phy_active = validation_loss(model, x, cI, N, I, yI, dInf_mean, dInf_std, regions, criterion)
+    hook.remove()
+    assert not head_calls and not model.training and not loss.requires_grad
+    torch.manual_seed(1)
+    with torch.no_grad():
+        # the initial GRU state is drawn the same way, so the full forward is comparable
+        active_pred, full_phy, _ = forecast(model, x, cI, N, I, regions)
+    assert active_pred is not None
+    expected = normalise_phy(full_phy, regions, dInf_mean, dInf_std)
+    torch.testing.assert_close(phy_active, expected)
+    torch.testing.assert_close(loss, criterion(expected, yI))
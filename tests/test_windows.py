@@ -0,0 +1,93 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+import torch
+
+from benchmarks.bench_windows import list_prep_data
+from windows import WindowDataset, make_loader, prep_data, window_starts
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    return rng.random((6, 60, 3)), rng.random((6, 60)) * 1e3
+
+
+def _window(features, sum_I, start, history_window, pred_window):
+    """one window cut by hand, as the baseline's loop body did"""
+    last = start + history_window - 1
+    return {'x': features[:, start:start + history_window].reshape(features.shape[0], -1),
+            'cI': features[:, last, 0], 'I': sum_I[:, last],
+            'yI': features[:, last + 1:last + 1 + pred_window, 0]}
+
+
+@pytest.mark.parametrize('chunk_step', [None, 3])
+def test_window_dataset_chunks(data, chunk_step):
+    features, sum_I = data
+    dataset = WindowDataset(features, sum_I, 5, 10, 2, seq_len=8, chunk_step=chunk_step)
+    starts = window_starts(60, 5, 10, 2)
+    step = chunk_step or 8
+    assert len(dataset) == (len(starts) - 8) // step + 1
+    for k in range(len(dataset)):
+        item = dataset[k]
+        for j, start in enumerate(starts[k * step:k * step + 8]):
+            for name, want in _window(features, sum_I, start, 5, 10).items():
+                np.testing.assert_allclose(item[name][:, j].numpy(), want.astype(np.float32))
+    with pytest.raises(IndexError):
+        dataset[len(dataset)]
+
+
+def test_loader_batches(data):
+    features, sum_I = data
+    dataset = WindowDataset(features, sum_I, 5, 10, 1, seq_len=8)
+    loader = make_loader(dataset, 2, seed=0)
+    batches = list(loader)
+    assert sum(len(batch['x']) for batch in batches) == len(dataset)
+    assert batches[0]['x'].shape == (2, 6, 8, 15) and batches[0]['yI'].shape == (2, 6, 8, 10)
+    # the order is a function of the seed
+    again = [batch['x'] for batch in make_loader(dataset, 2, seed=0)]
+    assert all(torch.equal(a['x'], b) for a, b in zip(batches, again))
+
+
+@pytest.mark.parametrize('history_window, pred_window, slide_step', [(5, 10, 1), (5, 15, 5), (7, 3, 4)])
+def test_prep_data_matches_loop(data, history_window, pred_window, slide_step):
+    features, sum_I = data
+    # the reference prints the shapes it builds, prep_data prints nothing
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = list_prep_data(features, sum_I, history_window, pred_window, slide_step)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        got = prep_data(features, sum_I, history_window, pred_window, slide_step)
+    assert out.getvalue() == ''
+    for have, want in zip(got, expected):
+        assert have.dtype == np.float32
+        np.testing.assert_array_equal(have, want)
+
+
+def test_window_dataset_matches_prep_data(data):
+    features, sum_I = data
+    x, last_I, concat_I, y_I = prep_data(features, sum_I, 5, 10, 1)
+    dataset = WindowDataset(features, sum_I, 5, 10, 1, seq_len=8)
+    for k in range(len(dataset)):
+        item, window = dataset[k], slice(8 * k, 8 * k + 8)
+        for name, want in [('x', x), ('I', last_I), ('cI', concat_I), ('yI', y_I)]:
+            np.testing.assert_array_equal(item[name].numpy(), want[:, window])
+
+
+def test_prep_data_without_windows(data):
+    features, sum_I = data
+    x, last_I, concat_I, y_I = prep_data(features[:, :10], sum_I[:, :10], 5, 10, 1)
+    assert x.shape == (6, 0, 15) and y_I.shape == (6, 0, 10) and last_I.shape == concat_I.shape == (6, 0)
+
+
+def test_window_dataset_keeps_last_chunk(data):
+    features, sum_I = data
+    x = prep_data(features, sum_I, 5, 10, 1)[0]
+    dropped = WindowDataset(features, sum_I, 5, 10, 1, seq_len=8)
+    kept = WindowDataset(features, sum_I, 5, 10, 1, seq_len=8, drop_last=False)
+    assert x.shape[1] % 8 and len(kept) == len(dropped) + 1
+    assert kept[-1]['x'].shape[1] == x.shape[1] % 8
+    # in order the chunks are the whole timeline, for truncated BPTT
+    np.testing.assert_array_equal(np.concatenate([kept[k]['x'].numpy() for k in range(len(kept))], axis=1), x)
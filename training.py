@@ -0,0 +1,220 @@
+"""Loss and metric helpers shared by the training entry points."""
+
+import numpy as np
+import torch
+
+
+def _module(model):
+    # DistributedDataParallel wraps the GNN, its attributes are on .module
+    return getattr(model, 'module', model)
+
+
+def _region_index(model, regions):
+    if _module(model).readout == 'global':
+        if len(regions) != 1:
+            raise ValueError("readout='global' forecasts one region at a time")
+        return int(regions[0])
+    return regions
+
+
+def region_inputs(model, regions, cI, N, I, batched=False):
+    """
+    cI / N / I as GNN.forward expects them for the given region indices: the single region's
+    rows for readout='global', the stacked rows of every region for readout='node'.
+    With batched=True, cI and I carry a leading batch dim (as from a WindowDataset loader).
+    """
+    index = _region_index(model, regions)
+    if batched:
+        return cI[:, index], N[index], I[:, index]
+    return cI[index], N[index], I[index]
+
+
+def region_targets(model, regions, yI, batched=False):
+    """
+    yI rows matching the forecast shapes: (num_regions, ...) unbatched, (batch, ...) for a
+    batched global readout and (batch, num_regions, ...) for a batched node readout.
+    """
+    if batched:
+        return yI[:, _region_index(model, regions)]
+    return yI[regions]
+
+
+def forecast(model, x, cI, N, I, regions, h=None, physics_only=False):
+    """
+    Forward pass for the given regions, returns (active_pred, phy_active, h) each with one
+    row per region. x may be batched, (batch, n_loc, windows, n_feat). model may be wrapped
+    in DistributedDataParallel. physics_only=True leaves active_pred None (GNN models only).
+    """
+    batched = x.dim() == 4
+    cI_r, N_r, I_r = region_inputs(model, regions, cI, N, I, batched)
+    kwargs = {'physics_only': True} if physics_only else {}
+    if _module(model).readout == 'global':
+        return model(x, cI_r, N_r, I_r, h=h, **kwargs)
+    return model(x, cI_r, N_r, I_r, h=h, regions=regions, **kwargs)
+
+
+def normalise_phy(phy_active, regions, dInf_mean, dInf_std):
+    """
+    Puts the physics branch (raw daily new infections) on each region's own normalised dInf scale.
+    """
+    return (phy_active - dInf_mean[regions]) / dInf_std[regions]
+
+
+def denormalise(pred, regions, dInf_mean, dInf_std):
+    """
+    Inverse of normalize_feature for forecasts on the normalised dInf scale: daily new infections.
+    """
+    return pred * (dInf_std[regions] + 1e-5) + dInf_mean[regions]
+
+
+def forecast_loss(model, x, cI, N, I, yI, dInf_mean, dInf_std, regions, criterion, phy_weight=0.1, h=None):
+    """
+    Training loss summed over both branches for all regions at once.
+    Returns (loss, active_pred, phy_active, h) with phy_active already normalised.
+    """
+    active_pred, phy_active, h = forecast(model, x, cI, N, I, regions, h=h)
+    phy_active = normalise_phy(phy_active, regions, dInf_mean, dInf_std)
+    target = region_targets(model, regions, yI, x.dim() == 4)
+
+    loss = criterion(active_pred, target) + phy_weight * criterion(phy_active, target)
+    return loss, active_pred, phy_active, h
+
+
+def validation_loss(model, x, cI, N, I, yI, dInf_mean, dInf_std, regions, criterion):
+    """
+    The validation score the training loops keep the best model on: criterion of the physics
+    branch alone, which is all that is computed (in eval mode, without autograd).
+    Returns (loss, phy_active) with phy_active normalised.
+    """
+    model.eval()
+    with torch.no_grad():
+        _, phy_active, _ = forecast(model, x, cI, N, I, regions, physics_only=True)
+        phy_active = normalise_phy(phy_active, regions, dInf_mean, dInf_std)
+        return criterion(phy_active, region_targets(model, regions, yI, x.dim() == 4)), phy_active
+
+
+def mae(pred, target):
+    return torch.mean(torch.abs(pred - target))
+
+
+class EarlyStopping:
+    """
+    Patience-based stopping on a validation metric: step(metric) returns True once `patience`
+    consecutive steps brought no improvement of more than min_delta over the best so far
+    (lower is better, or higher with mode='max').
+    """
+
+    def __init__(self, patience=10, min_delta=0.0, mode='min'):
+        if mode not in ('min', 'max'):
+            raise ValueError(f"unknown mode {mode!r}, expected 'min' or 'max'")
+        self.patience = patience
+        self.min_delta = min_delta
+        self.mode = mode
+        self.best = None
+        self.bad_steps = 0
+
+    def improved(self, metric):
+        if self.best is None:
+            return True
+        if self.mode == 'min':
+            return metric < self.best - self.min_delta
+        return metric > self.best + self.min_delta
+
+    def step(self, metric):
+        metric = float(metric)
+        if self.improved(metric):
+            self.best = metric
+            self.bad_steps = 0
+        else:
+            self.bad_steps += 1
+        return self.should_stop
+
+    @property
+    def should_stop(self):
+        return self.bad_steps >= self.patience
+
+    def state_dict(self):
+        return {'best': self.best, 'bad_steps': self.bad_steps}
+
+    def load_state_dict(self, state):
+        self.best = state['best']
+        self.bad_steps = state['bad_steps']
+
+
+class RingBuffer:
+    """
+    The last `capacity` rows pushed, for per-step diagnostics over arbitrarily long runs.
+    Every `sample`-th row is kept (counted across pushes), the rest are dropped.
+    """
+
+    def __init__(self, capacity, sample=1):
+        self.capacity = capacity
+        self.sample = sample
+        self.data = None
+        self.seen = 0
+        self.count = 0
+
+    def push(self, rows):
+        rows = np.asarray(rows)
+        keep = (self.seen + np.arange(len(rows))) % self.sample == 0
+        self.seen += len(rows)
+        rows = rows[keep][-self.capacity:]
+        if self.data is None:
+            self.data = np.zeros((self.capacity,) + rows.shape[1:], dtype=rows.dtype)
+        index = (self.count + np.arange(len(rows))) % self.capacity
+        self.data[index] = rows
+        self.count += len(rows)
+
+    def values(self):
+        """kept rows, oldest first"""
+        if self.data is None:
+            return np.zeros((0,))
+        if self.count <= self.capacity:
+            return self.data[:self.count]
+        return np.roll(self.data, -(self.count % self.capacity), axis=0)
+
+
+def tbptt_epoch(model, optimizer, chunks, N, dInf_mean, dInf_std, regions, criterion, phy_weight=0.1, h=None,
+                alpha_buffer=None):
+    """
+    One epoch of truncated backprop through time. chunks yields consecutive pieces of the
+    timeline in order (e.g. a WindowDataset with drop_last=False, unshuffled), each trained
+    with its own backward pass; the GRU state carries over detached, so activations only ever
+    span one chunk. alpha_buffer, a RingBuffer, receives the per-window alpha_scaled.
+    Returns (mean loss, mean MAE, h).
+    """
+    losses, maes = [], []
+    model.train()
+    for chunk in chunks:
+        optimizer.zero_grad()
+        loss, active_pred, _, h = forecast_loss(model, chunk['x'], chunk['cI'], N, chunk['I'], chunk['yI'],
+                                                dInf_mean, dInf_std, regions, criterion, phy_weight, h=h)
+        loss.backward()
+        optimizer.step()
+        h = h.detach()
+
+        if alpha_buffer is not None:
+            # (num_out, windows) -> one row per window
+            alpha_buffer.push(model.alpha_scaled.reshape(-1, chunk['x'].shape[1]).T.cpu().numpy())
+        losses.append(loss.item())
+        maes.append(mae(active_pred, region_targets(model, regions, chunk['yI'])).item())
+    return float(np.mean(losses)), float(np.mean(maes)), h
+
+
+def save_checkpoint(file_name, model, optimizer):
+    state = {
+        'state': model.state_dict(),
+        'optimizer': optimizer.state_dict(),
+        # not recoverable from the weights, serve.py and export.py rebuild the model with it
+        'readout': _module(model).readout,
+    }
+    torch.save(state, file_name)
+
+
+def load_checkpoint(file_name, model, optimizer=None, device=None):
+    """Restores a {'state', 'optimizer', 'readout'} checkpoint as written by the training loop."""
+    state = torch.load(file_name, map_location=device)
+    model.load_state_dict(state['state'])
+    if optimizer is not None:
+        optimizer.load_state_dict(state['optimizer'])
+    return model
@@ -0,0 +1,178 @@
+"""Optuna hyperparameter search over a process pool, with pruning and a resumable SQLite study.
+
+Run from the repository root after gnn_final.py has written the feature stream:
+
+    python tune.py --trials 40 --workers 4 --epochs 30
+    python tune.py --trials 20 --workers 4        # resumes the same study, 20 more trials
+
+The train / validation windows are built once by the parent and saved as .npy files that every
+worker memory-maps copy-on-write, so trials share one copy of the data. Graphs come from a
+GraphCache next to them, shared by all workers, so each graph is built once and a new
+threshold reuses the similarity matrix of its r / alpha / beta; the search space uses grids
+for those parameters to make repeats likely. Each epoch's validation loss goes to a MedianPruner.
+"""
+
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import optuna
+import pandas as pd
+import torch
+import torch.nn as nn
+
+from features import STATIC_COLUMNS
+from graph_cache import GraphCache
+from incremental import FeatureStream
+from models import GNN, initialise_weights
+from training import forecast_loss, validation_loss
+from windows import prep_data
+
+ARRAYS = ['train_x', 'train_I', 'train_cI', 'train_yI', 'val_x', 'val_I', 'val_cI', 'val_yI', 'dInf_mean', 'dInf_std', 'N']
+
+
+def prepare(stream_path, cache_dir, history_window=5, pred_window=10, slide_step=1, valid_window=25, test_window=25):
+    """
+    The train / validation windows of gnn_final.py for the stream, written to cache_dir as .npy.
+    """
+    stream = FeatureStream(stream_path)
+    dynamic_feat = stream.dynamic_feat()
+    active_cases = stream.features[..., stream.channel['Active_Cases']]
+
+    train = prep_data(dynamic_feat[:, :-valid_window-test_window], active_cases[:, :-valid_window-test_window],
+                      history_window, pred_window, slide_step)
+    val = prep_data(dynamic_feat[:, -valid_window-test_window:-test_window],
+                    active_cases[:, -valid_window-test_window:-test_window], history_window, pred_window, slide_step)
+
+    arrays = dict(zip(ARRAYS, train + val))
+    arrays['dInf_mean'] = stream.stats.mean.astype(np.float32).reshape(-1, 1, 1)
+    arrays['dInf_std'] = stream.stats.std.astype(np.float32).reshape(-1, 1, 1)
+    arrays['N'] = stream.static[:, :1].astype(np.float32)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(cache_dir, f'{name}.npy'), array)
+    table = pd.DataFrame(stream.static, columns=STATIC_COLUMNS)
+    table.insert(0, 'State', stream.states)
+    table.to_csv(os.path.join(cache_dir, 'nodes.csv'), index=False)
+
+
+def load_shared(cache_dir):
+    """the prepared arrays as tensors over copy-on-write memory maps, and the node table"""
+    tensors = {name: torch.from_numpy(np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='c'))
+               for name in ARRAYS}
+    return tensors, pd.read_csv(os.path.join(cache_dir, 'nodes.csv'))
+
+
+def suggest(trial):
+    return {
+        'hidden_dim1': trial.suggest_categorical('hidden_dim1', [16, 32, 64]),
+        'hidden_dim2': trial.suggest_categorical('hidden_dim2', [16, 32, 64]),
+        'gru_dim': trial.suggest_categorical('gru_dim', [16, 32, 64]),
+        'num_heads': trial.suggest_int('num_heads', 1, 4),
+        'lr': trial.suggest_float('lr', 1e-4, 1e-2, log=True),
+        'phy_weight': trial.suggest_float('phy_weight', 0.01, 1.0, log=True),
+        'threshold': trial.suggest_categorical('threshold', [5, 10, 17, 25, 40]),
+        'min_connections': trial.suggest_int('min_connections', 1, 10),
+        'r': trial.suggest_categorical('r', [1e4, 3e4, 1e5, 3e5, 1e6]),
+        'alpha': trial.suggest_float('alpha', 0.05, 0.5, step=0.05),
+        'beta': trial.suggest_float('beta', 0.05, 0.5, step=0.05),
+    }
+
+
+def objective(trial, cache_dir, epochs, seed):
+    params = suggest(trial)
+    data, table = load_shared(cache_dir)
+    g = GraphCache(os.path.join(cache_dir, 'graphs')).graph(
+        table, threshold=params['threshold'], min_connections=params['min_connections'], r=params['r'],
+        alpha=params['alpha'], beta=params['beta'])
+
+    torch.manual_seed(seed)
+    device = torch.device('cpu')
+    history_window = data['train_x'].shape[-1]
+    pred_window = data['train_yI'].shape[-1]
+    model = GNN(g, history_window, params['hidden_dim1'], params['hidden_dim2'], params['gru_dim'],
+                params['num_heads'], pred_window, device, readout='node')
+    model.apply(initialise_weights)
+    optimizer = torch.optim.Adam(model.parameters(), lr=params['lr'])
+    criterion = nn.MSELoss()
+    regions = torch.arange(len(table))
+
+    best = math.inf
+    for epoch in range(epochs):
+        model.train()
+        optimizer.zero_grad()
+        loss, _, _, _ = forecast_loss(model, data['train_x'], data['train_cI'], data['N'], data['train_I'],
+                                      data['train_yI'], data['dInf_mean'], data['dInf_std'], regions, criterion,
+                                      params['phy_weight'])
+        loss.backward()
+        optimizer.step()
+
+        # the validation loss gnn_final.py keeps the best model on: the physics branch only
+        val_loss = validation_loss(model, data['val_x'], data['val_cI'], data['N'], data['val_I'], data['val_yI'],
+                                   data['dInf_mean'], data['dInf_std'], regions, criterion)[0].item()
+
+        if not math.isfinite(val_loss):
+            raise optuna.TrialPruned(f'validation loss {val_loss} at epoch {epoch}')
+        best = min(best, val_loss)
+        trial.report(val_loss, epoch)
+        if trial.should_prune():
+            raise optuna.TrialPruned()
+    return best
+
+
+def make_pruner():
+    # the pruner is not stored with the study, every process builds the same one
+    return optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=5)
+
+
+def storage_for(url):
+    # several worker processes write the same SQLite file; wait for the lock instead of failing
+    return optuna.storages.RDBStorage(url, engine_kwargs={'connect_args': {'timeout': 60}})
+
+
+def worker(storage_url, study_name, cache_dir, n_trials, epochs, seed, threads):
+    torch.set_num_threads(threads)
+    study = optuna.load_study(study_name=study_name, storage=storage_for(storage_url),
+                              sampler=optuna.samplers.TPESampler(seed=seed), pruner=make_pruner())
+    study.optimize(lambda trial: objective(trial, cache_dir, epochs, seed), n_trials=n_trials)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stream', default='feature_stream')
+    parser.add_argument('--cache-dir', default='tune_cache')
+    parser.add_argument('--storage', default='sqlite:///tune.db')
+    parser.add_argument('--study', default='stan')
+    parser.add_argument('--trials', type=int, default=40, help='trials to add to the study')
+    parser.add_argument('--workers', type=int, default=max(1, min(4, os.cpu_count() or 1)))
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    prepare(args.stream, args.cache_dir)
+    study = optuna.create_study(study_name=args.study, storage=storage_for(args.storage), direction='minimize',
+                                pruner=make_pruner(),
+                                load_if_exists=True)
+    done = len(study.trials)
+    print(f'study {args.study}: {done} trials so far, adding {args.trials} on {args.workers} workers')
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    per_worker = [args.trials // args.workers + (k < args.trials % args.workers) for k in range(args.workers)]
+    with ProcessPoolExecutor(args.workers) as pool:
+        # each worker samples with its own seed, offset by the trials already run so resumes differ
+        futures = [pool.submit(worker, args.storage, args.study, args.cache_dir, n, args.epochs,
+                               args.seed + done + k, threads) for k, n in enumerate(per_worker) if n]
+        for future in futures:
+            future.result()
+
+    study = optuna.load_study(study_name=args.study, storage=storage_for(args.storage))
+    states = pd.Series([trial.state.name for trial in study.trials]).value_counts().to_dict()
+    print(f'{len(study.trials)} trials {states}')
+    print(f'best val loss {study.best_value:.4f} with {study.best_params}')
+
+
+if __name__ == '__main__':
+    main()
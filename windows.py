@@ -0,0 +1,145 @@
+"""Sliding-window datasets over the (n_loc, T, n_feat) feature tensor."""
+
+import random
+
+import numpy as np
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+from torch.utils.data import DataLoader, Dataset
+
+
+def window_starts(timestep, history_window, pred_window, slide_step):
+    """
+    First day of every window prep_data produces, with the same early-break conditions.
+    """
+    starts = []
+    for i in range(0, timestep, slide_step):
+        if i + history_window + pred_window - 1 >= timestep or i + history_window >= timestep:
+            break
+        starts.append(i)
+    return np.array(starts, dtype=np.int64)
+
+
+def prep_data(data, sum_I, history_window=5, pred_window=15, slide_step=5):
+    """
+    All sliding windows over data (n_loc, timestep, n_feat) and the matching sum_I.
+    Returns x (n_loc, windows, history_window * n_feat), last_I and concat_I (n_loc, windows)
+    and y_I (n_loc, windows, pred_window), all float32.
+
+    The windows are strided views of data, so each output costs a single copy into its
+    float32 buffer; no per-window lists or intermediate arrays.
+    """
+    n_loc, timestep, n_feat = data.shape
+    n_win = len(window_starts(timestep, history_window, pred_window, slide_step))
+    # window k starts on day k * slide_step
+    span = slice(0, (n_win - 1) * slide_step + 1, slide_step) if n_win else slice(0, 0)
+
+    x = np.empty((n_loc, n_win, history_window * n_feat), dtype=np.float32)
+    last_I = np.empty((n_loc, n_win), dtype=np.float32)
+    concat_I = np.empty((n_loc, n_win), dtype=np.float32)
+    y_I = np.empty((n_loc, n_win, pred_window), dtype=np.float32)
+
+    if n_win:
+        # (n_loc, start, n_feat, history_window) -> (n_loc, start, history_window, n_feat)
+        history = sliding_window_view(data, history_window, axis=1).swapaxes(2, 3)
+        x.reshape(n_loc, n_win, history_window, n_feat)[...] = history[:, span]
+
+        last_day = data[:, history_window - 1:, 0]
+        concat_I[...] = last_day[:, span]
+        last_I[...] = sum_I[:, history_window - 1:][:, span]
+
+        future = sliding_window_view(data[:, history_window:, 0], pred_window, axis=1)
+        y_I[...] = future[:, span]
+
+    return x, last_I, concat_I, y_I
+
+
+def history_windows(data, sum_I, history_window=5, slide_step=5, start=0):
+    """
+    Windows for forecasting past the end of data: every start from `start` (on the slide_step
+    grid) whose history fits, target days not needed. Returns x (n_loc, windows,
+    history_window * n_feat), last_I and concat_I (n_loc, windows), float32 like prep_data.
+    """
+    n_loc, timestep, n_feat = data.shape
+    starts = np.arange(start, timestep - history_window + 1, slide_step)
+    last = starts + history_window - 1
+
+    x = data[:, starts[:, None] + np.arange(history_window)]
+    x = x.reshape(n_loc, len(starts), history_window * n_feat).astype(np.float32)
+    return x, sum_I[:, last].astype(np.float32), data[:, last, 0].astype(np.float32)
+
+
+class WindowDataset(Dataset):
+    """
+    Chunks of seq_len consecutive sliding windows, cut from the feature array on access.
+
+    Item k covers windows [k * chunk_step, k * chunk_step + seq_len) and holds the same
+    tensors prep_data builds for those windows, with the window axis second:
+    x (n_loc, seq_len, history_window * n_feat), cI and I (n_loc, seq_len),
+    yI (n_loc, seq_len, pred_window). The model runs each chunk as its own GRU sequence.
+    With drop_last=False a last, shorter chunk covers the windows left over at the end.
+    """
+
+    def __init__(self, data, sum_I, history_window=5, pred_window=15, slide_step=5, seq_len=None, chunk_step=None,
+                 drop_last=True):
+        self.data = np.asarray(data, dtype=np.float32)
+        self.sum_I = np.asarray(sum_I, dtype=np.float32)
+        self.history_window = history_window
+        self.pred_window = pred_window
+
+        self.starts = window_starts(self.data.shape[1], history_window, pred_window, slide_step)
+        self.seq_len = len(self.starts) if seq_len is None else min(seq_len, len(self.starts))
+        self.chunk_step = self.seq_len if chunk_step is None else chunk_step
+        self.num_chunks = max(0, (len(self.starts) - self.seq_len) // self.chunk_step + 1) if self.seq_len else 0
+        if not drop_last and self.num_chunks and (self.num_chunks - 1) * self.chunk_step + self.seq_len < len(self.starts):
+            self.num_chunks += 1
+
+    def __len__(self):
+        return self.num_chunks
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.num_chunks
+        if not 0 <= idx < self.num_chunks:
+            raise IndexError(idx)
+        starts = self.starts[idx * self.chunk_step:idx * self.chunk_step + self.seq_len]
+        n_loc, _, n_feat = self.data.shape
+        last = starts + self.history_window - 1
+
+        x = self.data[:, starts[:, None] + np.arange(self.history_window)]
+        y_I = self.data[:, last[:, None] + 1 + np.arange(self.pred_window), 0]
+        return {
+            'x': torch.from_numpy(x.reshape(n_loc, len(starts), self.history_window * n_feat)),
+            'cI': torch.from_numpy(self.data[:, last, 0]),
+            'I': torch.from_numpy(self.sum_I[:, last]),
+            'yI': torch.from_numpy(y_I),
+        }
+
+
+def seed_worker(worker_id):
+    # DataLoader already seeds torch per worker; carry that into numpy and random too
+    worker_seed = torch.initial_seed() % 2 ** 32
+    np.random.seed(worker_seed)
+    random.seed(worker_seed)
+
+
+def make_loader(dataset, batch_size=8, shuffle=True, num_workers=0, pin_memory=None, prefetch_factor=2, seed=None):
+    """
+    DataLoader over a WindowDataset. The shuffling generator is seeded from numpy's global
+    RNG unless seed is given, so runs are reproducible under np.random.seed. pin_memory
+    defaults to on when CUDA is available, so batch_to_device can copy asynchronously.
+    """
+    if seed is None:
+        seed = int(np.random.randint(2 ** 31))
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+
+    kwargs = {}
+    if num_workers > 0:
+        kwargs = {'prefetch_factor': prefetch_factor, 'persistent_workers': True, 'worker_init_fn': seed_worker}
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers,
+                      pin_memory=pin_memory, generator=torch.Generator().manual_seed(seed), **kwargs)
+
+
+def batch_to_device(batch, device):
+    return {key: value.to(device, non_blocking=True) for key, value in batch.items()}